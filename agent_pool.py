@@ -0,0 +1,130 @@
+"""
+Agent 执行器池
+
+功能：
+- 按 (模型, 温度, 记忆后端) 缓存 AgentExecutor：服务端处理请求时从池中取出执行器，
+  用完归还，不再为每个请求重新创建 LLM、工具、Prompt 与 ReAct Agent。
+- 同一个执行器同时只被一个请求使用；每个键最多保留 max_idle 个空闲执行器，
+  键的数量超过 max_keys 时淘汰最久未使用的键。
+- 请求结束时检查执行器的 memory、callbacks、tags、metadata 等字段，被请求修改过的执行器
+  直接丢弃而不归还，下一个请求不会继承上一个请求留下的状态。
+- 池的大小与复用次数导出到统一的指标（后端名为 "agent_pool"）。
+
+具体的执行器由 chain_factory 创建，请求通过 chain_factory.agent_session() 使用本池。
+"""
+import copy
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+# (模型, 温度, 记忆后端)；执行器与用户无关，用户由请求的 memory_manager.user_context() 决定
+PoolKey = Tuple[str, float, str]
+
+# 请求可能修改、且不应带到下一个请求的执行器字段
+_REQUEST_FIELDS = ("memory", "callbacks", "tags", "metadata", "verbose", "return_intermediate_steps")
+
+
+def _request_state(executor: Any) -> Dict[str, Any]:
+    # 列表与字典复制一份以发现原地修改，其他对象按身份比较
+    state = {}
+    for field in _REQUEST_FIELDS:
+        value = getattr(executor, field, None)
+        state[field] = copy.copy(value) if isinstance(value, (list, dict)) else value
+    return state
+
+
+class AgentPool:
+    """
+    AgentExecutor 池
+
+    Args:
+        build: 按键创建执行器的函数，池中没有空闲执行器时在请求线程中调用
+        max_idle: 每个键最多保留的空闲执行器数
+        max_keys: 最多保留的键数
+    """
+
+    def __init__(self, build: Callable[[PoolKey], Any], max_idle: int = 8, max_keys: int = 256):
+        self.build = build
+        self.max_idle = max_idle
+        self.max_keys = max_keys
+        self._idle: "OrderedDict[PoolKey, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    @contextmanager
+    def acquire(self, key: PoolKey):
+        """
+        取出一个执行器，with 块结束时归还
+
+        Args:
+            key: (模型, 温度, 记忆后端)
+
+        Yields:
+            AgentExecutor: 执行器，with 块内由当前请求独占
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            executor = idle.pop() if idle else None
+            if executor is not None:
+                self.reused += 1
+            self.in_use += 1
+        state = None
+        try:
+            if executor is None:
+                executor = self.build(key)
+                with self._lock:
+                    self.created += 1
+            state = _request_state(executor)
+            yield executor
+        finally:
+            clean = state is not None and _request_state(executor) == state
+            with self._lock:
+                self.in_use -= 1
+                if executor is not None:
+                    self._release(key, executor, clean)
+
+    def _release(self, key: PoolKey, executor: Any, clean: bool):
+        """归还执行器，调用方持有锁。"""
+        idle = self._idle.setdefault(key, [])
+        self._idle.move_to_end(key)
+        if clean and len(idle) < self.max_idle:
+            idle.append(executor)
+        else:
+            self.discarded += 1
+        while len(self._idle) > self.max_keys:
+            self._idle.popitem(last=False)
+
+    def clear(self):
+        """丢弃所有空闲执行器，例如记忆后端切换或配置变更之后。"""
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        返回池的统计
+
+        Returns:
+            Dict: keys、idle、in_use、created、reused、discarded
+        """
+        with self._lock:
+            return {
+                "keys": len(self._idle),
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "in_use": self.in_use,
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+            }
+
+    def gauges(self) -> Dict[str, float]:
+        stats = self.stats()
+        return {
+            "agent_pool_idle": stats["idle"],
+            "agent_pool_in_use": stats["in_use"],
+            "agent_pool_created_total": stats["created"],
+            "agent_pool_reused_total": stats["reused"],
+        }
@@ -0,0 +1,224 @@
+"""
+记忆后端健康检查模块
+
+功能：
+- 并发探测 Mem0、OpenMemory、SQLite 等记忆后端，一次选择中的所有探测共用一个总截止时间；
+  按优先级选择时，优先级最高的健康后端一经确定就返回，不等待优先级更低的探测。
+- 截止时仍未返回的探测记为不健康（“探测超时”），挂起的后端不会阻塞启动；
+  探测在守护线程中执行，同一后端同时只有一个探测。
+- 探测结果缓存 interval 秒；后台监控线程每 interval / 2 秒重新探测选择过的后端，
+  之后创建 Agent 时直接使用缓存的状态，不再重复探测。
+- 各后端是否健康导出到统一的指标（memory_<后端>_healthy，后端名为 "health"）。
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from memory_metrics import get_metrics
+
+# 探测函数：返回后端是否健康，可以抛出异常（视为不健康）
+HealthProbe = Callable[[], bool]
+
+
+class HealthMonitor:
+    """
+    记忆后端健康状态
+
+    Args:
+        probes: 后端名称 → 探测函数
+        interval: 探测结果的有效秒数，也决定后台监控的探测间隔；为 0 时每次选择都重新探测
+        deadline: 默认的总截止时间（秒）
+    """
+
+    def __init__(self, probes: Dict[str, HealthProbe], interval: float = 30.0, deadline: float = 5.0):
+        self.probes = dict(probes)
+        self.interval = interval
+        self.deadline = deadline
+        # 名称 → {"healthy", "checked_at", "latency", "error"}
+        self._status: Dict[str, Dict] = {}
+        # 名称 → 正在进行的探测的开始时间
+        self._probing: Dict[str, float] = {}
+        # 选择过的后端，由后台监控定期重新探测
+        self._watched: Dict[str, None] = {}
+        self._condition = threading.Condition()
+        self._monitor: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _probe(self, name: str):
+        start = time.monotonic()
+        healthy, error = False, None
+        try:
+            healthy = bool(self.probes[name]())
+        except Exception as e:
+            error = str(e)
+            logging.warning(f"{name} 健康检查失败: {e}")
+        now = time.monotonic()
+        with self._condition:
+            self._status[name] = {"healthy": healthy, "checked_at": now,
+                                  "latency": now - start, "error": error}
+            del self._probing[name]
+            self._condition.notify_all()
+
+    def _start_probes(self, names: Iterable[str], force: bool = False):
+        """为没有有效结果（force 时为全部）且不在探测中的后端启动探测，调用方持有锁。"""
+        now = time.monotonic()
+        for name in names:
+            if name in self._probing or (not force and self._current(name, now, now) is not None):
+                continue
+            self._probing[name] = now
+            threading.Thread(target=self._probe, args=(name,), name=f"health-probe-{name}",
+                             daemon=True).start()
+
+    def _current(self, name: str, since: float, now: float) -> Optional[bool]:
+        """since 之后或有效期内的探测结果，没有时返回 None，调用方持有锁。"""
+        status = self._status.get(name)
+        if status is None:
+            return None
+        if status["checked_at"] >= since or now - status["checked_at"] < self.interval:
+            return status["healthy"]
+        return None
+
+    def _resolve(self, names: List[str], deadline: Optional[float], first: bool) -> List[str]:
+        started = time.monotonic()
+        deadline_at = started + (self.deadline if deadline is None else deadline)
+        with self._condition:
+            self._watched.update(dict.fromkeys(names))
+            self._start_probes(names)
+            while True:
+                now = time.monotonic()
+                current = [self._current(name, started, now) for name in names]
+                if first:
+                    # 优先级更高的后端都已确定不健康时，第一个健康的后端即为结果
+                    for name, healthy in zip(names, current):
+                        if healthy is None:
+                            break
+                        if healthy:
+                            return [name]
+                    else:
+                        return []
+                elif None not in current:
+                    return [name for name, healthy in zip(names, current) if healthy]
+                if now >= deadline_at:
+                    for name, healthy in zip(names, current):
+                        if healthy is None:
+                            logging.warning(f"{name} 健康检查超过截止时间，视为不可用")
+                            self._status[name] = {"healthy": False, "checked_at": now,
+                                                  "latency": now - self._probing.get(name, started),
+                                                  "error": "探测超时"}
+                    continue
+                self._condition.wait(deadline_at - now)
+
+    def select(self, names: List[str], deadline: Optional[float] = None) -> Optional[str]:
+        """
+        按优先级选择第一个健康的后端
+
+        Args:
+            names: 按优先级排列的后端名称
+            deadline: 总截止时间（秒），默认取 self.deadline
+
+        Returns:
+            Optional[str]: 后端名称，都不健康时返回 None
+        """
+        selected = self._resolve(names, deadline, first=True)
+        return selected[0] if selected else None
+
+    def healthy(self, names: List[str], deadline: Optional[float] = None) -> List[str]:
+        """返回 names 中健康的后端（保持顺序），等待所有探测完成或截止时间到达。"""
+        return self._resolve(names, deadline, first=False)
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        返回各后端的健康状态
+
+        Returns:
+            Dict: {后端: {"healthy", "age"（距上次探测的秒数）, "latency", "error", "probing"}}，
+                尚未探测过的后端 healthy 为 None
+        """
+        with self._condition:
+            now = time.monotonic()
+            result = {}
+            for name in self.probes:
+                status = self._status.get(name)
+                result[name] = {
+                    "healthy": status["healthy"] if status else None,
+                    "age": now - status["checked_at"] if status else None,
+                    "latency": status["latency"] if status else None,
+                    "error": status["error"] if status else None,
+                    "probing": name in self._probing,
+                }
+            return result
+
+    def gauges(self) -> Dict[str, float]:
+        with self._condition:
+            return {f"{name}_healthy": int(status["healthy"]) for name, status in self._status.items()}
+
+    def start(self):
+        """启动后台监控线程，interval 为 0 或已启动时不做任何事。"""
+        if self.interval <= 0 or self._monitor is not None:
+            return
+        self._stopped.clear()
+        self._monitor = threading.Thread(target=self._run, name="memory-health-monitor", daemon=True)
+        self._monitor.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval / 2):
+            with self._condition:
+                self._start_probes(list(self._watched), force=True)
+
+    def stop(self):
+        """停止后台监控线程，不等待正在进行的探测。"""
+        self._stopped.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+
+
+def _probe_mem0() -> bool:
+    from mem0_tools import check_mem0_service
+    return check_mem0_service()
+
+
+def _probe_openmemory() -> bool:
+    from openmemory_tools import check_openmemory_service
+    return check_openmemory_service()
+
+
+def _probe_sqlite() -> bool:
+    from sqlite_tools import check_sqlite_service
+    return check_sqlite_service()
+
+
+# 按优先级排列的远程与 SQLite 后端的探测函数，在探测线程中才导入各后端模块
+BACKEND_PROBES: Dict[str, HealthProbe] = {
+    "mem0": _probe_mem0,
+    "openmemory": _probe_openmemory,
+    "sqlite": _probe_sqlite,
+}
+
+_health_monitor: Optional[HealthMonitor] = None
+_health_monitor_lock = threading.Lock()
+
+
+def get_health_monitor(config=None) -> HealthMonitor:
+    """
+    获取全局健康状态实例（单例模式），首次调用时启动后台监控线程并注册指标
+
+    Args:
+        config: LLMConfig，取 MEMORY_HEALTH_INTERVAL 与 MEMORY_PROBE_DEADLINE，默认为 LLMConfig
+
+    Returns:
+        HealthMonitor: 健康状态实例
+    """
+    global _health_monitor
+    if _health_monitor is None:
+        with _health_monitor_lock:
+            if _health_monitor is None:
+                if config is None:
+                    from llm_config import LLMConfig as config
+                monitor = HealthMonitor(BACKEND_PROBES, config.MEMORY_HEALTH_INTERVAL,
+                                        config.MEMORY_PROBE_DEADLINE)
+                monitor.start()
+                get_metrics().register_gauges("health", monitor.gauges)
+                _health_monitor = monitor
+    return _health_monitor
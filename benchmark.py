@@ -0,0 +1,1221 @@
+"""
+本地记忆性能基准脚本
+
+用法：
+    python benchmark.py vector [--size 1000000]
+    python benchmark.py ann [--size 1000000]
+    python benchmark.py concurrency [--size 8000]
+    python benchmark.py persistence [--size 1000000]
+    python benchmark.py sqlite [--size 1000000]
+    python benchmark.py dedup [--size 20000]
+    python benchmark.py eviction [--size 200000]
+    python benchmark.py records [--size 1000000]
+    python benchmark.py cache [--size 100000]
+    python benchmark.py metrics [--size 10000]
+    python benchmark.py openmemory_async [--size 2000]
+    python benchmark.py breaker [--size 1000]
+    python benchmark.py write_behind [--size 200]
+    python benchmark.py remote_cache [--size 200]
+    python benchmark.py federated [--size 20]
+    python benchmark.py mem0_ingest [--size 10]
+    python benchmark.py startup [--size 3]
+    python benchmark.py health [--size 100]
+    python benchmark.py agent_pool [--size 50]
+    python benchmark.py prefetch [--size 20]
+
+默认限制数值库只使用单个线程，以便结果可在单核上复现。
+"""
+import os
+
+# 必须在导入 numpy 之前设置
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def _percentile(samples: list, pct: float) -> float:
+    """返回样本的百分位数。"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _report(name: str, samples_ms: list):
+    """打印延迟统计。"""
+    print(f"{name}: p50={_percentile(samples_ms, 50):.2f}ms "
+          f"p95={_percentile(samples_ms, 95):.2f}ms "
+          f"max={max(samples_ms):.2f}ms ({len(samples_ms)} 次)")
+
+
+def benchmark_vector_search(size: int = 1_000_000, dim: int = 64, queries: int = 50, k: int = 10):
+    """
+    向量暴力检索基准
+
+    用随机单位向量填充 VectorStore 到指定规模（查询耗时与向量内容无关），
+    再用 HashingEmbedder 编码真实查询，测量矩阵-向量乘法加 argpartition 的延迟。
+    """
+    import numpy as np
+    from vector_index import HashingEmbedder, VectorStore
+
+    print(f"===== 向量检索基准：{size} 条记忆，维度 {dim} =====")
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim, initial_capacity=size)
+    start = time.perf_counter()
+    batch = 100_000
+    for offset in range(0, size, batch):
+        vectors = rng.standard_normal((min(batch, size - offset), dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.add(vectors)
+    print(f"填充耗时: {time.perf_counter() - start:.2f}s，"
+          f"矩阵大小: {store.vectors.nbytes / 1024 ** 2:.0f} MiB")
+
+    embedder = HashingEmbedder(dim=dim)
+    texts = ["我住在哪里", "我最喜欢的颜色是什么", "你知道我叫什么名字吗", "what do I like"]
+    samples = []
+    for i in range(queries):
+        query = embedder.embed_query(texts[i % len(texts)])
+        start = time.perf_counter()
+        store.search(query, k)
+        samples.append((time.perf_counter() - start) * 1000)
+    _report("暴力检索", samples)
+
+
+def benchmark_ann_search(size: int = 1_000_000, dim: int = 64, queries: int = 200, k: int = 10,
+                         n_clusters: int = 2000):
+    """
+    IVF 近似检索与精确检索对比
+
+    数据由带噪声的高斯簇生成（更接近真实嵌入的聚簇结构），查询取自数据点的扰动。
+    对不同 n_probe 报告 recall@k 与延迟。
+    """
+    import numpy as np
+    from vector_index import VectorStore
+
+    print(f"===== 近似检索基准：{size} 条记忆，维度 {dim} =====")
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    store = VectorStore(dim, initial_capacity=size)
+    batch = 100_000
+    for offset in range(0, size, batch):
+        labels = rng.integers(0, n_clusters, min(batch, size - offset))
+        vectors = centers[labels] + 0.5 * rng.standard_normal((len(labels), dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.add(vectors)
+
+    query_ids = rng.choice(size, queries, replace=False)
+    query_vectors = store.vectors[query_ids] + 0.1 * rng.standard_normal((queries, dim), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    exact_samples = []
+    truth = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        hits = store.search(query, k, exact=True)
+        exact_samples.append((time.perf_counter() - start) * 1000)
+        truth.append({doc_id for _, doc_id in hits})
+    _report("精确检索", exact_samples)
+
+    start = time.perf_counter()
+    store.build_ann()
+    print(f"IVF 构建耗时: {time.perf_counter() - start:.2f}s，聚类数: {store.ivf.n_lists}")
+
+    # 构建后的增量插入
+    extra = store.vectors[:10_000].copy()
+    start = time.perf_counter()
+    store.add(extra)
+    elapsed = time.perf_counter() - start
+    print(f"增量插入 {len(extra)} 条: {elapsed * 1000:.1f}ms（{elapsed / len(extra) * 1e6:.1f}us/条）")
+
+    for n_probe in (1, 4, 8, 16, 32):
+        samples = []
+        recall = 0.0
+        for query, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            hits = store.search(query, k, n_probe=n_probe)
+            samples.append((time.perf_counter() - start) * 1000)
+            # 增量插入的副本与原向量相同，按原始ID计算召回
+            found = {doc_id % size for _, doc_id in hits}
+            recall += len(found & expected) / k
+        _report(f"IVF n_probe={n_probe:<2} recall@{k}={recall / queries:.3f}", samples)
+
+
+def benchmark_concurrency(size: int = 8000, thread_counts: tuple = (1, 2, 4, 8), users: int = 4,
+                          reads_per_write: int = 3):
+    """
+    MemoryManager 并发压力测试
+
+    size 条随机汉字组成的记忆平均分给各线程，每次写入后做若干次 BM25 搜索
+    （模拟 Agent 先记后查），
+    多个线程共享同一批用户分区。结束后校验每个分区的记忆数与可检索性，
+    并报告不同线程数下的吞吐量。纯 Python 的索引受 GIL 限制，
+    该测试主要验证多线程下结果正确、吞吐量不因锁竞争而塌陷。
+    """
+    from memory_manager import memory_manager
+
+    print(f"===== 并发压力测试：共 {size} 次写入，每次写入后 {reads_per_write} 次搜索 =====")
+    for run, n_threads in enumerate(thread_counts):
+        user_ids = [f"stress-{run}-{i}" for i in range(users)]
+        per_thread = size // n_threads
+        rng = random.Random(run)
+        texts = [["".join(chr(0x4e00 + rng.randrange(20000)) for _ in range(6))
+                  for _ in range(per_thread)] for _ in range(n_threads)]
+        errors = []
+        barrier = threading.Barrier(n_threads)
+
+        def worker(thread_id: int):
+            try:
+                barrier.wait()
+                for i in range(per_thread):
+                    user_id = user_ids[(thread_id + i) % users]
+                    text = texts[thread_id][i]
+                    memory_manager.add_memory(text, user_id=user_id)
+                    for _ in range(reads_per_write):
+                        if text not in memory_manager.search_memory(text, user_id=user_id,
+                                                                    mode="bm25", limit=5):
+                            raise AssertionError(f"刚写入的记忆未被检索到: {text}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            # 校验：每条记忆都写入了正确的分区
+            expected = {user_id: set() for user_id in user_ids}
+            for thread_id in range(n_threads):
+                for i in range(per_thread):
+                    expected[user_ids[(thread_id + i) % users]].add(texts[thread_id][i])
+            mismatched = sum(set(memory_manager.list_all_memories(user_id=user_id)) != texts
+                             for user_id, texts in expected.items())
+            for user_id in user_ids:
+                memory_manager.clear_memory(user_id=user_id)
+
+        ops = n_threads * per_thread * (1 + reads_per_write)
+        ok = not errors and mismatched == 0
+        print(f"{n_threads} 线程: {ops / elapsed:,.0f} ops/s, 分区不一致 {mismatched}, "
+              f"异常 {len(errors)} -> {'✓' if ok else '✗'}")
+        if errors:
+            print(f"  首个异常: {errors[0]}")
+
+
+def benchmark_persistence(size: int = 1_000_000, users: int = 100, log_records: int = 20_000):
+    """
+    持久化基准
+
+    - 写入 size 条记忆的快照后，测量 mmap 加载快照 + 重放日志尾部的启动耗时；
+    - 比较三种 fsync 策略下日志追加的吞吐量。
+    """
+    from memory_persistence import MemoryLog, MemoryPersistence, write_snapshot
+
+    print(f"===== 持久化基准：{size} 条记忆，{users} 个用户 =====")
+    directory = tempfile.mkdtemp(prefix="memory-bench-")
+    try:
+        rng = random.Random(0)
+        partitions = {f"user-{u}": [] for u in range(users)}
+        user_ids = list(partitions)
+        for i in range(size):
+            text = "".join(chr(0x4e00 + rng.randrange(20000)) for _ in range(12))
+            partitions[user_ids[i % users]].append(text)
+
+        persistence = MemoryPersistence(directory, fsync_policy="os", snapshot_interval=None)
+        start = time.perf_counter()
+        write_snapshot(persistence.snapshot_path, 0, partitions)
+        print(f"写入快照: {time.perf_counter() - start:.2f}s")
+
+        # 快照之后的日志尾部
+        persistence.load()
+        for i in range(log_records):
+            persistence.append_add(user_ids[i % users], f"日志尾部记忆{i}")
+        persistence.close()
+
+        start = time.perf_counter()
+        reloaded = MemoryPersistence(directory).load()
+        elapsed = time.perf_counter() - start
+        total = sum(map(len, reloaded.values()))
+        print(f"启动加载: {elapsed * 1000:.0f}ms（快照 {size} 条 + 日志 {log_records} 条，共 {total} 条）")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for policy, count in (("always", 2_000), ("batch", 50_000), ("os", 50_000)):
+        directory = tempfile.mkdtemp(prefix="memory-bench-")
+        try:
+            log = MemoryLog(f"{directory}/memory.log", fsync_policy=policy)
+            start = time.perf_counter()
+            for i in range(count):
+                log.append(1, "user", f"fsync 策略测试记忆{i}")
+            log.close()
+            elapsed = time.perf_counter() - start
+            print(f"fsync={policy:<6}: {count / elapsed:,.0f} 条/秒")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_sqlite(size: int = 1_000_000, users: int = 100, queries: int = 200):
+    """
+    SQLite FTS5 存储基准
+
+    按用户分批导入 size 条随机汉字记忆（每批一个事务，汉字取自 3500 个字符，
+    接近常用字表的规模，使词表分布不至于过分稀疏），再用已有记忆的
+    片段作为查询，分别测量长关键词（trigram 表）与短关键词（词元表）的检索延迟，
+    并报告数据库文件大小与导入后进程的常驻内存。
+    """
+    import resource
+    from sqlite_tools import SQLiteMemoryStore
+
+    print(f"===== SQLite 存储基准：{size} 条记忆，{users} 个用户 =====")
+    directory = tempfile.mkdtemp(prefix="memory-bench-")
+    try:
+        store = SQLiteMemoryStore(os.path.join(directory, "memory.db"))
+        rng = random.Random(0)
+        per_user = size // users
+        samples = []
+        elapsed = 0.0
+        for u in range(users):
+            texts = ["".join(chr(0x4e00 + rng.randrange(3500)) for _ in range(12)) for _ in range(per_user)]
+            start = time.perf_counter()
+            store.add_memories(texts, user_id=f"user-{u}")
+            elapsed += time.perf_counter() - start
+            samples.append((f"user-{u}", texts[rng.randrange(per_user)]))
+        print(f"批量导入: {elapsed:.1f}s（{users * per_user / elapsed:,.0f} 条/秒）")
+        start = time.perf_counter()
+        store.optimize()
+        print(f"索引合并: {time.perf_counter() - start:.1f}s")
+        db_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"数据库大小: {db_bytes / 1024 ** 2:.0f} MiB，进程峰值内存: {rss:.0f} MiB")
+
+        for name, fragment in (("长关键词(4字)", lambda text: text[3:7]),
+                               ("短关键词(2字)", lambda text: text[5:7])):
+            latencies = []
+            found = 0
+            for i in range(queries):
+                user_id, text = samples[i % len(samples)]
+                start = time.perf_counter()
+                results = store.search_memory(fragment(text), user_id=user_id)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found += text in results
+            _report(f"{name} 命中 {found}/{queries}", latencies)
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            store.add_memory("单条写入的记忆", user_id="user-0")
+        elapsed = time.perf_counter() - start
+        # 1000 次写入的总秒数即每次写入的毫秒数
+        print(f"单条写入（每条一个事务）: {elapsed:.3f}ms/条")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_dedup(size: int = 20_000, queries: int = 200, repeats: int = 4):
+    """
+    近似去重基准
+
+    模拟 Agent 反复记录同一事实：每个事实写入 1 次原句，再写入最多 repeats 次
+    仅标点、语气词或空白不同的改写。分别在不去重、写入时去重、不去重写入后离线压缩
+    三种情况下报告存储条数、写入吞吐、keyword 模式的搜索延迟，以及返回给 Agent 的
+    结果字符数（即 prompt 中记忆部分的大小）。
+    """
+    from memory_manager import MemoryManager, memory_manager
+
+    print(f"===== 近似去重基准：{size} 次写入，每个事实最多 {repeats} 次改写 =====")
+    rng = random.Random(0)
+    suffixes = ["。", "！", "哦", "呀", "啊", " ", "了"]
+    writes = []
+    facts = []
+    while len(writes) < size:
+        fact = "我的" + "".join(chr(0x4e00 + rng.randrange(3500)) for _ in range(rng.randint(6, 14)))
+        facts.append(fact)
+        writes.append(fact)
+        for _ in range(rng.randint(0, repeats)):
+            writes.append(fact + rng.choice(suffixes))
+    writes = writes[:size]
+    # 查询取事实中间的片段，会命中该事实的全部改写
+    probes = [fact[3:7] for fact in rng.sample(facts, min(queries, len(facts)))]
+
+    def load(user_id: str) -> float:
+        start = time.perf_counter()
+        for text in writes:
+            memory_manager.add_memory(text, user_id=user_id)
+        return size / (time.perf_counter() - start)
+
+    def report(label: str, user_id: str):
+        latencies = []
+        prompt_chars = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for probe in probes:
+                start = time.perf_counter()
+                results = memory_manager.search_memory(probe, user_id=user_id, mode="keyword")
+                latencies.append((time.perf_counter() - start) * 1000)
+                # 与 search_memory 工具的输出格式一致："- 记忆\\n"
+                prompt_chars += sum(len(mem) + 3 for mem in results)
+        stats = memory_manager.get_stats(user_id)
+        print(f"{label}: 存储 {stats['memories']} 条，写入去重 {stats['deduplicated']} 次，"
+              f"压缩删除 {stats['compacted']} 条，平均结果 {prompt_chars / len(probes):.0f} 字符")
+        _report(f"{label} 搜索", latencies)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain_rate = load("dedup-off")
+            load("dedup-compact")
+            start = time.perf_counter()
+            memory_manager.compact("dedup-compact")
+            compact_seconds = time.perf_counter() - start
+            memory_manager.enable_dedup()
+            dedup_rate = load("dedup-on")
+        print(f"写入吞吐: 不去重 {plain_rate:,.0f} 条/秒，写入时去重 {dedup_rate:,.0f} 条/秒；"
+              f"离线压缩耗时 {compact_seconds:.2f}s")
+        report("不去重", "dedup-off")
+        report("写入时去重", "dedup-on")
+        report("离线压缩", "dedup-compact")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for user_id in ("dedup-off", "dedup-on", "dedup-compact"):
+                memory_manager.clear_memory(user_id=user_id)
+        MemoryManager._dedup_params = None
+
+
+def benchmark_eviction(size: int = 200_000, caps: tuple = (1_000, 10_000, 100_000)):
+    """
+    容量淘汰基准
+
+    对不同的每用户上限持续写入 size 条记忆，比较各淘汰策略的写入吞吐，
+    验证淘汰的摊还代价与上限大小无关；同时报告写入结束后的内存占用与淘汰数。
+    """
+    from memory_manager import memory_manager
+
+    print(f"===== 容量淘汰基准：每个配置写入 {size} 条记忆 =====")
+    rng = random.Random(0)
+    texts = ["".join(chr(0x4e00 + rng.randrange(3500)) for _ in range(12)) for _ in range(size)]
+
+    def run(label: str, user_id: str):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for text in texts:
+                memory_manager.add_memory(text, user_id=user_id)
+            elapsed = time.perf_counter() - start
+        usage = memory_manager.memory_usage()[user_id]
+        print(f"{label}: {size / elapsed:,.0f} 条/秒，保留 {usage['memories']} 条，"
+              f"文本 {usage['text_bytes'] / 1024 ** 2:.1f} MiB，淘汰 {usage['evicted']} 条")
+        with contextlib.redirect_stdout(io.StringIO()):
+            memory_manager.clear_memory(user_id=user_id)
+
+    try:
+        memory_manager.set_capacity(policy=None)
+        run("不限容量", "evict-none")
+        for policy in ("lru", "importance", "ttl"):
+            for cap in caps:
+                kwargs = {"ttl": 3600} if policy == "ttl" else {}
+                memory_manager.set_capacity(per_user=cap, policy=policy, **kwargs)
+                run(f"{policy:<10} 上限 {cap:>7}", f"evict-{policy}-{cap}")
+    finally:
+        memory_manager.set_capacity(policy=None)
+
+
+def benchmark_records(size: int = 1_000_000, reads: int = 100_000):
+    """
+    记忆记录内存占用基准
+
+    用 tracemalloc 统计保存 size 条记忆（含写入时间、记录ID、来源）的每条字节数：
+    原先的 List[str]（不含元数据）、逐条 dict（远程服务返回的 JSON 形式）、
+    __slots__ 记录，以及 RecordColumns 列式存储；同时比较随机读取单条文本的耗时。
+    """
+    import sys
+    import tracemalloc
+    from memory_records import MemoryRecord, RecordColumns
+
+    print(f"===== 记录内存占用基准：{size} 条记忆 =====")
+    rng = random.Random(0)
+    sources = ["langchain_agent", "openmemory_client", "mem0_sync", "cli"]
+    seeds = [(rng.randint(6, 24), rng.randrange(len(sources))) for _ in range(size)]
+    created_at = time.time()
+
+    alphabet = "".join(chr(0x4e00 + i * 7 % 3500) for i in range(3500)) * 2
+
+    def texts():
+        # 每次拼接出新的字符串对象，使其内存计入被测的存储结构
+        for index, (length, _) in enumerate(seeds):
+            offset = index * 31 % 3500
+            yield f"用户{index % 997}" + alphabet[offset:offset + length]
+
+    def as_list():
+        return list(texts())
+
+    def as_dicts():
+        # 解析 JSON 得到的来源字符串各自独立，这里同样逐条复制
+        return [{"id": index + 1, "memory": text, "created_at": created_at + index,
+                 "source": "".join(sources[seeds[index][1]])}
+                for index, text in enumerate(texts())]
+
+    def as_records():
+        return [MemoryRecord(index + 1, text, created_at + index, sys.intern(sources[seeds[index][1]]))
+                for index, text in enumerate(texts())]
+
+    def as_columns():
+        columns = RecordColumns()
+        for index, text in enumerate(texts()):
+            columns.append(text, created_at + index, sources[seeds[index][1]])
+        return columns
+
+    text_bytes = sum(len(text.encode("utf-8")) for text in texts())
+    print(f"UTF-8 文本共 {text_bytes / size:.1f} 字节/条")
+    probes = [rng.randrange(size) for _ in range(reads)]
+    for label, build, read in (
+            ("List[str]（无元数据）", as_list, lambda store, i: store[i]),
+            ("dict 记录", as_dicts, lambda store, i: store[i]["memory"]),
+            ("__slots__ 记录", as_records, lambda store, i: store[i].text),
+            ("RecordColumns 列式", as_columns, lambda store, i: store[i])):
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = build()
+        build_seconds = time.perf_counter() - start
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for index in probes:
+            read(store, index)
+        read_us = (time.perf_counter() - start) / reads * 1e6
+        print(f"{label}: {used / size:.1f} 字节/条，共 {used / 1024 ** 2:.1f} MiB，"
+              f"构建 {build_seconds:.1f}s（含 tracemalloc 开销），随机读取 {read_us:.2f}us/条")
+        del store
+
+
+def benchmark_query_cache(size: int = 100_000, queries: int = 2_000, writes_every: int = 50):
+    """
+    搜索结果缓存基准
+
+    Agent 每轮都会搜索记忆，反复出现的只有少数几个查询。对 size 条记忆
+    重复执行一组常见查询，比较关闭与开启缓存时各模式的搜索延迟；
+    再每 writes_every 次搜索插入一次写入，观察写入使缓存失效后的命中率。
+    """
+    from memory_manager import MemoryManager, memory_manager
+
+    print(f"===== 搜索结果缓存基准：{size} 条记忆，{queries} 次搜索 =====")
+    rng = random.Random(0)
+    common = ["名字", "颜色", "喜欢什么", "用户的爱好", "住在哪里"]
+    texts = [f"用户{i % 500}" + "".join(chr(0x4e00 + rng.randrange(3500)) for _ in range(10))
+             for i in range(size)]
+    texts[::1000] = [f"用户喜欢蓝色，名字叫张伟{i}" for i in range(len(texts[::1000]))]
+    user_id = "cache-bench"
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in texts:
+            memory_manager.add_memory(text, user_id=user_id)
+        memory_manager.search_memory("预热", user_id=user_id)
+
+    def run(mode: str, write: bool = False) -> list:
+        latencies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(queries):
+                if write and i % writes_every == 0:
+                    memory_manager.add_memory(f"新的记忆{i}", user_id=user_id)
+                query = rng.choice(common)
+                start = time.perf_counter()
+                memory_manager.search_memory(query, user_id=user_id, mode=mode, limit=10)
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    try:
+        for mode in ("keyword", "bm25"):
+            MemoryManager.query_cache_size = 0
+            _report(f"{mode:<8} 无缓存", run(mode))
+            MemoryManager.query_cache_size = 256
+            before = memory_manager.cache_stats()
+            _report(f"{mode:<8} 有缓存", run(mode))
+            after = memory_manager.cache_stats()
+            hits = after["hits"] - before["hits"]
+            print(f"  命中率 {hits / queries:.1%}")
+            before = after
+            _report(f"{mode:<8} 有缓存，每 {writes_every} 次搜索写入一次", run(mode, write=True))
+            after = memory_manager.cache_stats()
+            print(f"  命中率 {(after['hits'] - before['hits']) / queries:.1%}")
+    finally:
+        MemoryManager.query_cache_size = 256
+        with contextlib.redirect_stdout(io.StringIO()):
+            memory_manager.clear_memory(user_id=user_id)
+
+
+def benchmark_metrics(size: int = 10_000, queries: int = 20_000):
+    """
+    指标开销基准
+
+    在命中搜索结果缓存的本地搜索（最快的路径，约 10 微秒）上比较关闭与开启指标时的
+    每次调用耗时，并输出一段 Prometheus 格式的导出结果。
+    """
+    from memory_manager import memory_manager
+    from memory_metrics import get_metrics
+
+    print(f"===== 指标开销基准：{size} 条记忆，{queries} 次搜索 =====")
+    rng = random.Random(0)
+    user_id = "metrics-bench"
+    metrics = get_metrics()
+    was_enabled = metrics.enabled
+
+    def run() -> float:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for i in range(queries):
+                memory_manager.search_memory(("名字", "颜色", "喜欢")[i % 3], user_id=user_id)
+            return (time.perf_counter() - start) / queries * 1e6
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(size):
+                memory_manager.add_memory("".join(chr(0x4e00 + rng.randrange(3500)) for _ in range(12)),
+                                          user_id=user_id)
+        metrics.disable()
+        run()
+        disabled = min(run() for _ in range(3))
+        metrics.reset()
+        metrics.enable()
+        enabled = min(run() for _ in range(3))
+        print(f"关闭指标: {disabled:.2f}us/次，开启指标: {enabled:.2f}us/次，"
+              f"开销 {enabled - disabled:.2f}us/次")
+        prometheus = metrics.to_prometheus()
+        print("\n".join(line for line in prometheus.splitlines()
+                        if "search_memory" in line and "latency" in line))
+    finally:
+        metrics.enabled = was_enabled
+        with contextlib.redirect_stdout(io.StringIO()):
+            memory_manager.clear_memory(user_id=user_id)
+
+
+@contextlib.contextmanager
+def _openmemory_stub(latency: float = 0.02, health_latency: float = 0.0):
+    """
+    在后台线程中启动模拟 OpenMemory API 的 aiohttp 服务器，产出其地址
+
+    每个请求等待 latency 秒（健康检查等待 health_latency 秒）后返回，
+    模拟服务器端的处理时间（不占用 CPU）。
+    """
+    import asyncio
+    from aiohttp import web
+
+    memories = []
+
+    async def add(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        start = len(memories)
+        memories.extend(message["content"] for message in body["messages"])
+        return web.json_response({"results": [{"id": memory_id + 1, "event": "ADD"}
+                                              for memory_id in range(start, len(memories))]})
+
+    async def search(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        hits = [{"memory": mem} for mem in memories[-body.get("limit", 10):]]
+        return web.json_response({"results": hits})
+
+    async def health(request):
+        await asyncio.sleep(health_latency)
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.router.add_post("/api/v1/memories/", add)
+    app.router.add_post("/api/v1/memories/search/", search)
+    app.router.add_get("/health", health)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=1024)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, name="openmemory-stub", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def benchmark_openmemory_async(size: int = 2_000, latency: float = 0.02,
+                               concurrency: tuple = (1, 10, 50, 100, 200)):
+    """
+    OpenMemory 异步客户端吞吐基准
+
+    对本地模拟服务器（每个请求耗时 latency 秒）发送 size 次搜索请求，
+    比较同步客户端（requests，每个在途请求占用一个线程）与异步客户端
+    在不同在途请求数下的吞吐；理想吞吐为 在途请求数 / latency。
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+    from openmemory_async_client import AsyncOpenMemoryClient
+
+    print(f"===== OpenMemory 异步客户端基准：{size} 次搜索，服务器延迟 {latency * 1000:.0f}ms =====")
+    with _openmemory_stub(latency) as base_url:
+        session = requests.Session()
+        url = f"{base_url}/api/v1/memories/search/"
+        for threads in (1, 10, 50):
+            count = min(size, threads * 20)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(lambda i: session.post(url, json={"query": "名字", "limit": 5}).json(),
+                              range(count)))
+            elapsed = time.perf_counter() - start
+            print(f"同步客户端 {threads:>3} 线程: {count / elapsed:8,.0f} 次/秒")
+        session.close()
+
+        async def run(in_flight: int) -> float:
+            async with AsyncOpenMemoryClient(base_url, "bench_user", "bench", max_connections=in_flight,
+                                             max_concurrency=in_flight) as client:
+                await client.health_check()
+                queue = iter(range(size))
+
+                async def worker():
+                    # 查询在各轮之间也不同：搜索结果缓存在进程内共享，重复的查询会绕过网络
+                    for i in queue:
+                        await client.search_memory(f"名字{in_flight}-{i}", limit=5)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(in_flight)))
+                return size / (time.perf_counter() - start)
+
+        for in_flight in concurrency:
+            rate = asyncio.run(run(in_flight))
+            print(f"异步客户端 {in_flight:>3} 在途: {rate:8,.0f} 次/秒（理想 {in_flight / latency:,.0f}）")
+
+
+def benchmark_circuit_breaker(size: int = 1_000, read_timeout: float = 0.1):
+    """
+    OpenMemory 熔断器基准
+
+    模拟服务器挂起（响应耗时远超读取超时），比较熔断器打开前后每次调用的耗时：
+    打开前每次调用要等满超时和退避重试，打开后不发送请求、立即失败。
+    """
+    from circuit_breaker import CircuitBreaker
+    from openmemory_client import OpenMemoryClient
+
+    print(f"===== OpenMemory 熔断器基准：读取超时 {read_timeout * 1000:.0f}ms，服务器挂起 =====")
+    logging.disable(logging.CRITICAL)
+    try:
+        with _openmemory_stub(latency=read_timeout * 10) as base_url:
+            client = OpenMemoryClient(base_url, "bench_user", "bench", read_timeout=read_timeout,
+                                      breaker=CircuitBreaker("OpenMemory", reset_timeout=60))
+            timings = []
+            while client.breaker.state != "open":
+                start = time.perf_counter()
+                client.search_memory("名字")
+                timings.append(time.perf_counter() - start)
+            print(f"熔断前: {len(timings)} 次调用，平均 {sum(timings) / len(timings) * 1000:.1f}ms/次")
+            start = time.perf_counter()
+            for _ in range(size):
+                client.search_memory("名字")
+            elapsed = time.perf_counter() - start
+            print(f"熔断后: {size} 次调用，平均 {elapsed / size * 1e6:.1f}us/次")
+            print(f"熔断器状态: {client.breaker.stats()}")
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def benchmark_write_behind(size: int = 200, latency: float = 0.05):
+    """
+    OpenMemory 后台批量写入基准
+
+    对本地模拟服务器（每个请求耗时 latency 秒）添加 size 条记忆，比较同步写入与后台批量写入
+    时 add_memory 在调用方一侧的耗时，以及全部写出所需的请求数与总时间。
+    """
+    from openmemory_client import OpenMemoryClient
+
+    print(f"===== OpenMemory 后台批量写入基准：{size} 条记忆，服务器延迟 {latency * 1000:.0f}ms =====")
+    with _openmemory_stub(latency) as base_url:
+        client = OpenMemoryClient(base_url, "bench_user", "bench", write_behind=False)
+        start = time.perf_counter()
+        for i in range(size):
+            client.add_memory(f"用户的第{i}条偏好")
+        elapsed = time.perf_counter() - start
+        print(f"同步写入: add_memory {elapsed / size * 1000:.2f}ms/次，{size} 个请求，共 {elapsed:.2f}s")
+
+        client = OpenMemoryClient(base_url, "bench_user", "bench", write_behind=False)
+        client.enable_write_behind(max_batch=16, flush_interval=0.5)
+        start = time.perf_counter()
+        for i in range(size):
+            client.add_memory(f"用户的第{i}条偏好")
+        enqueue = time.perf_counter() - start
+        visible = "用户的第0条偏好" in client.search_memory("偏好", limit=size)
+        client.flush_writes()
+        elapsed = time.perf_counter() - start
+        stats = client._write_queue.stats()
+        print(f"后台批量写入: add_memory {enqueue / size * 1000:.3f}ms/次，"
+              f"{stats['batches']} 个请求，全部写出共 {elapsed:.2f}s，写出前搜索可见: {visible}")
+        client.close()
+
+
+def benchmark_remote_cache(size: int = 200, latency: float = 0.05, write_every: int = 20):
+    """
+    远程搜索结果缓存基准
+
+    模拟 Agent 反复回忆少量问题（标点、大小写略有不同），每 write_every 轮写入一条记忆，
+    比较关闭与开启缓存时 OpenMemory search_memory 的延迟分布。
+    """
+    from openmemory_client import OpenMemoryClient
+    from search_cache import SearchCache
+
+    questions = ["我叫什么名字？", "我叫什么名字", "我喜欢什么颜色?", "我喜欢什么颜色",
+                 "我在哪里工作", "我的工作是什么？", "What is my name?", "what is my name",
+                 "我住在哪里", "我的爱好"]
+    rng = random.Random(42)
+    turns = [rng.choice(questions) for _ in range(size)]
+    print(f"===== 远程搜索缓存基准：{size} 轮，{len(questions)} 种问题，服务器延迟 {latency * 1000:.0f}ms，"
+          f"每 {write_every} 轮写入一次 =====")
+    with _openmemory_stub(latency) as base_url:
+        for label, ttl in (("关闭缓存", 0), ("开启缓存", 60)):
+            client = OpenMemoryClient(base_url, "bench_user", "bench", write_behind=False)
+            client.search_cache = SearchCache(ttl=ttl)
+            timings = []
+            for turn, query in enumerate(turns, 1):
+                start = time.perf_counter()
+                client.search_memory(query)
+                timings.append(time.perf_counter() - start)
+                if turn % write_every == 0:
+                    client.add_memory(f"第{turn}轮记住的事")
+            timings.sort()
+            stats = client.search_cache.stats()
+            print(f"{label}: p50 {timings[len(timings) // 2] * 1000:.3f}ms，"
+                  f"p95 {timings[int(len(timings) * 0.95)] * 1000:.3f}ms，"
+                  f"总计 {sum(timings):.2f}s，命中率 {stats['hit_rate']:.1%}")
+
+
+def benchmark_federated(size: int = 20, mem0_latency: float = 0.3, openmemory_latency: float = 0.2):
+    """
+    联合搜索基准
+
+    后端为模拟的 Mem0（固定延迟 mem0_latency 秒，相当于一次嵌入调用加向量检索）、
+    连接本地模拟服务器的 OpenMemory 客户端与本地内存存储，比较依次查询与并发联合搜索的延迟，
+    以及截止时间短于 Mem0 延迟时只返回已到达结果的情况（之后 Mem0 的上一次调用仍未返回，
+    会被跳过而不是再等一次截止时间）。
+    """
+    from federated_search import FederatedSearcher, parse_remote_results
+    from memory_manager import MemoryManager
+    from openmemory_client import OpenMemoryClient
+    from search_cache import SearchCache
+
+    def mem0_search(query, limit):
+        time.sleep(mem0_latency)
+        return ["用户名叫张伟", "用户喜欢蓝色"][:limit]
+
+    manager = MemoryManager()
+    manager.search_mode = "bm25"
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.add_memory("用户名叫张伟，在北京工作")
+        manager.add_memory("用户最喜欢的颜色是蓝色")
+
+    print(f"===== 联合搜索基准：Mem0 {mem0_latency * 1000:.0f}ms，OpenMemory {openmemory_latency * 1000:.0f}ms，"
+          f"本地内存，{size} 次搜索 =====")
+    with _openmemory_stub(openmemory_latency) as base_url:
+        client = OpenMemoryClient(base_url, "bench_user", "bench", write_behind=False)
+        client.search_cache = SearchCache(ttl=0)
+        backends = {
+            "mem0": mem0_search,
+            "openmemory": lambda query, limit: parse_remote_results(client.search_memory(query, limit)),
+            "local": lambda query, limit: manager.search_memory(query, limit=limit),
+        }
+        queries = ["我叫什么名字", "我喜欢什么颜色", "我在哪里工作", "我的爱好"]
+
+        def run(label, search):
+            timings, counts = [], 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(size):
+                    start = time.perf_counter()
+                    counts += search(queries[i % len(queries)])
+                    timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"{label}: p50 {timings[len(timings) // 2] * 1000:.1f}ms，"
+                  f"最大 {timings[-1] * 1000:.1f}ms，平均合并后 {counts / size:.1f} 条")
+
+        def sequential(query):
+            merged = {}
+            for search in backends.values():
+                for memory in search(query, 10):
+                    merged.setdefault(memory, None)
+            return len(merged)
+
+        run("依次查询", sequential)
+        for deadline in (1.0, (mem0_latency + openmemory_latency) / 2):
+            searcher = FederatedSearcher(backends, deadline=deadline)
+            logging.disable(logging.WARNING)
+            try:
+                run(f"联合搜索（截止 {deadline * 1000:.0f}ms）",
+                    lambda query: len(searcher.search(query)["results"]))
+            finally:
+                logging.disable(logging.NOTSET)
+            # 等待被放弃的 Mem0 调用结束，避免下一轮因 hung 跳过
+            time.sleep(mem0_latency)
+
+
+class _SlowMemory:
+    """模拟 mem0 Memory：add 耗时 add_latency 秒（事实抽取 + 嵌入 + 写入向量库）"""
+
+    def __init__(self, add_latency: float):
+        self.add_latency = add_latency
+        self.memories = []
+        self._lock = threading.Lock()
+
+    def add(self, messages, user_id=None, metadata=None):
+        time.sleep(self.add_latency)
+        with self._lock:
+            self.memories.extend(message["content"] for message in messages)
+        return {"results": [{"memory": message["content"], "event": "ADD"} for message in messages]}
+
+    def search(self, query, user_id=None, limit=10):
+        with self._lock:
+            return {"results": [{"memory": memory} for memory in self.memories[-limit:]]}
+
+
+def benchmark_mem0_ingest(size: int = 10, add_latency: float = 1.5):
+    """
+    Mem0 后台写入基准
+
+    用耗时 add_latency 秒的模拟 Memory 添加 size 条记忆，比较同步与后台写入时
+    AddMemoryTool 的返回耗时，以及后台写入全部完成所需的时间。
+    """
+    import mem0_tools
+    from mem0_tools import AddMemoryTool, Mem0Client
+
+    print(f"===== Mem0 后台写入基准：{size} 条记忆，每次 Memory.add {add_latency:.1f}s =====")
+    tool = AddMemoryTool()
+    logging.disable(logging.INFO)
+    try:
+        for label, workers in (("同步写入", 0), ("后台写入（2 个线程）", 2)):
+            client = Mem0Client(memory=_SlowMemory(add_latency))
+            if workers:
+                client.enable_async_ingest(workers=workers, max_pending=size)
+            mem0_tools._mem0_client = client
+            timings = []
+            start = time.perf_counter()
+            for i in range(size):
+                turn = time.perf_counter()
+                tool.run(f"用户的第{i}条偏好")
+                timings.append(time.perf_counter() - turn)
+            returned = time.perf_counter() - start
+            visible = "用户的第0条偏好" in client.search_memory("偏好")
+            client.wait_ingested()
+            elapsed = time.perf_counter() - start
+            print(f"{label}: 工具返回 {sum(timings) / size * 1000:.1f}ms/次（共 {returned:.2f}s），"
+                  f"全部写入 {elapsed:.2f}s，写入前搜索可见: {visible}")
+            client.close()
+    finally:
+        logging.disable(logging.NOTSET)
+        mem0_tools._mem0_client = None
+
+
+# 导入 chain_factory 时不应加载的模块：LangChain 与各记忆后端都应在创建 Agent 时才导入
+_LAZY_MODULES = ("langchain", "langchain_openai", "mem0", "mem0_tools", "openmemory_tools",
+                 "openmemory_client", "sqlite_tools", "custom_tools", "federated_search")
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import chain_factory
+chain_factory.create_agent_executor()
+print(time.perf_counter() - start)
+"""
+
+
+def benchmark_startup(size: int = 3, health_latency: float = 1.0):
+    """
+    启动耗时基准
+
+    1. 用 python -X importtime 测量导入 chain_factory 的耗时，并检查没有提前导入 LangChain
+       与记忆后端（出现时以非零状态退出，可用于防止回归）。
+    2. 在新进程中调用 create_agent_executor，记忆后端为健康检查耗时 health_latency 秒的
+       模拟 OpenMemory 服务器，比较关闭与开启预热时的冷启动耗时（取 size 次的中位数）。
+    """
+    import statistics
+
+    env = dict(os.environ, OPENROUTER_API_KEY=os.getenv("OPENROUTER_API_KEY") or "benchmark")
+    print("===== 启动耗时基准 =====")
+    check = "import sys, chain_factory; print(','.join(m for m in %r if m in sys.modules))" % (_LAZY_MODULES,)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check], env=env,
+                            capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                timings[name.strip()] = int(cumulative)
+    top_level = sorted((name for name in timings if "." not in name), key=timings.get, reverse=True)
+    print(f"导入 chain_factory: {timings['chain_factory'] / 1000:.1f}ms；"
+          f"耗时最多的顶层模块: {', '.join(f'{name} {timings[name] / 1000:.1f}ms' for name in top_level[:5])}")
+    eager = result.stdout.strip()
+
+    with _openmemory_stub(health_latency=health_latency) as url:
+        env.update(MEMORY_SERVICE="openmemory", OPENMEMORY_API_BASE=url)
+        for label, warmup in (("顺序初始化", "0"), ("后台预热", "1")):
+            env["MEMORY_WARMUP"] = warmup
+            elapsed = []
+            for _ in range(size):
+                result = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT], env=env,
+                                        capture_output=True, text=True, check=True)
+                elapsed.append(float(result.stdout.strip().splitlines()[-1]))
+            print(f"{label}: 创建 Agent {statistics.median(elapsed):.2f}s"
+                  f"（健康检查 {health_latency:.1f}s，{size} 次中位数）")
+
+    if eager:
+        print(f"回归：导入 chain_factory 时加载了 {eager}")
+        raise SystemExit(1)
+
+
+def benchmark_health(size: int = 100, mem0_latency: float = 1.5, hang: float = 12.0,
+                     deadline: float = 5.0):
+    """
+    健康检查基准
+
+    Mem0 的检查耗时 mem0_latency 秒后失败（相当于初始化 Memory 失败），OpenMemory 为健康检查
+    挂起 hang 秒的模拟服务器（客户端读取超时 10 秒），SQLite 立即可用。比较依次检查与并发检查
+    （总截止时间 deadline 秒）选出后端的耗时，以及之后 size 次使用缓存状态的选择耗时。
+    """
+    from backend_health import HealthMonitor
+    from openmemory_client import OpenMemoryClient
+
+    def mem0_probe():
+        time.sleep(mem0_latency)
+        return False
+
+    print(f"===== 健康检查基准：Mem0 {mem0_latency:.1f}s 后失败，OpenMemory 挂起，SQLite 可用 =====")
+    logging.disable(logging.CRITICAL)
+    try:
+        with _openmemory_stub(health_latency=hang) as base_url:
+            client = OpenMemoryClient(base_url, "bench_user", "bench", write_behind=False)
+            probes = {"mem0": mem0_probe, "openmemory": client.health_check, "sqlite": lambda: True}
+
+            start = time.perf_counter()
+            selected = next((name for name, probe in probes.items() if probe()), None)
+            print(f"依次检查: 选择 {selected}，{time.perf_counter() - start:.2f}s")
+
+            monitor = HealthMonitor(probes, interval=30.0, deadline=deadline)
+            start = time.perf_counter()
+            selected = monitor.select(list(probes))
+            print(f"并发检查（截止 {deadline:.0f}s）: 选择 {selected}，{time.perf_counter() - start:.2f}s")
+
+            start = time.perf_counter()
+            for _ in range(size):
+                monitor.select(list(probes))
+            print(f"使用缓存状态: {(time.perf_counter() - start) / size * 1e6:.1f}µs/次")
+            status = {name: item["error"] or item["healthy"] for name, item in monitor.status().items()}
+            print(f"缓存的状态: {status}")
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+@contextlib.contextmanager
+def _chat_stub(latency: float = 0.02, respond=None):
+    """
+    在后台线程中启动模拟 OpenAI 兼容接口的 aiohttp 服务器，产出 (地址, 统计)
+
+    每个请求等待 latency 秒后返回 respond(Prompt 文本) 的结果，默认为一个 ReAct 的最终答案；
+    统计中记录请求数与建立过的连接数。
+    """
+    import asyncio
+    from aiohttp import web
+
+    stats = {"requests": 0, "connections": set()}
+
+    async def completions(request):
+        body = await request.json()
+        stats["requests"] += 1
+        stats["connections"].add(request.transport.get_extra_info("peername")[1])
+        await asyncio.sleep(latency)
+        prompt = "\n".join(str(message.get("content")) for message in body["messages"])
+        content = respond(prompt) if respond else "Thought: 无需工具\nFinal Answer: 好的"
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "bench",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for delta, finish_reason in (({"role": "assistant", "content": content}, None), ({}, "stop")):
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, name="chat-stub", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/v1", stats
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def benchmark_agent_pool(size: int = 50, latency: float = 0.02):
+    """
+    Agent 执行器池基准
+
+    模型为延迟 latency 秒的模拟接口，记忆为模拟工具。比较每个请求重新创建 ChatOpenAI、工具、
+    Prompt 与 ReAct Agent（原 create_agent_executor 的做法，不含后端健康检查）与通过
+    agent_session() 从池中取用执行器时，每个请求的准备耗时、总耗时与建立的连接数。
+    """
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    import chain_factory
+    from langchain_openai import ChatOpenAI
+    from llm_config import LLMConfig
+    from prompt_template import get_agent_prompt_template
+
+    def unpooled():
+        llm = ChatOpenAI(model=LLMConfig.MODEL_NAME, base_url=LLMConfig.BASE_URL,
+                         api_key=LLMConfig.API_KEY, temperature=0.7)
+        tools = chain_factory._load_mock_tools(LLMConfig)
+        return contextlib.nullcontext(chain_factory._build_agent_executor(llm, tools, get_agent_prompt_template()))
+
+    print(f"===== Agent 执行器池基准：{size} 个请求，模型延迟 {latency * 1000:.0f}ms =====")
+    base_url = LLMConfig.BASE_URL
+    try:
+        for label, session in (("每次新建", unpooled),
+                               ("执行器池", lambda: chain_factory.agent_session("mock", user_id="bench"))):
+            with _chat_stub(latency) as (url, stats):
+                LLMConfig.BASE_URL = url
+                chain_factory._http_clients.clear()
+                chain_factory._chat_models.clear()
+                setup = total = 0.0
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for i in range(size):
+                        start = time.perf_counter()
+                        with session() as agent_executor:
+                            agent_executor.verbose = False
+                            ready = time.perf_counter()
+                            agent_executor.invoke({"input": f"你好 {i}"})
+                            agent_executor.verbose = True
+                        setup += ready - start
+                        total += time.perf_counter() - start
+                print(f"{label}: 准备 {setup / size * 1000:.2f}ms/请求，总耗时 {total / size * 1000:.1f}ms/请求，"
+                      f"模型请求 {stats['requests']} 次，连接 {len(stats['connections'])} 个")
+        print(f"池统计: {chain_factory.get_agent_pool().stats()}")
+    finally:
+        LLMConfig.BASE_URL = base_url
+
+
+def _react_respond(prompt: str) -> str:
+    """
+    模拟 ReAct 模型：Prompt 中已有记忆（工具的观察结果或预取的记忆段落）时直接回答，
+    否则先调用 search_memory；回答中只引用 Prompt 里出现过的记忆。
+    """
+    question, _, scratchpad = prompt.rpartition("Question: ")[2].partition("\nThought:")
+    context = scratchpad if "Observation:" in scratchpad else prompt.partition("Question: the input")[0]
+    known = [fact for fact in ("张伟", "蓝色") if fact in context]
+    if known or "Observation:" in scratchpad or "Relevant memories" in prompt:
+        return f"Thought: I now know the final answer\nFinal Answer: {'、'.join(known) or '不知道'}"
+    return f"Thought: 需要查询记忆\nAction: search_memory\nAction Input: {question.strip()}"
+
+
+def benchmark_prefetch(size: int = 20, latency: float = 0.3):
+    """
+    预取模式基准
+
+    模型为延迟 latency 秒的模拟 ReAct 接口，记忆为预先写入的本地模拟工具。对 size 个需要回忆信息
+    的问题，比较 ReAct 工具路径（模型先输出 search_memory 的 Action）与预取模式每轮的 LLM 调用次数、
+    耗时，以及回答中用到记忆的比例。
+    """
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    import chain_factory
+    from llm_config import LLMConfig
+    from memory_manager import memory_manager
+
+    questions = ["我叫什么名字？", "我最喜欢什么颜色？", "你还记得我的名字吗？", "我喜欢的颜色是什么？"]
+    print(f"===== 预取模式基准：{size} 轮对话，模型延迟 {latency * 1000:.0f}ms =====")
+    base_url = LLMConfig.BASE_URL
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), memory_manager.user_context("prefetch_bench"):
+            memory_manager.clear_memory()
+            memory_manager.add_memory("用户的名字叫张伟")
+            memory_manager.add_memory("用户最喜欢的颜色是蓝色")
+        for mode in ("react", "prefetch"):
+            with _chat_stub(latency, _react_respond) as (url, stats), \
+                    memory_manager.user_context("prefetch_bench"):
+                LLMConfig.BASE_URL = url
+                chain_factory._http_clients.clear()
+                chain_factory._chat_models.clear()
+                timings, recalled = [], 0
+                with contextlib.redirect_stdout(io.StringIO()):
+                    agent = chain_factory.create_agent_executor("mock", warmup=False, mode=mode)
+                    for i in range(size):
+                        start = time.perf_counter()
+                        output = agent.invoke({"input": questions[i % len(questions)]})["output"]
+                        timings.append(time.perf_counter() - start)
+                        recalled += output != "不知道"
+                timings.sort()
+                print(f"{mode}: 每轮 LLM 调用 {stats['requests'] / size:.1f} 次，"
+                      f"p50 {timings[len(timings) // 2] * 1000:.0f}ms，最大 {timings[-1] * 1000:.0f}ms，"
+                      f"用到记忆的回答 {recalled}/{size}")
+    finally:
+        LLMConfig.BASE_URL = base_url
+        with contextlib.redirect_stdout(io.StringIO()), memory_manager.user_context("prefetch_bench"):
+            memory_manager.clear_memory()
+
+
+BENCHMARKS = {
+    "vector": benchmark_vector_search,
+    "ann": benchmark_ann_search,
+    "concurrency": benchmark_concurrency,
+    "persistence": benchmark_persistence,
+    "sqlite": benchmark_sqlite,
+    "dedup": benchmark_dedup,
+    "eviction": benchmark_eviction,
+    "records": benchmark_records,
+    "cache": benchmark_query_cache,
+    "metrics": benchmark_metrics,
+    "openmemory_async": benchmark_openmemory_async,
+    "breaker": benchmark_circuit_breaker,
+    "write_behind": benchmark_write_behind,
+    "remote_cache": benchmark_remote_cache,
+    "federated": benchmark_federated,
+    "mem0_ingest": benchmark_mem0_ingest,
+    "startup": benchmark_startup,
+    "health": benchmark_health,
+    "agent_pool": benchmark_agent_pool,
+    "prefetch": benchmark_prefetch,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地记忆性能基准")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="要运行的基准")
+    parser.add_argument("--size", type=int, default=None, help="记忆条数")
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.size is not None:
+        kwargs["size"] = args.size
+    BENCHMARKS[args.name](**kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,76 @@ Chain 工厂模块
 
 功能：
 - 将LLM和Prompt模板组装成一个可执行的Chain
-- 集成 Mem0 和 OpenMemory MCP 工具来创建具有记忆功能的 Agent
+- 集成 Mem0、OpenMemory MCP 与 SQLite 工具来创建具有记忆功能的 Agent
+- federated 模式下搜索同时查询所有可用的记忆后端并合并结果
+- LangChain、各记忆后端及其依赖在首次使用时才导入，导入本模块只需几毫秒
+- 预热：记忆后端的导入、初始化与健康检查在后台线程中进行，主线程同时创建 LLM 与 Prompt；
+  程序启动时调用 warm_up() 可以更早开始
+- 相同 (模型, 温度) 的 ChatOpenAI 只创建一次，所有实例共用一个带连接池的 HTTP 客户端，
+  请求之间保持长连接
+- 服务端通过 agent_session() 从执行器池（见 agent_pool）中取用 Agent，
+  不必为每个请求重新选择后端和创建 Agent
+- 预取模式（AGENT_MODE=prefetch）：每轮对话开始时由本模块搜索记忆，并把按相关度排序的前 k 条
+  写入 Prompt 的记忆段落；省去模型先输出 search_memory 的 Action 这一轮调用，回忆信息只需一次 LLM 调用
 """
-from langchain_openai import ChatOpenAI
-from llm_config import get_llm_config
-from prompt_template import get_translation_prompt_template, get_agent_prompt_template
-from langchain.agents import create_react_agent, AgentExecutor
-from mem0_tools import get_mem0_tools, check_mem0_service
-from openmemory_tools import get_openmemory_tools, check_openmemory_service
-from custom_tools import get_mock_tools
 import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_config import get_llm_config
+
+# 模型服务的基础 URL → 共享的 HTTP 客户端
+_http_clients: Dict[str, Any] = {}
+# (模型, 温度) → 共享的 ChatOpenAI
+_chat_models: Dict[Tuple[str, float], Any] = {}
+_llm_lock = threading.Lock()
+
+def _get_http_client(config):
+    """返回访问 config.BASE_URL 的共享 HTTP 客户端，连接数由 LLM_MAX_CONNECTIONS 限制。"""
+    with _llm_lock:
+        client = _http_clients.get(config.BASE_URL)
+        if client is None:
+            import httpx
+            import openai
+            client = openai.DefaultHttpxClient(limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS))
+            _http_clients[config.BASE_URL] = client
+        return client
+
+def get_chat_model(model: str = None, temperature: float = 0.7):
+    """
+    返回共享的 ChatOpenAI 实例
+
+    (模型, 温度) 相同的调用返回同一个实例；ChatOpenAI 可以在多个线程中同时调用，
+    所有实例共用同一个 HTTP 客户端的连接池。
+
+    Args:
+        model: 模型名称，默认取配置中的 MODEL_NAME
+        temperature: 采样温度
+
+    Returns:
+        ChatOpenAI: 模型实例
+    """
+    config = get_llm_config()
+    key = (model or config.MODEL_NAME, temperature)
+    llm = _chat_models.get(key)
+    if llm is None:
+        from langchain_openai import ChatOpenAI
+        http_client = _get_http_client(config)
+        with _llm_lock:
+            llm = _chat_models.get(key)
+            if llm is None:
+                llm = _chat_models[key] = ChatOpenAI(
+                    model=key[0],
+                    base_url=config.BASE_URL,
+                    api_key=config.API_KEY,
+                    temperature=temperature,
+                    http_client=http_client
+                )
+    return llm
 
 def create_translation_chain():
     """
@@ -24,83 +84,289 @@ def create_translation_chain():
     Returns:
         A runnable sequence (chain).
     """
-    # 1. 获取LLM配置
-    config = get_llm_config()
-    
-    # 2. 创建LLM实例
-    llm = ChatOpenAI(
-        model=config.MODEL_NAME,
-        base_url=config.BASE_URL,
-        api_key=config.API_KEY,
-        temperature=0.7
-    )
+    from prompt_template import get_translation_prompt_template
+
+    # 1. 获取共享的LLM实例
+    llm = get_chat_model(temperature=0.7)
     
-    # 3. 获取Prompt模板
+    # 2. 获取Prompt模板
     prompt = get_translation_prompt_template()
     
-    # 4. 使用 LangChain Expression Language (LCEL) 将 prompt 和 llm "链接" 在一起
+    # 3. 使用 LangChain Expression Language (LCEL) 将 prompt 和 llm "链接" 在一起
     chain = prompt | llm
     
     return chain 
 
-def create_agent_executor():
+MEMORY_SERVICES = ("auto", "mem0", "openmemory", "sqlite", "mock", "federated")
+AGENT_MODES = ("react", "prefetch")
+
+def _print_tools(tools):
+    for tool in tools:
+        print(f"  - {tool.name}: {tool.description}")
+
+def _load_mem0_tools():
+    from mem0_tools import get_mem0_tools
+    print("--- Mem0 服务可用，加载 Mem0 工具... ---")
+    tools = get_mem0_tools()
+    print(f"--- 成功加载 {len(tools)} 个 Mem0 工具 ---")
+    _print_tools(tools)
+    return tools
+
+def _load_openmemory_tools():
+    from openmemory_tools import get_openmemory_tools
+    print("--- OpenMemory 服务可用，加载 OpenMemory 工具... ---")
+    tools = get_openmemory_tools()
+    print(f"--- 成功加载 {len(tools)} 个 OpenMemory 工具 ---")
+    _print_tools(tools)
+    return tools
+
+def _load_sqlite_tools():
+    from sqlite_tools import get_sqlite_tools
+    print("--- SQLite 记忆存储可用，加载 SQLite 工具... ---")
+    tools = get_sqlite_tools()
+    print(f"--- 成功加载 {len(tools)} 个 SQLite 工具 ---")
+    _print_tools(tools)
+    return tools
+
+def _load_mock_tools(config):
+    from custom_tools import get_mock_tools
+    mock_tools = get_mock_tools(config.LOCAL_SEARCH_MODE, config.USER_ID,
+                                config.LOCAL_MEMORY_DIR, config.LOCAL_MEMORY_FSYNC,
+                                config.LOCAL_DEDUP_THRESHOLD, config.LOCAL_MAX_MEMORIES_PER_USER,
+                                config.LOCAL_MAX_MEMORIES_TOTAL, config.LOCAL_EVICTION_POLICY,
+                                config.LOCAL_MEMORY_TTL)
+    print(f"--- 加载了 {len(mock_tools)} 个模拟工具 ---")
+    _print_tools(mock_tools)
+    return mock_tools
+
+# 记忆后端 → 显示名称与工具加载函数，选择的优先级见 _select_backend
+BACKEND_NAMES = {"mem0": "Mem0", "openmemory": "OpenMemory", "sqlite": "SQLite", "mock": "Mock"}
+BACKEND_LOADERS = {"mem0": _load_mem0_tools, "openmemory": _load_openmemory_tools,
+                   "sqlite": _load_sqlite_tools}
+
+def _use_federated_search(tools, config):
+    """将工具列表中的 search_memory 替换为联合搜索工具。"""
+    from federated_search import get_federated_search_tool
+    search_tool = get_federated_search_tool(config)
+    backends = ", ".join(search_tool.searcher.backends)
+    print(f"--- 联合搜索已启用，后端: {backends}（每个后端截止 {config.FEDERATED_SEARCH_DEADLINE}s） ---")
+    return [search_tool if tool.name == "search_memory" else tool for tool in tools]
+
+def _parse_mode(mode, config) -> str:
+    mode = (mode or config.AGENT_MODE or "react").lower()
+    if mode not in AGENT_MODES:
+        raise ValueError(f"不支持的 Agent 模式: {mode}")
+    return mode
+
+def _parse_memory_service(memory_service, config) -> Tuple[str, bool]:
+    """返回 (记忆服务, 是否联合搜索)，federated 按 auto 选择写入记忆的后端。"""
+    memory_service = (memory_service or config.MEMORY_SERVICE or "auto").lower()
+    if memory_service not in MEMORY_SERVICES:
+        raise ValueError(f"不支持的记忆服务: {memory_service}")
+    if memory_service == "federated":
+        return "auto", True
+    return memory_service, False
+
+def _select_backend(memory_service: str, config) -> str:
+    """
+    按指定服务或优先级选择记忆后端
+
+    指定的服务只检查该服务；auto 模式同时检查所有候选后端，共用 MEMORY_PROBE_DEADLINE 的截止时间，
+    优先级最高的健康后端一经确定就使用。健康状态由 backend_health 缓存并在后台刷新。
+
+    Returns:
+        str: "mem0"、"openmemory"、"sqlite"，或都不可用时的 "mock"
+
+    Raises:
+        RuntimeError: 指定的记忆服务不可用时
+    """
+    if memory_service == "mock":
+        return "mock"
+    from backend_health import get_health_monitor
+    if memory_service == "auto":
+        candidates = ["mem0", "openmemory"] + (["sqlite"] if config.SQLITE_MEMORY_PATH else [])
+    else:
+        candidates = [memory_service]
+    selected = get_health_monitor(config).select(candidates)
+    if selected is None and memory_service != "auto":
+        raise RuntimeError(f"指定的记忆服务 {BACKEND_NAMES[memory_service]} 不可用")
+    return selected or "mock"
+
+def _load_backend_tools(backend: str, federated: bool, config) -> Tuple[List, str, str]:
+    """加载选定后端的工具，返回 (工具列表, 使用的记忆服务名称, 后端)。"""
+    if backend == "mock":
+        tools = _load_mock_tools(config)
+    else:
+        tools = BACKEND_LOADERS[backend]()
+    memory_service_used = BACKEND_NAMES[backend]
+    if federated:
+        tools = _use_federated_search(tools, config)
+        memory_service_used += "（联合搜索）"
+    return tools, memory_service_used, backend
+
+def _load_memory_tools(memory_service: str, federated: bool, config) -> Tuple[List, str, str]:
+    """
+    按指定服务或优先级检查记忆后端并加载工具
+
+    Returns:
+        Tuple: (工具列表, 使用的记忆服务名称, 后端)
+
+    Raises:
+        RuntimeError: 指定的记忆服务不可用时
+    """
+    if memory_service == "mock":
+        print("--- 使用模拟记忆工具... ---")
+    backend = _select_backend(memory_service, config)
+    if backend == "mock" and memory_service != "mock":
+        print("--- 记忆服务不可用，使用模拟记忆工具... ---")
+        logging.warning("所有记忆服务都不可用，回退到简单的内存记忆功能")
+    return _load_backend_tools(backend, federated, config)
+
+_langchain_import_lock = threading.Lock()
+
+def _import_langchain():
+    """
+    导入记忆工具与 LLM 共用的 LangChain 核心
+
+    LangChain 内部有循环导入，多个线程同时导入时 CPython 会以 _DeadlockError 中断其中一个
+    （例如后端的健康检查因此失败）；各线程先在锁内完成这部分导入，之后的导入与网络请求仍可并行。
+    """
+    with _langchain_import_lock:
+        import langchain.tools  # noqa: F401
+
+# (记忆服务, 是否联合搜索) → 尚未被 create_agent_executor 取用的预热结果
+_warm_ups: Dict[Tuple[str, bool], Future] = {}
+_warm_up_lock = threading.Lock()
+
+def _start_warm_up(memory_service: str, federated: bool, config) -> Future:
+    """在守护线程中执行 _load_memory_tools，进程退出时不等待未完成的初始化。"""
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            _import_langchain()
+            future.set_result(_load_memory_tools(memory_service, federated, config))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="memory-warm-up", daemon=True).start()
+    return future
+
+def warm_up(memory_service: str = None) -> Future:
+    """
+    在后台线程中导入并初始化记忆后端
+
+    程序启动时调用，之后第一次以相同记忆服务调用 create_agent_executor 时直接使用预热的结果；
+    重复调用返回同一个 Future。
+
+    Args:
+        memory_service: 同 create_agent_executor
+
+    Returns:
+        Future: 结果为 (工具列表, 使用的记忆服务名称, 后端)
+    """
+    config = get_llm_config()
+    key = _parse_memory_service(memory_service, config)
+    with _warm_up_lock:
+        if key not in _warm_ups:
+            _warm_ups[key] = _start_warm_up(*key, config)
+        return _warm_ups[key]
+
+def create_agent_executor(memory_service: str = None, warmup: bool = None, mode: str = None):
     """
     创建并返回一个使用记忆工具的 Agent Executor。
 
-    优先级：Mem0 > OpenMemory MCP > 模拟工具
+    Args:
+        memory_service: 记忆服务 "auto"、"mem0"、"openmemory"、"sqlite"、"mock" 或 "federated"，
+            默认取配置中的 MEMORY_SERVICE。指定的服务不可用时抛出 RuntimeError。
+        warmup: 是否在后台线程中初始化记忆后端、同时创建 LLM 与 Prompt，默认取配置中的 MEMORY_WARMUP；
+            已调用 warm_up() 时总是使用其结果
+        mode: "react"（由模型调用 search_memory 工具）或 "prefetch"（预先搜索记忆并写入 Prompt），
+            默认取配置中的 AGENT_MODE。prefetch 模式返回先搜索记忆再调用执行器的 Runnable，
+            同样以 invoke({"input": ...}) 调用，结果中的 "output" 为回答
+
+    auto 模式的优先级：Mem0 > OpenMemory MCP > SQLite（配置了 SQLITE_MEMORY_PATH 时）> 模拟工具
+    federated 模式按 auto 的优先级选择写入记忆的后端，搜索则同时查询所有可用的后端。
     """
     print("--- 正在初始化 Agent 和工具... ---")
     
     # 获取LLM配置
     config = get_llm_config()
+    key = _parse_memory_service(memory_service, config)
+    mode = _parse_mode(mode, config)
+    if warmup is None:
+        warmup = config.MEMORY_WARMUP
+    with _warm_up_lock:
+        future = _warm_ups.pop(key, None)
+    if future is None and warmup:
+        future = _start_warm_up(*key, config)
     
-    # 创建LLM实例
-    llm = ChatOpenAI(
-        model=config.MODEL_NAME,
-        base_url=config.BASE_URL,
-        api_key=config.API_KEY,
-        temperature=0.7
-    )
-    
-    # 按优先级检查并获取工具
-    tools = []
-    memory_service_used = None
-    
-    # 1. 优先尝试 Mem0
-    if check_mem0_service():
-        print("--- Mem0 服务可用，加载 Mem0 工具... ---")
-        mem0_tools = get_mem0_tools()
-        tools.extend(mem0_tools)
-        memory_service_used = "Mem0"
-        print(f"--- 成功加载 {len(mem0_tools)} 个 Mem0 工具 ---")
-        for tool in mem0_tools:
-            print(f"  - {tool.name}: {tool.description}")
+    # 记忆后端在后台初始化期间，导入 LangChain 并创建 LLM 与 Prompt
+    _import_langchain()
+    from prompt_template import get_agent_prompt_template, get_prefetch_agent_prompt_template
     
-    # 2. 如果 Mem0 不可用，尝试 OpenMemory
-    elif check_openmemory_service():
-        print("--- OpenMemory 服务可用，加载 OpenMemory 工具... ---")
-        openmemory_tools = get_openmemory_tools()
-        tools.extend(openmemory_tools)
-        memory_service_used = "OpenMemory"
-        print(f"--- 成功加载 {len(openmemory_tools)} 个 OpenMemory 工具 ---")
-        for tool in openmemory_tools:
-            print(f"  - {tool.name}: {tool.description}")
-    
-    # 3. 如果都不可用，使用模拟工具
+    # 获取共享的LLM实例
+    llm = get_chat_model(temperature=0.7)
+
+    # 获取 Agent 的 Prompt 模板
+    prompt = get_prefetch_agent_prompt_template() if mode == "prefetch" else get_agent_prompt_template()
+
+    # 按指定服务或优先级获取工具
+    if future is not None:
+        tools, memory_service_used, backend = future.result()
     else:
-        print("--- 记忆服务不可用，使用模拟记忆工具... ---")
-        logging.warning("所有记忆服务都不可用，回退到简单的内存记忆功能")
-        mock_tools = get_mock_tools()
-        tools.extend(mock_tools)
-        memory_service_used = "Mock"
-        print(f"--- 加载了 {len(mock_tools)} 个模拟工具 ---")
-        for tool in mock_tools:
-            print(f"  - {tool.name}: {tool.description}")
+        tools, memory_service_used, backend = _load_memory_tools(*key, config)
 
     print(f"--- 使用的记忆服务: {memory_service_used} ---")
 
-    # 获取 Agent 的 Prompt 模板
-    prompt = get_agent_prompt_template()
+    if mode == "prefetch":
+        print(f"--- 预取模式：每轮对话预先搜索前 {config.PREFETCH_TOP_K} 条记忆 ---")
+        return _with_prefetch(llm, tools, prompt, backend, config)
+    return _build_agent_executor(llm, tools, prompt)
+
+def _prefetch_search(tools, backend: str):
+    """预取模式的搜索函数：联合搜索模式下使用联合搜索，否则直接搜索选定的后端。"""
+    from federated_search import FederatedSearchTool, get_backend_search
+    for tool in tools:
+        if isinstance(tool, FederatedSearchTool):
+            searcher = tool.searcher
+            return lambda query, limit: [item["memory"] for item in searcher.search(query, limit)["results"]]
+    return get_backend_search("local" if backend == "mock" else backend)
+
+def _with_prefetch(llm, tools, prompt, backend: str, config, stream_runnable: bool = True):
+    """
+    创建预取模式的 Agent
+
+    每轮对话开始时先搜索记忆（在调用方的上下文变量中运行，user_context() 指定的用户同样生效），
+    结果写入 Prompt 的 memories 段落，再调用执行器；节省的是模型调用 search_memory 的那一轮 LLM 调用。
+    search_memory 工具不再提供给模型，其余工具（如 add_memory）不变。
+    """
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+    search = _prefetch_search(tools, backend)
+    top_k = config.PREFETCH_TOP_K
+
+    def fetch_memories(inputs: Dict) -> str:
+        try:
+            memories = search(inputs["input"], top_k)[:top_k]
+        except Exception as e:
+            logging.warning(f"预取记忆失败，本轮不提供记忆: {e}")
+            memories = []
+        return "\n".join(f"- {memory}" for memory in memories) or "(none)"
+
+    tools = [tool for tool in tools if tool.name != "search_memory"]
+    agent_executor = _build_agent_executor(llm, tools, prompt, stream_runnable)
+    return RunnablePassthrough.assign(memories=RunnableLambda(fetch_memories)) | agent_executor
+
+def _build_agent_executor(llm, tools, prompt, stream_runnable: bool = True):
+    """
+    由 LLM、工具与 Prompt 创建 ReAct Agent 及其执行器
+
+    stream_runnable 为 False 时以非流式调用模型：openai 客户端在流式响应结束时直接关闭响应，
+    连接无法归还连接池，非流式调用则可以复用长连接。
+    """
+    from langchain.agents import create_react_agent, AgentExecutor
 
     # 创建 Agent
     agent = create_react_agent(llm, tools, prompt)
@@ -112,7 +378,88 @@ def create_agent_executor():
         verbose=True,
         handle_parsing_errors=True,
         max_iterations=10,  # 限制最大迭代次数
-        early_stopping_method="generate"  # 在生成答案后停止
+        early_stopping_method="generate",  # 在生成答案后停止
+        stream_runnable=stream_runnable
     )
     
-    return agent_executor 
\ No newline at end of file
+    return agent_executor
+
+# (记忆后端, 是否联合搜索) → 执行器池共用的 (工具列表, 使用的记忆服务名称, 后端)
+_pooled_tools: Dict[Tuple[str, bool], Tuple[List, str, str]] = {}
+_pooled_tools_lock = threading.Lock()
+_agent_pool = None
+_agent_pool_lock = threading.Lock()
+
+def _build_pooled_executor(key) -> Any:
+    """执行器池的创建函数，同一后端的工具只加载一次。"""
+    from prompt_template import get_agent_prompt_template, get_prefetch_agent_prompt_template
+    model, temperature, backend = key
+    backend, *options = backend.split("+")
+    federated = "federated" in options
+    config = get_llm_config()
+    with _pooled_tools_lock:
+        loaded = _pooled_tools.get((backend, federated))
+        if loaded is None:
+            loaded = _load_backend_tools(backend, federated, config)
+            _pooled_tools[(backend, federated)] = loaded
+    llm = get_chat_model(model, temperature)
+    if "prefetch" in options:
+        return _with_prefetch(llm, loaded[0], get_prefetch_agent_prompt_template(), backend, config,
+                              stream_runnable=False)
+    return _build_agent_executor(llm, loaded[0], get_agent_prompt_template(), stream_runnable=False)
+
+def get_agent_pool():
+    """
+    获取全局执行器池（单例模式），首次调用时注册指标
+
+    Returns:
+        AgentPool: 执行器池，每个键最多保留 AGENT_POOL_MAX_IDLE 个空闲执行器
+    """
+    global _agent_pool
+    if _agent_pool is None:
+        with _agent_pool_lock:
+            if _agent_pool is None:
+                from agent_pool import AgentPool
+                from memory_metrics import get_metrics
+                pool = AgentPool(_build_pooled_executor, get_llm_config().AGENT_POOL_MAX_IDLE)
+                get_metrics().register_gauges("agent_pool", pool.gauges)
+                _agent_pool = pool
+    return _agent_pool
+
+@contextmanager
+def agent_session(memory_service: str = None, user_id: Optional[str] = None,
+                  model: str = None, temperature: float = 0.7, mode: str = None):
+    """
+    从执行器池中取出一个 Agent 执行器处理一个请求
+
+    执行器按 (模型, 温度, 记忆后端) 复用；记忆后端每次按缓存的健康状态重新选择，
+    后端切换后自动改用新后端的执行器。执行器本身与用户无关：with 块在 memory_manager.user_context(user_id)
+    中执行，本地、SQLite、Mem0 与 OpenMemory 的记忆都按 user_id 读写，不同用户的请求可以共用执行器。
+    池中的执行器以非流式调用模型，以便复用长连接。
+
+        with agent_session(user_id="alice") as agent_executor:
+            agent_executor.invoke({"input": "..."})
+
+    Args:
+        memory_service: 同 create_agent_executor
+        user_id: 用户ID，默认取配置中的 USER_ID
+        model: 模型名称，默认取配置中的 MODEL_NAME
+        temperature: 采样温度
+        mode: 同 create_agent_executor
+
+    Yields:
+        AgentExecutor: with 块内由当前请求独占的执行器
+    """
+    from memory_manager import memory_manager
+
+    config = get_llm_config()
+    memory_service, federated = _parse_memory_service(memory_service, config)
+    backend = _select_backend(memory_service, config)
+    if federated:
+        backend += "+federated"
+    if _parse_mode(mode, config) == "prefetch":
+        backend += "+prefetch"
+    key = (model or config.MODEL_NAME, temperature, backend)
+    with get_agent_pool().acquire(key) as agent_executor, \
+            memory_manager.user_context(user_id or config.USER_ID):
+        yield agent_executor
@@ -0,0 +1,200 @@
+"""
+远程记忆服务的容错模块
+
+功能：
+- CircuitBreaker：熔断器。连续失败达到阈值后进入打开状态，期间的请求不发往服务器，
+  直接抛出 CircuitOpenError（只需一次加锁判断，微秒级）；冷却时间过后进入半开状态，
+  只放行少量探测请求，探测成功则恢复，失败则重新打开。
+- RetryBudget：重试预算。每个请求存入一小部分重试额度，每次重试消耗一个单位，
+  服务器整体出问题时重试量被限制在请求量的固定比例内，不会成倍放大压力。
+- backoff_delay：带随机抖动的指数退避，避免大量客户端在同一时刻重试。
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 导出为指标时的状态编号
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时拒绝请求"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}服务熔断中，{retry_in:.1f}秒后重新探测")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    每次请求前调用 acquire，请求结束后调用 record_success 或 record_failure
+    （服务器可达但返回 4xx 等业务错误时记为成功）。
+
+    Args:
+        name: 服务名称，用于日志和错误信息
+        failure_threshold: 进入打开状态所需的连续失败次数
+        reset_timeout: 打开后多少秒进入半开状态
+        half_open_max_calls: 半开状态下同时放行的探测请求数
+    """
+
+    def __init__(self, name: str = "OpenMemory", failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected_count = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        请求前检查是否放行
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下探测名额已满
+        """
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.rejected_count += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+                self._probes = 0
+                logging.info(f"{self.name}熔断器进入半开状态，开始探测")
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected_count += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes += 1
+
+    def record_success(self):
+        """记录一次成功的请求。"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logging.info(f"{self.name}服务已恢复，熔断器关闭")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        """记录一次失败的请求（连接失败、超时、5xx）。"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self.opened_count += 1
+                logging.warning(f"{self.name}服务连续失败 {self.consecutive_failures} 次，"
+                                f"熔断 {self.reset_timeout:.0f} 秒")
+
+    def release(self):
+        """请求被取消、没有结果时调用，只归还半开状态下占用的探测名额。"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def reset(self):
+        """强制关闭熔断器。"""
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probes = 0
+
+    def stats(self) -> Dict:
+        """
+        返回熔断器状态
+
+        Returns:
+            Dict: state、consecutive_failures、opened（打开次数）、rejected（拒绝的请求数）、
+                retry_in（距下次探测的秒数，未打开时为 0）
+        """
+        with self._lock:
+            retry_in = 0.0
+            if self.state == OPEN:
+                retry_in = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened": self.opened_count,
+                "rejected": self.rejected_count,
+                "retry_in": retry_in,
+            }
+
+    def gauges(self) -> Dict[str, float]:
+        """导出到指标的数值：状态编号 0 关闭 / 1 半开 / 2 打开。"""
+        stats = self.stats()
+        return {
+            "circuit_state": STATE_CODES[stats["state"]],
+            "circuit_consecutive_failures": stats["consecutive_failures"],
+            "circuit_opened_total": stats["opened"],
+            "circuit_rejected_total": stats["rejected"],
+        }
+
+
+class RetryBudget:
+    """
+    重试预算（令牌桶）
+
+    每个请求存入 ratio 个令牌，另按 min_per_second 随时间补充，使请求很少时也能重试；
+    每次重试消耗一个令牌，令牌不足时放弃重试。
+
+    Args:
+        ratio: 每个请求存入的令牌数，即重试量占请求量的最大比例
+        min_per_second: 每秒补充的令牌数
+        max_tokens: 令牌上限
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self.exhausted_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, extra: float = 0.0):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens,
+                           self._tokens + (now - self._updated) * self.min_per_second + extra)
+        self._updated = now
+
+    def record_request(self):
+        """记录一个新请求（不含重试）。"""
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        """尝试为一次重试消耗令牌，预算不足时返回 False。"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.exhausted_count += 1
+            return False
+
+
+def backoff_delay(attempt: int, base: float = 0.1, cap: float = 2.0) -> float:
+    """
+    第 attempt 次重试（从 1 开始）前的等待秒数
+
+    在 [0, min(cap, base * 2^(attempt-1))] 内均匀取值（完全抖动）。
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -4,6 +4,7 @@
 功能：
 - 定义一个或多个供 LangChain Agent 使用的自定义工具。
 """
+from typing import Optional
 from langchain.agents import tool
 from memory_manager import memory_manager
 
@@ -13,27 +14,57 @@ def add_memory(data: str) -> str:
     一个用于记录和储存信息的工具。
     当你需要记住新的事实、数据或用户偏好时使用它。
     """
-    memory_manager.add_memory(data)
+    if not memory_manager.add_memory(data):
+        return f"已记住过相同的信息，无需重复记录: '{data}'"
     return f"已成功记住信息: '{data}'"
 
 @tool
-def search_memory(query: str) -> str:
+def search_memory(query: str, limit: int = 10, min_score: Optional[float] = None) -> str:
     """
     一个用于从记忆中搜索和回忆信息的工具。
     当你需要回答关于过去对话或已知事实的问题时使用它。
     """
-    memories = memory_manager.search_memory(query)
+    memories = memory_manager.search_memory(query, limit=limit, min_score=min_score)
     if not memories:
         return "在我的记忆中没有找到相关信息。"
     # 将搜索结果格式化为字符串返回给Agent
     result = "从记忆中找到以下相关信息：\n" + "\n".join([f"- {mem}" for mem in memories])
     return result
 
-def get_mock_tools():
+def get_mock_tools(search_mode: str = None, user_id: str = None,
+                   data_dir: str = None, fsync_policy: str = "batch",
+                   dedup_threshold: float = None, max_per_user: int = None,
+                   max_total: int = None, eviction_policy: str = "lru", ttl: float = None):
     """
     获取模拟记忆工具列表
     
+    Args:
+        search_mode: 本地记忆的搜索模式 "keyword"、"bm25" 或 "vector"，
+            为空时保持当前设置；选择 "vector" 但无法启用时回退到 "bm25"
+        user_id: 未通过 memory_manager.user_context() 指定用户时使用的默认用户ID
+        data_dir: 持久化数据目录，为空时记忆只保存在内存中
+        fsync_policy: 持久化日志的 fsync 策略 "always"、"batch" 或 "os"
+        dedup_threshold: 写入时近似去重的 Jaccard 相似度阈值，为空时不去重
+        max_per_user: 每个用户的记忆条数上限，为空时不限制
+        max_total: 所有用户合计的记忆条数上限，为空时不限制
+        eviction_policy: 超出上限时的淘汰策略 "lru"、"ttl" 或 "importance"
+        ttl: "ttl" 策略下记忆的存活秒数
+    
     Returns:
         list: 工具列表
     """
+    if user_id:
+        memory_manager.default_user_id = user_id
+    if data_dir and not memory_manager.persistence_enabled:
+        memory_manager.enable_persistence(data_dir, fsync_policy)
+    if dedup_threshold:
+        memory_manager.enable_dedup(dedup_threshold)
+    if eviction_policy == "ttl" and ttl:
+        memory_manager.set_capacity(max_per_user, max_total, "ttl", ttl=ttl)
+    elif max_per_user or max_total:
+        memory_manager.set_capacity(max_per_user, max_total, eviction_policy)
+    if search_mode == "vector" and not memory_manager.enable_vector_search():
+        search_mode = "bm25"
+    if search_mode:
+        memory_manager.search_mode = search_mode
     return [add_memory, search_memory] 
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+联合搜索模块
+
+功能：
+- 同时向所有已配置的记忆后端（Mem0、OpenMemory、SQLite、本地内存）发起搜索，
+  每个后端有各自的截止时间，截止时还没返回的后端被忽略，总耗时约等于最慢的一个（不超过截止时间），
+  而不是各后端耗时之和。
+- 按倒数排名融合（RRF）合并各后端的排序结果：记忆在每个后端的排名 r 贡献 1 / (60 + r)，
+  多个后端都找到的记忆排在前面；文本规范化后相同的记忆只保留一条，并记录其来源。
+- 有调用超过截止时间仍未返回的后端视为挂起，本次跳过（状态为 hung）；并发调用数达到
+  每个后端的上限（默认按线程池大小均分）时同样跳过（状态为 busy），挂起的后端不会占满线程池，
+  其他用户的并发搜索也不会因为一个尚未返回的正常调用而被跳过。
+- 各后端在调用方的上下文变量中执行，memory_manager.user_context() 指定的用户同样生效。
+- FederatedSearchTool 可替换 Agent 的 search_memory 工具（MEMORY_SERVICE=federated）。
+"""
+import contextvars
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Type
+
+from langchain.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from memory_metrics import get_metrics
+from search_cache import normalize_query
+
+# 后端搜索函数：(查询, 数量上限) → 按相关度降序的记忆文本
+SearchFunction = Callable[[str, int], List[str]]
+
+# 倒数排名融合的平滑常数
+RRF_K = 60
+
+# 联合搜索线程池的线程数
+MAX_WORKERS = 16
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="federated-search")
+    return _executor
+
+
+def parse_remote_results(response: str) -> List[str]:
+    """
+    从 Mem0 / OpenMemory 客户端返回的 JSON 字符串中取出记忆文本
+
+    Raises:
+        Exception: 客户端返回的是错误信息而不是 JSON 时
+    """
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError:
+        raise Exception(response)
+    if isinstance(data, dict):
+        data = data.get("results", data.get("memories", []))
+    if not isinstance(data, list):
+        return []
+    memories = []
+    for item in data:
+        text = (item.get("memory") or item.get("text")) if isinstance(item, dict) else item
+        if isinstance(text, str) and text:
+            memories.append(text)
+    return memories
+
+
+class FederatedSearcher:
+    """
+    多后端联合搜索
+
+    Args:
+        backends: 后端名称 → 搜索函数，按优先级排列（得分相同时优先级高的在前）
+        deadline: 默认的每个后端截止时间（秒）
+        deadlines: 个别后端的截止时间（秒）
+        max_inflight: 每个后端同时进行的调用数上限，默认为线程池大小按后端数均分
+    """
+
+    def __init__(self, backends: Dict[str, SearchFunction], deadline: float = 2.0,
+                 deadlines: Optional[Dict[str, float]] = None, max_inflight: Optional[int] = None):
+        self.backends = dict(backends)
+        self.deadline = deadline
+        self.deadlines = dict(deadlines or {})
+        self.max_inflight = max_inflight or max(1, MAX_WORKERS // max(1, len(self.backends)))
+        # 后端 → {调用编号: 截止时刻}，记录尚未返回的调用
+        self._inflight: Dict[str, Dict[int, float]] = {name: {} for name in self.backends}
+        self._call_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, call_id: int, search: SearchFunction, query: str,
+              limit: int) -> List[str]:
+        try:
+            return search(query, limit)
+        finally:
+            with self._lock:
+                del self._inflight[name][call_id]
+
+    def search(self, query: str, limit: int = 10) -> Dict:
+        """
+        联合搜索
+
+        Args:
+            query: 搜索查询
+            limit: 合并后返回的最大数量，也是向每个后端请求的数量
+
+        Returns:
+            Dict: {"results": [{"memory", "score", "backends"}, ...],
+                   "backends": {后端: {"status": ok/timeout/error/hung/busy, "latency", "count", "error"}}}
+        """
+        with get_metrics().track("federated", "search_memory") as span:
+            span.set_payload(query)
+            start = time.monotonic()
+            executor = _get_executor()
+            futures = {}
+            deadlines = {}
+            report: Dict[str, Dict] = {}
+            for name, search in self.backends.items():
+                deadline = start + self.deadlines.get(name, self.deadline)
+                with self._lock:
+                    calls = self._inflight[name]
+                    if any(expires <= start for expires in calls.values()):
+                        report[name] = {"status": "hung"}
+                        continue
+                    if len(calls) >= self.max_inflight:
+                        report[name] = {"status": "busy"}
+                        continue
+                    call_id = next(self._call_ids)
+                    calls[call_id] = deadline
+                # 在调用方的上下文中执行，保留 memory_manager.user_context() 等上下文变量
+                context = contextvars.copy_context()
+                future = executor.submit(context.run, self._call, name, call_id, search, query, limit)
+                futures[future] = name
+                deadlines[future] = deadline
+            ranked: Dict[str, List[str]] = {}
+            pending = set(futures)
+            while pending:
+                timeout = max(min(deadlines[future] for future in pending) - time.monotonic(), 0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future in done:
+                    name = futures[future]
+                    latency = now - start
+                    error = future.exception()
+                    if error is not None:
+                        report[name] = {"status": "error", "latency": latency, "error": str(error)}
+                    else:
+                        ranked[name] = future.result()
+                        report[name] = {"status": "ok", "latency": latency,
+                                        "count": len(ranked[name])}
+                for future in [future for future in pending if deadlines[future] <= now]:
+                    pending.discard(future)
+                    report[futures[future]] = {"status": "timeout", "latency": now - start}
+
+            report = {name: report[name] for name in self.backends}
+            results = self.merge(ranked, limit)
+            span.set_results(len(results))
+            if any(item["status"] != "ok" for item in report.values()):
+                logging.warning(f"联合搜索部分后端未返回结果: "
+                                f"{ {name: item['status'] for name, item in report.items()} }")
+            return {"results": results, "backends": report}
+
+    def merge(self, ranked: Dict[str, List[str]], limit: int) -> List[Dict]:
+        """按倒数排名融合合并各后端的结果并去重。"""
+        order = {name: index for index, name in enumerate(self.backends)}
+        merged: Dict[str, Dict] = {}
+        for name in sorted(ranked, key=order.get):
+            for rank, memory in enumerate(ranked[name], 1):
+                key = normalize_query(memory)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = {"memory": memory, "score": 0.0, "backends": []}
+                if name not in entry["backends"]:
+                    entry["score"] += 1 / (RRF_K + rank)
+                    entry["backends"].append(name)
+        # 字典保持插入顺序，sorted 稳定：得分相同时优先级高的后端的结果在前
+        return sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)[:limit]
+
+
+def get_backend_search(name: str) -> SearchFunction:
+    """
+    返回一个后端的搜索函数
+
+    Args:
+        name: "mem0"、"openmemory"、"sqlite" 或 "local"（本地内存，按 BM25 或已启用的向量模式排序）
+
+    Returns:
+        SearchFunction: (查询, 数量上限) → 按相关度降序的记忆文本
+    """
+    if name == "mem0":
+        from mem0_tools import get_mem0_client
+        return lambda query, limit: parse_remote_results(get_mem0_client().search_memory(query, limit))
+    if name == "openmemory":
+        from openmemory_client import get_openmemory_client
+        return lambda query, limit: parse_remote_results(get_openmemory_client().search_memory(query, limit))
+    if name == "sqlite":
+        from sqlite_tools import get_sqlite_store
+        return lambda query, limit: get_sqlite_store().search_memory(query, limit)
+    if name == "local":
+        from memory_manager import memory_manager
+        # 关键词模式按写入顺序返回匹配的记忆，调用方需要的是按相关度排序的前 limit 条
+        return lambda query, limit: memory_manager.search_memory(
+            query, limit=limit, mode="bm25" if memory_manager.search_mode == "keyword" else None)
+    raise ValueError(f"不支持的记忆后端: {name}")
+
+
+def get_federated_backends(config) -> Dict[str, SearchFunction]:
+    """
+    返回当前可用的后端，按 Mem0 > OpenMemory > SQLite > 本地内存 的优先级排列
+
+    Mem0 与 OpenMemory 需通过健康检查，SQLite 需配置 SQLITE_MEMORY_PATH，本地内存总是可用；
+    健康检查同时进行并使用 backend_health 缓存的状态。
+    """
+    from backend_health import get_health_monitor
+    candidates = ["mem0", "openmemory"] + (["sqlite"] if config.SQLITE_MEMORY_PATH else [])
+    healthy = get_health_monitor(config).healthy(candidates)
+    return {name: get_backend_search(name) for name in healthy + ["local"]}
+
+
+class FederatedSearchInput(BaseModel):
+    """联合搜索工具的输入参数"""
+    query: str = Field(description="搜索查询，用于查找相关的记忆内容")
+
+
+class FederatedSearchTool(BaseTool):
+    """同时从所有记忆后端搜索的工具"""
+    name: str = "search_memory"
+    description: str = ("用于搜索已存储的记忆信息。每当用户提问时都应该调用此工具，"
+                        "以查找可能相关的历史信息和偏好。这有助于提供更个性化的回答。")
+    args_schema: Type[BaseModel] = FederatedSearchInput
+    searcher: FederatedSearcher
+    limit: int = 10
+
+    def _run(self, query: str) -> str:
+        """执行联合搜索"""
+        try:
+            response = self.searcher.search(query, self.limit)
+        except Exception as e:
+            error_msg = f"搜索记忆时发生错误: {e}"
+            logging.error(error_msg)
+            return error_msg
+        if not response["results"]:
+            return "在我的记忆中没有找到相关信息。"
+        lines = [f"- {item['memory']}（来源: {', '.join(item['backends'])}）"
+                 for item in response["results"]]
+        return "从记忆中找到以下相关信息：\n" + "\n".join(lines)
+
+
+def get_federated_search_tool(config) -> FederatedSearchTool:
+    """
+    创建联合搜索工具
+
+    Args:
+        config: LLMConfig，截止时间取 FEDERATED_SEARCH_DEADLINE，
+            每个后端的并发调用上限取 FEDERATED_SEARCH_MAX_INFLIGHT
+
+    Returns:
+        FederatedSearchTool: 工具实例
+    """
+    searcher = FederatedSearcher(get_federated_backends(config), config.FEDERATED_SEARCH_DEADLINE,
+                                 max_inflight=config.FEDERATED_SEARCH_MAX_INFLIGHT)
+    return FederatedSearchTool(searcher=searcher)
@@ -19,10 +19,57 @@ class LLMConfig:
     BASE_URL = "https://openrouter.ai/api/v1"
     MODEL_NAME = "openrouter/auto"
     
+    # Agent 模式：react 由模型调用 search_memory 工具；prefetch 预先搜索记忆并写入 Prompt
+    AGENT_MODE = os.getenv("AGENT_MODE", "react")  # react / prefetch
+    PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K") or 5)  # 预取模式写入 Prompt 的记忆条数
+    
+    # 所有 ChatOpenAI 共用的 HTTP 连接池大小
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS") or 100)
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS") or 20)
+    # 执行器池中每个 (模型, 温度, 记忆后端) 最多保留的空闲 AgentExecutor 数
+    AGENT_POOL_MAX_IDLE = int(os.getenv("AGENT_POOL_MAX_IDLE") or 8)
+    
     # OpenMemory MCP 配置
     OPENMEMORY_API_BASE = os.getenv("OPENMEMORY_API_BASE", "http://localhost:8765")
     USER_ID = os.getenv("USER_ID", "default_user")
     CLIENT_NAME = os.getenv("CLIENT_NAME", "langchain_agent")
+    OPENMEMORY_CONNECT_TIMEOUT = float(os.getenv("OPENMEMORY_CONNECT_TIMEOUT") or 3)  # 秒
+    OPENMEMORY_READ_TIMEOUT = float(os.getenv("OPENMEMORY_READ_TIMEOUT") or 10)  # 秒
+    # 后台批量写入：添加记忆时只入队，由后台线程合并成批写出
+    OPENMEMORY_WRITE_BEHIND = os.getenv("OPENMEMORY_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+    OPENMEMORY_WRITE_BATCH_SIZE = int(os.getenv("OPENMEMORY_WRITE_BATCH_SIZE") or 16)
+    OPENMEMORY_WRITE_FLUSH_INTERVAL = float(os.getenv("OPENMEMORY_WRITE_FLUSH_INTERVAL") or 0.5)  # 秒
+    
+    # 本地记忆配置
+    LOCAL_SEARCH_MODE = os.getenv("LOCAL_SEARCH_MODE", "keyword")  # keyword / bm25 / vector
+    LOCAL_MEMORY_DIR = os.getenv("LOCAL_MEMORY_DIR")  # 为空时不持久化
+    LOCAL_MEMORY_FSYNC = os.getenv("LOCAL_MEMORY_FSYNC", "batch")  # always / batch / os
+    # 写入时近似去重的相似度阈值（0~1），为空时不去重
+    LOCAL_DEDUP_THRESHOLD = float(os.getenv("LOCAL_DEDUP_THRESHOLD") or 0) or None
+    # 容量上限（条数），为空时不限制；超出后按淘汰策略删除
+    LOCAL_MAX_MEMORIES_PER_USER = int(os.getenv("LOCAL_MAX_MEMORIES_PER_USER") or 0) or None
+    LOCAL_MAX_MEMORIES_TOTAL = int(os.getenv("LOCAL_MAX_MEMORIES_TOTAL") or 0) or None
+    LOCAL_EVICTION_POLICY = os.getenv("LOCAL_EVICTION_POLICY", "lru")  # lru / ttl / importance
+    LOCAL_MEMORY_TTL = float(os.getenv("LOCAL_MEMORY_TTL") or 0) or None  # ttl 策略的存活秒数
+    
+    # Mem0 后台写入：添加记忆的事实抽取与写入在后台线程中执行
+    MEM0_ASYNC_INGEST = os.getenv("MEM0_ASYNC_INGEST", "").lower() in ("1", "true", "yes")
+    MEM0_INGEST_WORKERS = int(os.getenv("MEM0_INGEST_WORKERS") or 2)
+    MEM0_INGEST_QUEUE_SIZE = int(os.getenv("MEM0_INGEST_QUEUE_SIZE") or 100)
+    
+    # 记忆服务选择：auto 按 Mem0 > OpenMemory > SQLite > 本地内存 的优先级自动选择
+    MEMORY_SERVICE = os.getenv("MEMORY_SERVICE", "auto")  # auto / mem0 / openmemory / sqlite / mock / federated
+    SQLITE_MEMORY_PATH = os.getenv("SQLITE_MEMORY_PATH")  # 为空时 auto 模式不使用 SQLite
+    # federated 模式下每个后端的搜索截止时间（秒），截止时未返回的后端被忽略
+    FEDERATED_SEARCH_DEADLINE = float(os.getenv("FEDERATED_SEARCH_DEADLINE") or 2.0)
+    # federated 模式下每个后端同时进行的搜索数上限，为空时按线程池大小均分
+    FEDERATED_SEARCH_MAX_INFLIGHT = int(os.getenv("FEDERATED_SEARCH_MAX_INFLIGHT") or 0) or None
+    # 创建 Agent 时在后台线程中初始化记忆后端，同时在主线程中创建 LLM 与 Prompt
+    MEMORY_WARMUP = os.getenv("MEMORY_WARMUP", "1").lower() in ("1", "true", "yes")
+    # 并发健康检查的总截止时间（秒），截止时未返回的后端视为不可用
+    MEMORY_PROBE_DEADLINE = float(os.getenv("MEMORY_PROBE_DEADLINE") or 5.0)
+    # 健康状态的缓存秒数，后台监控线程定期刷新；0 为每次创建 Agent 都重新检查
+    MEMORY_HEALTH_INTERVAL = float(os.getenv("MEMORY_HEALTH_INTERVAL") or 30.0)
     
     @classmethod
     def validate(cls):
@@ -6,26 +6,103 @@ Mem0 集成工具模块
 - 搜索记忆工具
 - 列表记忆工具
 - 删除记忆工具
+
+客户端的添加、搜索、列表、删除操作记录到统一的指标（后端名为 "mem0"）；
+搜索结果经共享的 TTL 缓存（见 search_cache），重复的查询不再调用嵌入接口和向量库。
+开启后台写入（MEM0_ASYNC_INGEST=1）时，添加记忆的事实抽取与写入在后台线程中执行，
+工具立即返回；写入完成前的记忆会合并到搜索结果中。
+用户取 memory_manager.user_context() 中的当前用户，未设置时为配置的 USER_ID。
 """
 
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type, Optional, Dict, Any
+import atexit
 import logging
 import json
-from llm_config import get_llm_config
+import queue
+from llm_config import LLMConfig, get_llm_config
+from memory_manager import current_user_id
+from memory_metrics import get_metrics, count_results
+from search_cache import get_search_cache
+from write_behind import IngestionQueue, merge_pending
 
 class Mem0Client:
     """Mem0 客户端"""
     
-    def __init__(self):
-        """初始化 Mem0 客户端"""
-        self.config = get_llm_config()
-        self.user_id = self.config.USER_ID
+    def __init__(self, memory: Any = None):
+        """
+        初始化 Mem0 客户端
+        
+        Args:
+            memory: 已创建的 mem0 Memory（或接口相同的对象），为空时按配置创建
+        """
+        # 传入 memory 时不需要 LLM 的 API 密钥
+        self.config = get_llm_config() if memory is None else LLMConfig
+        self.default_user_id = self.config.USER_ID
         self.client_name = self.config.CLIENT_NAME
-        self._memory = None
-        self._is_healthy = False
-        self._initialize_memory()
+        self._memory = memory
+        self._is_healthy = memory is not None
+        self.search_cache = get_search_cache()
+        self._ingest_queue: Optional[IngestionQueue] = None
+        if memory is None:
+            self._initialize_memory()
+        if self.config.MEM0_ASYNC_INGEST:
+            self.enable_async_ingest(self.config.MEM0_INGEST_WORKERS, self.config.MEM0_INGEST_QUEUE_SIZE)
+    
+    def enable_async_ingest(self, workers: int = 2, max_pending: int = 100, submit_timeout: float = 5.0):
+        """
+        开启后台写入
+        
+        之后的 add_memory 把记忆交给后台工作线程执行 Memory.add，立即返回凭据；
+        队列已满时最多等待 submit_timeout 秒（背压），仍满则在当前线程同步写入。
+        进程退出时会等待已提交的记忆写完。
+        
+        Args:
+            workers: 工作线程数
+            max_pending: 队列容量
+            submit_timeout: 队列满时提交方最多等待的秒数
+        """
+        if self._ingest_queue is not None:
+            return
+        self.submit_timeout = submit_timeout
+        self._ingest_queue = IngestionQueue(lambda item: self._add(*item), workers, max_pending,
+                                            name="Mem0写入")
+        get_metrics().register_gauges("mem0", self._gauges)
+        atexit.register(self.close)
+    
+    def ingestion_status(self, ticket: int) -> Optional[Dict]:
+        """
+        查询后台写入的状态
+        
+        Returns:
+            Dict: ticket、status（queued / running / done / failed）、queued_seconds、run_seconds、error；
+                凭据不存在时返回 None
+        """
+        if self._ingest_queue is None:
+            return None
+        found = self._ingest_queue.get(ticket)
+        return found.to_dict() if found is not None else None
+    
+    def wait_ingested(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的后台写入全部完成，未开启后台写入时返回 True。"""
+        return self._ingest_queue is None or self._ingest_queue.drain(timeout)
+    
+    def close(self, timeout: Optional[float] = 30.0) -> bool:
+        """写完已提交的记忆并停止后台线程。"""
+        return self._ingest_queue is None or self._ingest_queue.close(timeout)
+    
+    def _gauges(self) -> Dict[str, float]:
+        stats = self._ingest_queue.stats()
+        return {
+            "ingest_queued": stats["queued"],
+            "ingest_running": stats["running"],
+            "ingest_lag_seconds": stats["lag_seconds"],
+            "ingest_last_lag_seconds": stats["last_lag_seconds"],
+            "ingest_done_total": stats["done"],
+            "ingest_failed_total": stats["failed"],
+            "ingest_cancelled_total": stats["cancelled"],
+        }
         
     def _initialize_memory(self):
         """初始化 mem0 Memory 实例"""
@@ -46,7 +123,7 @@ class Mem0Client:
             
             self._memory = Memory(config=config)
             self._is_healthy = True
-            logging.info(f"Mem0 客户端初始化完成 - 用户ID: {self.user_id}")
+            logging.info(f"Mem0 客户端初始化完成 - 用户ID: {self.default_user_id}")
             
         except Exception as e:
             logging.error(f"初始化 Mem0 客户端失败: {e}")
@@ -61,74 +138,135 @@ class Mem0Client:
                 self._memory = None
                 self._is_healthy = False
     
+    @property
+    def user_id(self) -> str:
+        """当前用户：memory_manager.user_context() 中的用户，未设置时为 default_user_id"""
+        return current_user_id() or self.default_user_id
+    
     def add_memory(self, text: str, metadata: Optional[Dict] = None) -> str:
-        """添加记忆"""
+        """添加记忆；开启后台写入时立即返回 {"status": "queued", "ticket": 凭据编号, ...}"""
+        user_id = self.user_id
         if not self._memory or not self._is_healthy:
+            with get_metrics().track("mem0", "add_memory", user_id) as span:
+                span.fail()
             return "错误: Mem0 客户端未正确初始化"
-        
+        if self._ingest_queue is not None:
+            try:
+                # 后台线程不在调用方的用户上下文中，用户随条目一起提交
+                ticket = self._ingest_queue.submit((text, metadata, user_id), timeout=self.submit_timeout)
+                self.search_cache.invalidate("mem0", user_id)
+                return json.dumps({"status": "queued", "ticket": ticket.id,
+                                   "pending": len(self._ingest_queue.pending())},
+                                  ensure_ascii=False, indent=2)
+            except (queue.Full, RuntimeError) as e:
+                logging.warning(f"Mem0 后台写入队列不可用，改为同步写入: {e!r}")
         try:
-            messages = [{"role": "user", "content": text}]
-            result = self._memory.add(
-                messages, 
-                user_id=self.user_id,
-                metadata=metadata or {"source": "langchain_agent", "client": self.client_name}
-            )
-            logging.info(f"成功添加记忆: {text[:50]}...")
-            return json.dumps(result, ensure_ascii=False, indent=2)
+            return json.dumps(self._add(text, metadata, user_id), ensure_ascii=False, indent=2)
         except Exception as e:
             error_msg = f"添加记忆失败: {e}"
             logging.error(error_msg)
-            self._is_healthy = False  # 标记为不健康
             return error_msg
     
+    def _add(self, text: str, metadata: Optional[Dict], user_id: str) -> Any:
+        """执行 Memory.add 并返回其结果，失败时抛出异常"""
+        with get_metrics().track("mem0", "add_memory", user_id) as span:
+            span.set_payload(text)
+            if not self._memory or not self._is_healthy:
+                raise RuntimeError("Mem0 客户端未正确初始化")
+            
+            try:
+                messages = [{"role": "user", "content": text}]
+                result = self._memory.add(
+                    messages, 
+                    user_id=user_id,
+                    metadata=metadata or {"source": "langchain_agent", "client": self.client_name}
+                )
+                logging.info(f"成功添加记忆: {text[:50]}...")
+                return result
+            except Exception:
+                self._is_healthy = False  # 标记为不健康
+                raise
+            finally:
+                self.search_cache.invalidate("mem0", user_id)
+    
     def search_memory(self, query: str, limit: int = 10) -> str:
         """搜索记忆"""
-        if not self._memory or not self._is_healthy:
-            return "错误: Mem0 客户端未正确初始化"
-        
-        try:
-            result = self._memory.search(
-                query=query,
-                user_id=self.user_id,
-                limit=limit
-            )
-            logging.info(f"搜索记忆完成，查询: {query}")
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        except Exception as e:
-            error_msg = f"搜索记忆失败: {e}"
-            logging.error(error_msg)
-            self._is_healthy = False  # 标记为不健康
-            return error_msg
+        with get_metrics().track("mem0", "search_memory", self.user_id) as span:
+            span.set_payload(query)
+            if not self._memory or not self._is_healthy:
+                span.fail()
+                return "错误: Mem0 客户端未正确初始化"
+            
+            try:
+                cache_key = self.search_cache.key("mem0", self.user_id, query, limit)
+                result = self.search_cache.get(cache_key)
+                if result is None:
+                    generation = self.search_cache.generation("mem0", self.user_id)
+                    result = self._memory.search(
+                        query=query,
+                        user_id=self.user_id,
+                        limit=limit
+                    )
+                    self.search_cache.put(cache_key, result, generation)
+                if self._ingest_queue is not None:
+                    pending = [text for text, _, user in reversed(self._ingest_queue.pending())
+                               if user == self.user_id]
+                    result = merge_pending(result, pending, limit, query)
+                span.set_results(count_results(result))
+                logging.info(f"搜索记忆完成，查询: {query}")
+                return json.dumps(result, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"搜索记忆失败: {e}"
+                logging.error(error_msg)
+                self._is_healthy = False  # 标记为不健康
+                return error_msg
     
     def list_memories(self) -> str:
         """列出所有记忆"""
-        if not self._memory or not self._is_healthy:
-            return "错误: Mem0 客户端未正确初始化"
-        
-        try:
-            result = self._memory.get_all(user_id=self.user_id)
-            logging.info("获取记忆列表完成")
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        except Exception as e:
-            error_msg = f"获取记忆列表失败: {e}"
-            logging.error(error_msg)
-            self._is_healthy = False  # 标记为不健康
-            return error_msg
+        with get_metrics().track("mem0", "list_memories", self.user_id) as span:
+            if not self._memory or not self._is_healthy:
+                span.fail()
+                return "错误: Mem0 客户端未正确初始化"
+            
+            try:
+                result = self._memory.get_all(user_id=self.user_id)
+                span.set_results(count_results(result))
+                logging.info("获取记忆列表完成")
+                return json.dumps(result, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"获取记忆列表失败: {e}"
+                logging.error(error_msg)
+                self._is_healthy = False  # 标记为不健康
+                return error_msg
     
     def delete_all_memories(self) -> str:
         """删除所有记忆"""
-        if not self._memory or not self._is_healthy:
-            return "错误: Mem0 客户端未正确初始化"
-        
-        try:
-            result = self._memory.delete_all(user_id=self.user_id)
-            logging.info("成功删除所有记忆")
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        except Exception as e:
-            error_msg = f"删除所有记忆失败: {e}"
-            logging.error(error_msg)
-            self._is_healthy = False  # 标记为不健康
-            return error_msg
+        with get_metrics().track("mem0", "delete_all_memories", self.user_id) as span:
+            if not self._memory or not self._is_healthy:
+                span.fail()
+                return "错误: Mem0 客户端未正确初始化"
+            
+            try:
+                # 排队中的记忆写入后也会被删除，直接取消；等待正在写入的完成，否则它们会在删除后写入
+                if self._ingest_queue is not None:
+                    user_id = self.user_id
+                    self._ingest_queue.cancel_queued(lambda item: item[2] == user_id)
+                    if not self.wait_ingested(timeout=30):
+                        logging.warning("Mem0后台写入未在30秒内完成，删除后仍可能写入")
+                try:
+                    result = self._memory.delete_all(user_id=self.user_id)
+                finally:
+                    self.search_cache.invalidate("mem0", self.user_id)
+                logging.info("成功删除所有记忆")
+                return json.dumps(result, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"删除所有记忆失败: {e}"
+                logging.error(error_msg)
+                self._is_healthy = False  # 标记为不健康
+                return error_msg
     
     def health_check(self) -> bool:
         """健康检查"""
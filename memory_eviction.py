@@ -0,0 +1,210 @@
+"""
+记忆淘汰策略模块
+
+功能：
+- 定义可插拔的淘汰策略接口：分区写入、访问、删除记忆时通知策略，
+  超出容量时由策略选出被淘汰的记忆。
+- LRU：淘汰最久未被搜索命中的记忆。
+- TTL：超过存活时间的记忆过期删除，容量不足时淘汰最早写入的记忆。
+- 重要性：淘汰重要性最低的记忆，同等重要性时淘汰最早写入的。
+
+所有策略的通知与选择都是 O(1)（重要性策略按固定档位分桶），
+过期检查只查看队首，摊还后同样为 O(1)。
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+
+class EvictionPolicy:
+    """淘汰策略基类，doc_id 为分区内的记忆ID"""
+
+    def on_add(self, doc_id: int, importance: float = None, created_at: float = None):
+        """记录一条新写入的记忆。"""
+        raise NotImplementedError
+
+    def on_access(self, doc_id: int):
+        """记录一次搜索命中。"""
+
+    def on_remove(self, doc_id: int):
+        """记忆已被删除。"""
+        raise NotImplementedError
+
+    def victim(self) -> Optional[int]:
+        """返回下一条应被淘汰的记忆ID，没有记忆时返回 None。"""
+        raise NotImplementedError
+
+    def expired(self, now: float) -> List[int]:
+        """返回已过期的记忆ID，默认不过期。"""
+        return []
+
+    def next_expiry(self) -> Optional[float]:
+        """返回最早一条记忆的过期时间，不会过期时返回 None。"""
+        return None
+
+    def remap(self, mapping: Dict[int, int]):
+        """分区重建后按 旧ID → 新ID 更新内部状态，不在 mapping 中的记忆视为已删除。"""
+        raise NotImplementedError
+
+    def clear(self):
+        """清空状态。"""
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    """淘汰最久未被搜索命中的记忆，新写入的记忆视为刚被访问"""
+
+    def __init__(self):
+        self._order: "OrderedDict[int, None]" = OrderedDict()
+
+    def on_add(self, doc_id: int, importance: float = None, created_at: float = None):
+        self._order[doc_id] = None
+
+    def on_access(self, doc_id: int):
+        if doc_id in self._order:
+            self._order.move_to_end(doc_id)
+
+    def on_remove(self, doc_id: int):
+        self._order.pop(doc_id, None)
+
+    def victim(self) -> Optional[int]:
+        return next(iter(self._order), None)
+
+    def remap(self, mapping: Dict[int, int]):
+        self._order = OrderedDict((mapping[doc_id], None) for doc_id in self._order if doc_id in mapping)
+
+    def clear(self):
+        self._order.clear()
+
+
+class TTLPolicy(EvictionPolicy):
+    """
+    按存活时间淘汰
+
+    记忆按写入顺序排队，过期检查只需查看队首；容量不足时淘汰最早写入的记忆。
+    被其他原因删除的记忆在出队时跳过（惰性删除）。
+
+    Args:
+        ttl: 存活时间（秒）
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._queue = deque()
+        self._created: Dict[int, float] = {}
+
+    def on_add(self, doc_id: int, importance: float = None, created_at: float = None):
+        created_at = time.time() if created_at is None else created_at
+        self._created[doc_id] = created_at
+        self._queue.append((created_at, doc_id))
+
+    def on_remove(self, doc_id: int):
+        self._created.pop(doc_id, None)
+
+    def _head(self) -> Optional[tuple]:
+        """丢弃队首已删除的记忆，返回当前队首。"""
+        queue = self._queue
+        while queue and self._created.get(queue[0][1]) != queue[0][0]:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def victim(self) -> Optional[int]:
+        head = self._head()
+        return head[1] if head else None
+
+    def next_expiry(self) -> Optional[float]:
+        head = self._head()
+        return head[0] + self.ttl if head else None
+
+    def expired(self, now: float) -> List[int]:
+        cutoff = now - self.ttl
+        result = []
+        for created_at, doc_id in self._queue:
+            if created_at > cutoff:
+                break
+            if self._created.get(doc_id) == created_at:
+                result.append(doc_id)
+        return result
+
+    def remap(self, mapping: Dict[int, int]):
+        self._queue = deque((created_at, mapping[doc_id]) for created_at, doc_id in self._queue
+                            if doc_id in mapping and self._created.get(doc_id) == created_at)
+        self._created = {mapping[doc_id]: created_at for doc_id, created_at in self._created.items()
+                         if doc_id in mapping}
+
+    def clear(self):
+        self._queue.clear()
+        self._created.clear()
+
+
+class ImportancePolicy(EvictionPolicy):
+    """
+    按重要性淘汰
+
+    重要性取值 0~1，按 levels 个档位分桶；每个桶按写入顺序保存记忆，
+    淘汰时从最低档位的桶中取最早写入的一条，选择代价只与档位数有关。
+
+    Args:
+        levels: 档位数
+        default_importance: 写入时未指定重要性时使用的值
+    """
+
+    def __init__(self, levels: int = 10, default_importance: float = 0.5):
+        self.levels = levels
+        self.default_importance = default_importance
+        self._buckets: List["OrderedDict[int, None]"] = [OrderedDict() for _ in range(levels)]
+        self._level: Dict[int, int] = {}
+
+    def _bucket_of(self, importance: float) -> int:
+        return min(self.levels - 1, max(0, int(importance * self.levels)))
+
+    def on_add(self, doc_id: int, importance: float = None, created_at: float = None):
+        if importance is None:
+            importance = self.default_importance
+        level = self._bucket_of(importance)
+        self._level[doc_id] = level
+        self._buckets[level][doc_id] = None
+
+    def on_remove(self, doc_id: int):
+        level = self._level.pop(doc_id, None)
+        if level is not None:
+            self._buckets[level].pop(doc_id, None)
+
+    def victim(self) -> Optional[int]:
+        for bucket in self._buckets:
+            if bucket:
+                return next(iter(bucket))
+        return None
+
+    def remap(self, mapping: Dict[int, int]):
+        self._buckets = [OrderedDict((mapping[doc_id], None) for doc_id in bucket if doc_id in mapping)
+                         for bucket in self._buckets]
+        self._level = {mapping[doc_id]: level for doc_id, level in self._level.items() if doc_id in mapping}
+
+    def clear(self):
+        for bucket in self._buckets:
+            bucket.clear()
+        self._level.clear()
+
+
+EVICTION_POLICIES = {
+    "lru": LRUPolicy,
+    "ttl": TTLPolicy,
+    "importance": ImportancePolicy,
+}
+
+
+def make_policy(name: str, **kwargs) -> EvictionPolicy:
+    """
+    按名称创建淘汰策略
+
+    Args:
+        name: "lru"、"ttl" 或 "importance"
+        **kwargs: 策略的构造参数，如 TTLPolicy 的 ttl
+
+    Returns:
+        EvictionPolicy: 策略实例
+    """
+    if name not in EVICTION_POLICIES:
+        raise ValueError(f"不支持的淘汰策略: {name}")
+    return EVICTION_POLICIES[name](**kwargs)
@@ -0,0 +1,257 @@
+"""
+记忆倒排索引模块
+
+功能：
+- 提供可插拔的分词器：中日韩文本切分为字符 n-gram，拉丁文本按单词切分。
+- 为 MemoryManager 维护“词元 → 记忆ID”的倒排表。
+- 添加/删除记忆时增量更新索引，搜索时对倒排表求交/并得到候选集。
+- BM25 索引增量维护文档频率与文档长度，用有界堆返回得分最高的 k 条。
+- 子串索引的候选集只是子串匹配的超集，调用方仍需做一次子串校验，
+  因此结果与线性扫描完全一致。
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Set
+
+# 中日韩字符范围：假名、CJK 扩展A、CJK 统一汉字、兼容汉字、韩文音节
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK_RANGES}]+)|([^\\W_{_CJK_RANGES}]+)")
+
+
+class Tokenizer:
+    """分词器基类"""
+
+    def tokenize(self, text: str) -> List[str]:
+        """将记忆文本切分为词元。"""
+        raise NotImplementedError
+
+    def query_tokens(self, text: str) -> List[str]:
+        """将查询切分为用于检索的词元，默认与记忆文本一致。"""
+        return self.tokenize(text)
+
+
+class WhitespaceTokenizer(Tokenizer):
+    """按空白切分的分词器，等价于原来的 query.lower().split()"""
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.lower().split()
+
+
+class CJKNgramTokenizer(Tokenizer):
+    """
+    中日韩感知的分词器
+
+    - 连续的中日韩字符切分为字符 n-gram（默认二元组，可配置为二元+三元）；
+      短于最小 n 的片段原样保留。
+    - 拉丁字母与数字按单词切分并转小写。
+    - 标点与空白作为分隔符丢弃。
+    """
+
+    def __init__(self, ngram_sizes: Sequence[int] = (2,)):
+        self.ngram_sizes = tuple(sorted(ngram_sizes))
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        min_n = self.ngram_sizes[0]
+        for cjk, word in _TOKEN_RE.findall(text.lower()):
+            if word:
+                tokens.append(word)
+                continue
+            if len(cjk) < min_n:
+                tokens.append(cjk)
+                continue
+            for n in self.ngram_sizes:
+                tokens.extend(cjk[i:i + n] for i in range(len(cjk) - n + 1))
+        return tokens
+
+
+class CharNgramTokenizer(Tokenizer):
+    """
+    子串索引使用的字符分词器
+
+    记忆文本切分为全部单字符与 n-gram；查询关键词长度 >= n 时取其 n-gram，
+    否则取其单字符。任何包含该关键词的记忆都必然包含这些片段。
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = n
+
+    def tokenize(self, text: str) -> List[str]:
+        n = self.n
+        grams = list(set(text))
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+        return grams
+
+    def query_tokens(self, text: str) -> List[str]:
+        n = self.n
+        if len(text) < n:
+            return list(set(text))
+        return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class InvertedIndex:
+    """
+    词元倒排索引
+
+    Args:
+        tokenizer: 用于切分记忆与查询的分词器，默认为字符 n-gram 分词器
+    """
+
+    def __init__(self, tokenizer: Tokenizer = None):
+        self.tokenizer = tokenizer or CharNgramTokenizer()
+        self._postings: Dict[str, Set[int]] = {}
+
+    def add(self, doc_id: int, text: str):
+        """将一条记忆加入索引。"""
+        postings = self._postings
+        for token in set(self.tokenizer.tokenize(text)):
+            bucket = postings.get(token)
+            if bucket is None:
+                postings[token] = {doc_id}
+            else:
+                bucket.add(doc_id)
+
+    def remove(self, doc_id: int, text: str):
+        """将一条记忆移出索引，text 须与添加时相同。"""
+        postings = self._postings
+        for token in set(self.tokenizer.tokenize(text)):
+            bucket = postings.get(token)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del postings[token]
+
+    def clear(self):
+        """清空索引。"""
+        self._postings.clear()
+
+    def intersect(self, tokens: Sequence[str]) -> Set[int]:
+        """返回包含全部词元的记忆ID集合。"""
+        postings: List[Set[int]] = []
+        for token in set(tokens):
+            bucket = self._postings.get(token)
+            if not bucket:
+                return set()
+            postings.append(bucket)
+        if not postings:
+            return set()
+
+        # 从最短的倒排表开始求交集，尽早缩小候选集
+        postings.sort(key=len)
+        result = set(postings[0])
+        for bucket in postings[1:]:
+            result.intersection_update(bucket)
+            if not result:
+                break
+        return result
+
+    def overlap(self, tokens: Sequence[str]) -> Counter:
+        """返回每条记忆命中的不同词元数量。"""
+        counts = Counter()
+        for token in set(tokens):
+            bucket = self._postings.get(token)
+            if bucket:
+                counts.update(bucket)
+        return counts
+
+    def candidates(self, keyword: str) -> Set[int]:
+        """
+        返回可能包含 keyword 的记忆ID集合
+
+        Args:
+            keyword: 非空关键词
+
+        Returns:
+            Set[int]: 匹配结果的超集
+        """
+        return self.intersect(self.tokenizer.query_tokens(keyword))
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+
+class BM25Index(InvertedIndex):
+    """
+    支持 BM25 排序的倒排索引
+
+    倒排表记录每条记忆中的词频；文档数、文档长度与总长度在添加/清空时增量维护，
+    文档频率即倒排表长度，因此打分无需重新统计整个集合。
+
+    Args:
+        tokenizer: 分词器，默认为中日韩 n-gram 分词器
+        k1: 词频饱和参数
+        b: 文档长度归一化参数
+    """
+
+    def __init__(self, tokenizer: Tokenizer = None, k1: float = 1.5, b: float = 0.75):
+        super().__init__(tokenizer or CJKNgramTokenizer())
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def add(self, doc_id: int, text: str):
+        """将一条记忆加入索引并更新统计信息。"""
+        tokens = self.tokenizer.tokenize(text)
+        postings = self._postings
+        for token, tf in Counter(tokens).items():
+            bucket = postings.get(token)
+            if bucket is None:
+                postings[token] = {doc_id: tf}
+            else:
+                bucket[doc_id] = tf
+        self._doc_lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: int, text: str):
+        """将一条记忆移出索引并更新统计信息，text 须与添加时相同。"""
+        postings = self._postings
+        for token in set(self.tokenizer.tokenize(text)):
+            bucket = postings.get(token)
+            if bucket is not None:
+                bucket.pop(doc_id, None)
+                if not bucket:
+                    del postings[token]
+        self._total_length -= self._doc_lengths.pop(doc_id, 0)
+
+    def clear(self):
+        """清空索引与统计信息。"""
+        super().clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def overlap(self, tokens: Sequence[str]) -> Counter:
+        """返回每条记忆命中的不同词元数量。"""
+        counts = Counter()
+        for token in set(tokens):
+            bucket = self._postings.get(token)
+            if bucket:
+                counts.update(bucket.keys())
+        return counts
+
+    def idf(self, token: str) -> float:
+        """返回词元的逆文档频率。"""
+        df = len(self._postings.get(token, ()))
+        n_docs = len(self._doc_lengths)
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, tokens: Sequence[str]) -> Dict[int, float]:
+        """返回每条候选记忆的 BM25 得分。"""
+        scores = defaultdict(float)
+        if not self._doc_lengths:
+            return scores
+
+        k1, b = self.k1, self.b
+        avg_length = self._total_length / len(self._doc_lengths) or 1.0
+        doc_lengths = self._doc_lengths
+        for token in set(tokens):
+            bucket = self._postings.get(token)
+            if not bucket:
+                continue
+            idf = self.idf(token)
+            for doc_id, tf in bucket.items():
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm)
+        return scores
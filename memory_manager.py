@@ -2,14 +2,403 @@
 简易内存管理模块
 
 功能：
-- 使用一个简单的列表来模拟记忆功能。
+- 使用一个简单的列表来模拟记忆功能，按用户分区存储。
 - 封装添加和搜索记忆的操作。
-- 支持智能关键词匹配搜索。
+- 支持智能关键词匹配搜索，同义词词典从文件加载并编译为 Aho-Corasick 自动机。
+- 通过倒排索引加速搜索，可切换回线性扫描以便校验结果。
+- 使用可插拔的分词器（中文按字符 n-gram）做词元重合匹配。
+- 支持 BM25 排序搜索，只返回得分最高的若干条记忆。
+- 可选的本地向量搜索（需要 numpy），无需联网即可做语义近似检索。
+- 线程安全：每个分区一把读写锁，搜索之间互不阻塞，写入按分区串行。
+- 可选的持久化：预写日志 + 定期快照，重启后快速恢复记忆。
+- 可选的近似去重：写入时用 MinHash/LSH 跳过与已有记忆几乎相同的内容，并支持离线压缩。
+- 可选的容量上限（每个用户与全局）与淘汰策略：LRU、TTL、重要性。
+- 记忆以列式记录保存（UTF-8 字节区 + array 列），附带写入时间、记录ID与来源。
+- 每个分区带有按写入代数失效的 LRU 搜索结果缓存，重复查询为 O(1)。
+- 添加、搜索、列表、清空操作记录到统一的指标（见 memory_metrics，默认关闭）。
 """
+import atexit
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from contextvars import ContextVar
+from typing import Dict, Optional
+from memory_index import InvertedIndex, BM25Index, Tokenizer, CharNgramTokenizer, CJKNgramTokenizer
+from memory_metrics import get_metrics
+from memory_records import RecordColumns
+from memory_synonyms import get_synonyms, keyword_matcher
+
+
+def expand_keywords(query: str) -> list:
+    """
+    根据同义词词典和分词结果扩展搜索关键词
+
+    词典见 memory_synonyms.get_synonyms()，一次扫描查询即可找出其中的全部关键词。
+
+    Returns:
+        list: 小写的关键词列表，已去重并跳过空白，保留原有顺序
+    """
+    query_lower = query.lower()
+
+    # 扩展搜索关键词
+    search_keywords = [query_lower]
+    search_keywords.extend(get_synonyms().expand(query_lower))
+
+    # 分词搜索
+    search_keywords.extend(query_lower.split())
+
+    return [kw for kw in dict.fromkeys(search_keywords) if kw.strip()]
+
+# 当前请求所属的用户，未设置时使用 MemoryManager.default_user_id
+_current_user_id: ContextVar[Optional[str]] = ContextVar("memory_user_id", default=None)
+
+
+def current_user_id() -> Optional[str]:
+    """
+    返回 MemoryManager.user_context() 设置的当前用户
+
+    其他记忆后端据此按调用解析用户，与本地内存使用同一个上下文。
+
+    Returns:
+        Optional[str]: 当前用户ID，不在 user_context 中时为 None
+    """
+    return _current_user_id.get()
+
+
+class ReadWriteLock:
+    """
+    写优先的读写锁
+
+    多个读者可同时持有锁；写者独占。有写者等待时新读者会排队，避免写者饥饿。
+    读锁不可重入：持有读锁时不要再次获取。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class MemoryPartition:
+    """
+    单个用户的记忆分区
+
+    每个分区拥有独立的列式记录存储、倒排索引、向量存储与统计信息，
+    搜索代价只与该用户自己的记忆量有关。读取数据时持有 lock 的读锁，
+    修改数据时持有写锁。
+
+    被淘汰的记忆在记录存储中置为墓碑（读取为 None），并立即从倒排索引中删除；
+    向量存储与去重索引在读取时跳过墓碑。墓碑数超过存活记忆数时整体重建，
+    使删除的摊还代价为 O(1)。
+
+    每次可能改变搜索结果的修改都会递增 generation。搜索结果缓存的键包含写入时的
+    generation，修改后旧条目不再命中，无需逐条清理，由 LRU 顺序自然淘汰。
+    """
+
+    # 墓碑数至少达到该值才重建，避免小分区频繁重建
+    REBUILD_MIN_TOMBSTONES = 1024
+
+    def __init__(self, user_id: str, tokenizer: Tokenizer, vector_store=None, dedup=None,
+                 policy=None):
+        self.user_id = user_id
+        self.memories = RecordColumns()
+        self.substring_index = InvertedIndex(CharNgramTokenizer())
+        self.token_index = BM25Index(tokenizer)
+        self.vector_store = vector_store
+        self.dedup = dedup
+        # 淘汰策略，未设置容量上限或 TTL 时为 None
+        self.policy = policy
+        # 最早一条记忆的过期时间，搜索前据此判断是否需要清理
+        self.expires_at: Optional[float] = None
+        self.tombstones = 0
+        # 已建立索引的记忆数；从快照批量加载后索引在首次搜索时补建
+        self.indexed_count = 0
+        self.lock = ReadWriteLock()
+        self._stats_lock = threading.Lock()
+        self.adds = 0
+        self.searches = 0
+        self.text_chars = 0
+        self.deduplicated = 0
+        self.compacted = 0
+        # 存活记忆的 UTF-8 文本字节数
+        self.text_bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        # 存活记忆数变化时调用 on_resize(partition, delta)，由 MemoryManager 维护合计数
+        self.on_resize = None
+        # 写入代数与搜索结果缓存：(查询参数..., generation) → (结果, 命中的记忆ID)
+        self.generation = 0
+        self.query_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def size(self) -> int:
+        """存活的记忆数。"""
+        return len(self.memories) - self.tombstones
+
+    def _resized(self, delta: int):
+        if delta and self.on_resize is not None:
+            self.on_resize(self, delta)
+
+    def add(self, data: str, embedder=None, importance: float = None, source: str = None):
+        """添加一条记忆并更新索引，调用方需持有写锁。"""
+        doc_id = len(self.memories)
+        if self.indexed_count == doc_id:
+            self.substring_index.add(doc_id, data.lower())
+            self.token_index.add(doc_id, data)
+            if self.vector_store is not None:
+                self.vector_store.add(embedder.embed([data]))
+            if self.dedup is not None:
+                self.dedup.add(doc_id, data)
+            self.indexed_count += 1
+        self.memories.append(data, source=source)
+        self.generation += 1
+        self.adds += 1
+        self.text_chars += len(data)
+        self.text_bytes += self.memories.text_size(doc_id)
+        if self.policy is not None:
+            self.policy.on_add(doc_id, importance, self.memories.created_at(doc_id))
+        self._resized(1)
+
+    def load(self, memories):
+        """
+        批量替换分区内容，暂不建立索引，调用方需持有写锁。
+
+        Args:
+            memories: 记忆文本列表，或保留了元数据的 RecordColumns
+        """
+        self.clear()
+        if not isinstance(memories, RecordColumns):
+            memories = RecordColumns.from_texts(memories)
+        self.memories = memories
+        self.text_chars = sum(map(len, memories))
+        self.text_bytes = memories.arena_size
+        if self.policy is not None:
+            for doc_id in range(len(memories)):
+                self.policy.on_add(doc_id, None, memories.created_at(doc_id))
+        self._resized(self.size)
+
+    def remove(self, doc_id: int) -> str:
+        """删除一条记忆并同步倒排索引，返回其文本，调用方需持有写锁。"""
+        data = self.memories[doc_id]
+        if doc_id < self.indexed_count:
+            self.substring_index.remove(doc_id, data.lower())
+            self.token_index.remove(doc_id, data)
+        self.memories.delete(doc_id)
+        self.generation += 1
+        self.tombstones += 1
+        self.text_chars -= len(data)
+        self.text_bytes -= self.memories.text_size(doc_id)
+        if self.policy is not None:
+            self.policy.on_remove(doc_id)
+        self._resized(-1)
+        return data
+
+    def rebuild_if_sparse(self, embedder=None) -> bool:
+        """墓碑数超过存活记忆数时去掉墓碑并重建索引，调用方需持有写锁。"""
+        if self.tombstones < max(self.REBUILD_MIN_TOMBSTONES, self.size):
+            return False
+        live = self.memories.live_ids()
+        mapping = {doc_id: new_id for new_id, doc_id in enumerate(live)}
+        policy, self.policy = self.policy, None
+        self.load(self.memories.select(live))
+        self.ensure_indexed(embedder)
+        if policy is not None:
+            policy.remap(mapping)
+            self.policy = policy
+        return True
+
+    def touch(self, doc_ids):
+        """记录搜索命中，供 LRU 等策略使用（读者之间可能并发调用）。"""
+        if self.policy is None:
+            return
+        with self._stats_lock:
+            for doc_id in doc_ids:
+                self.policy.on_access(doc_id)
+
+    def ensure_indexed(self, embedder=None, batch_size: int = 1024):
+        """为尚未建立索引的记忆补建索引，调用方需持有写锁。"""
+        start = self.indexed_count
+        for doc_id in range(start, len(self.memories)):
+            data = self.memories[doc_id]
+            if data is None:
+                continue
+            self.substring_index.add(doc_id, data.lower())
+            self.token_index.add(doc_id, data)
+            if self.dedup is not None:
+                self.dedup.add(doc_id, data)
+        if self.vector_store is not None:
+            # 墓碑编码为空文本以保持行号与记忆ID一致，搜索时跳过
+            for offset in range(start, len(self.memories), batch_size):
+                batch = [mem or "" for mem in self.memories[offset:offset + batch_size]]
+                self.vector_store.add(embedder.embed(batch))
+        self.indexed_count = len(self.memories)
+
+    def clear(self):
+        """清空分区内的记忆与索引，保留累计计数，调用方需持有写锁。"""
+        size = self.size
+        self.memories.clear()
+        self.substring_index.clear()
+        self.token_index.clear()
+        if self.vector_store is not None:
+            self.vector_store.clear()
+        if self.dedup is not None:
+            self.dedup.clear()
+        if self.policy is not None:
+            self.policy.clear()
+        self.expires_at = None
+        self.tombstones = 0
+        self.indexed_count = 0
+        self.text_chars = 0
+        self.text_bytes = 0
+        self.invalidate()
+        self._resized(-size)
+
+    def invalidate(self):
+        """使搜索结果缓存失效，调用方需持有写锁。"""
+        self.generation += 1
+        with self._stats_lock:
+            self.query_cache.clear()
+
+    def cache_get(self, key: tuple) -> Optional[tuple]:
+        """查找缓存的搜索结果并记录命中，读者之间可能并发调用。"""
+        with self._stats_lock:
+            entry = self.query_cache.get(key)
+            if entry is None:
+                self.cache_misses += 1
+                return None
+            self.query_cache.move_to_end(key)
+            self.cache_hits += 1
+        self.touch(entry[1])
+        return entry
+
+    def cache_put(self, key: tuple, results: list, doc_ids: list, capacity: int):
+        """缓存一次搜索的结果，超出容量时淘汰最久未用的条目。"""
+        with self._stats_lock:
+            self.query_cache[key] = (tuple(results), tuple(doc_ids))
+            self.query_cache.move_to_end(key)
+            while len(self.query_cache) > capacity:
+                self.query_cache.popitem(last=False)
+
+    def find_duplicate(self, data: str, embedder=None) -> Optional[int]:
+        """返回与 data 近似重复的记忆ID，未启用去重时返回 None，调用方需持有写锁。"""
+        if self.dedup is None:
+            return None
+        if self.indexed_count < len(self.memories):
+            self.ensure_indexed(embedder)
+        return self.dedup.find(data, self.memories.__getitem__)
+
+    def record_search(self):
+        """累计一次搜索（读者之间可能并发调用）。"""
+        with self._stats_lock:
+            self.searches += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """返回分区的统计信息。"""
+        with self.lock.read_lock():
+            return self._get_stats()
+
+    def _get_stats(self) -> Dict[str, int]:
+        return {
+            "memories": self.size,
+            "indexed": self.indexed_count,
+            "text_chars": self.text_chars,
+            "substring_index_terms": len(self.substring_index),
+            "token_index_terms": len(self.token_index),
+            "vectors": len(self.vector_store) if self.vector_store is not None else 0,
+            "adds": self.adds,
+            "searches": self.searches,
+            "deduplicated": self.deduplicated,
+            "compacted": self.compacted,
+            "text_bytes": self.text_bytes,
+            "storage_bytes": self.memories.nbytes,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "cache_entries": len(self.query_cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
 
 class MemoryManager:
     _instance = None
-    _memory_storage = []
+    # 用户ID → 记忆分区
+    _partitions: Dict[str, MemoryPartition] = {}
+    _partitions_lock = threading.Lock()
+    default_user_id = "default_user"
+    _tokenizer: Tokenizer = CJKNgramTokenizer()
+    # 为 False 时退回到逐条扫描，用于校验索引结果
+    use_index = True
+    # 查询词元在记忆中出现的最低比例，为 None 时只做子串匹配
+    min_token_overlap = 0.5
+    # 只靠词元重合判定匹配时至少命中的词元数：单个共同词元（如 "记忆"）不足以匹配
+    min_token_hits = 2
+    # 默认搜索模式："keyword" 返回全部匹配，"bm25"/"vector" 按相关度返回前 k 条
+    search_mode = "keyword"
+    default_limit = 10
+    # 向量模式下未指定 min_score 时使用的最低相似度
+    min_vector_score = 0.2
+    # 向量数超过该阈值后构建 IVF 近似索引，为 None 时始终精确检索
+    ann_threshold = 100_000
+    # IVF 查询扫描的聚类数：越大召回率越高、延迟越长
+    ann_n_probe = 8
+    # 每个分区缓存的搜索结果条数，为 0 时不缓存
+    query_cache_size = 256
+    # 启用向量搜索后才会创建
+    _embedder = None
+    # 启用持久化后才会创建；写入持有其读锁，生成快照时持有写锁
+    _persistence = None
+    _persist_lock = ReadWriteLock()
+    # 启用近似去重后才会设置，为 NearDuplicateDetector 的参数
+    _dedup_params = None
+    # 每个用户与全局的记忆条数上限，为 None 时不限制
+    max_memories_per_user: Optional[int] = None
+    max_memories_total: Optional[int] = None
+    # 调用 set_capacity 后才会设置，为每个分区创建淘汰策略
+    _policy_factory = None
+    # 全局容量检查串行执行，避免并发写入重复淘汰
+    _evict_lock = threading.Lock()
+    # 所有分区的存活记忆合计数，与按记忆数排序的惰性大顶堆 (-记忆数, 用户ID)：
+    # 分区大小每次变化都压入新条目，过时的条目在出堆时丢弃
+    _total_memories = 0
+    _size_heap: list = []
+    _size_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -17,61 +406,765 @@ class MemoryManager:
             cls._instance = super(MemoryManager, cls).__new__(cls)
         return cls._instance
 
-    def add_memory(self, data: str):
-        """向内存中添加信息。"""
+    def _resolve_user(self, user_id: Optional[str]) -> str:
+        """依次取显式参数、当前上下文用户与默认用户。"""
+        return user_id or current_user_id() or self.default_user_id
+
+    def _partition(self, user_id: Optional[str] = None) -> MemoryPartition:
+        """返回用户的记忆分区，不存在时创建。"""
+        user_id = self._resolve_user(user_id)
+        partition = self._partitions.get(user_id)
+        if partition is None:
+            with self._partitions_lock:
+                partition = self._partitions.get(user_id)
+                if partition is None:
+                    partition = MemoryPartition(user_id, self._tokenizer, self._new_vector_store(),
+                                                self._new_dedup(), self._new_policy())
+                    partition.on_resize = self._partition_resized
+                    self._partitions[user_id] = partition
+        return partition
+
+    def _indexed_partition(self, user_id: Optional[str] = None) -> MemoryPartition:
+        """返回索引已补建完整的用户分区，供搜索使用。"""
+        partition = self._partition(user_id)
+        if partition.indexed_count < len(partition.memories):
+            with partition.lock.write_lock():
+                partition.ensure_indexed(self._embedder)
+        # 没有写入时过期的记忆也不应再被搜到
+        expires_at = partition.expires_at
+        if expires_at is not None and expires_at <= time.time():
+            with self._persist_lock.read_lock():
+                with partition.lock.write_lock():
+                    self._apply_policy(partition)
+        return partition
+
+    @contextmanager
+    def user_context(self, user_id: str):
+        """
+        在 with 块内将默认用户切换为 user_id
+
+        工具函数无需显式传入用户ID，同一进程即可为多个用户服务：
+
+            with memory_manager.user_context("alice"):
+                agent_executor.invoke({"input": "..."})
+
+        块内可通过 current_user_id() 读取当前用户。
+        """
+        token = _current_user_id.set(user_id)
+        try:
+            yield
+        finally:
+            _current_user_id.reset(token)
+
+    def add_memory(self, data: str, user_id: str = None, importance: float = None,
+                   source: str = None) -> bool:
+        """
+        向内存中添加信息。
+
+        Args:
+            data: 记忆文本
+            user_id: 用户ID，默认取当前上下文用户
+            importance: 重要性（0~1），供 "importance" 淘汰策略使用
+            source: 来源名称（如写入记忆的客户端），随记录保存
+
+        Returns:
+            bool: 是否写入；启用去重且与已有记忆近似重复时返回 False
+        """
         print(f"--- 正在添加内存: '{data}' ---")
-        self._memory_storage.append(data)
+        partition = self._partition(user_id)
+        with get_metrics().track("local", "add_memory", partition.user_id) as span:
+            span.set_payload(data)
+            with self._persist_lock.read_lock():
+                with partition.lock.write_lock():
+                    duplicate = partition.find_duplicate(data, self._embedder)
+                    if duplicate is not None:
+                        partition.deduplicated += 1
+                        print(f"--- 与已有记忆重复，跳过: '{partition.memories[duplicate]}' ---")
+                        return False
+                    if self._persistence is not None:
+                        self._persistence.append_add(partition.user_id, data)
+                    partition.add(data, self._embedder, importance, source)
+                    self._apply_policy(partition)
+            self._enforce_total_capacity()
+            self._maybe_snapshot()
+        return True
 
-    def search_memory(self, query: str) -> list:
-        """从内存中搜索包含查询关键词的信息。"""
-        print(f"--- 正在搜索内存: '{query}' ---")
-        
-        # 改进的搜索逻辑：支持多种关键词匹配
-        query_lower = query.lower()
+    def enable_persistence(self, directory: str, fsync_policy: str = "batch",
+                           snapshot_interval: int = 100_000):
+        """
+        启用持久化，并从数据目录恢复记忆
+
+        应在添加记忆之前调用：目录中已有的用户分区会被快照与日志中的内容替换。
+        恢复时只加载文本，索引在各分区首次搜索时补建，因此启动耗时与索引规模无关。
+
+        Args:
+            directory: 数据目录
+            fsync_policy: "always"、"batch" 或 "os"，见 memory_persistence.MemoryLog
+            snapshot_interval: 日志累计多少条记录后在后台生成新快照
+        """
+        from memory_persistence import MemoryPersistence
+
+        persistence = MemoryPersistence(directory, fsync_policy, snapshot_interval)
+        loaded = persistence.load()
+        with self._persist_lock.write_lock():
+            if self._persistence is not None:
+                self._persistence.close()
+            for user_id, memories in loaded.items():
+                partition = self._partition(user_id)
+                with partition.lock.write_lock():
+                    partition.load(memories)
+            MemoryManager._persistence = persistence
+            for partition in list(self._partitions.values()):
+                with partition.lock.write_lock():
+                    self._apply_policy(partition)
+        self._enforce_total_capacity()
+        atexit.register(persistence.close)
+
+    @property
+    def persistence_enabled(self) -> bool:
+        """是否已启用持久化。"""
+        return self._persistence is not None
+
+    def _maybe_snapshot(self):
+        """日志累计到阈值时在后台线程生成快照。"""
+        persistence = self._persistence
+        if persistence is not None and persistence.should_snapshot() \
+                and not persistence.snapshot_lock.locked():
+            threading.Thread(target=self.snapshot, name="memory-snapshot", daemon=True).start()
+
+    def snapshot(self, wait: bool = False) -> bool:
+        """
+        立即生成快照
+
+        只在复制各分区记忆列表的瞬间阻塞写入，快照文件在锁外写出。
+
+        Args:
+            wait: 已有快照任务时等待其完成后再生成一次，而不是直接返回 False
+
+        Returns:
+            bool: 是否生成了快照（未启用持久化，或 wait 为 False 且已有快照任务时返回 False）
+        """
+        persistence = self._persistence
+        if persistence is None or not persistence.snapshot_lock.acquire(blocking=wait):
+            return False
+        try:
+            with self._persist_lock.write_lock():
+                seq = persistence.rotate()
+                with self._partitions_lock:
+                    partitions = list(self._partitions.values())
+                state = {partition.user_id: [mem for mem in partition.memories if mem is not None]
+                         for partition in partitions}
+            persistence.finish_snapshot(seq, state)
+            return True
+        finally:
+            persistence.snapshot_lock.release()
+
+    def close(self):
+        """落盘并关闭持久化日志。"""
+        if self._persistence is not None:
+            self._persistence.close()
+
+    def _new_vector_store(self):
+        """向量搜索已启用时，为新分区创建向量存储。"""
+        if self._embedder is None:
+            return None
+        from vector_index import VectorStore
+        return VectorStore(self._embedder.dim, ann_threshold=self.ann_threshold,
+                           n_probe=self.ann_n_probe)
+
+    def enable_vector_search(self, embedder=None, batch_size: int = 1024) -> bool:
+        """
+        启用本地向量搜索，并为所有分区的已有记忆批量生成向量
+
+        Args:
+            embedder: 嵌入器，默认为离线的 HashingEmbedder
+            batch_size: 批量编码的大小
+
+        Returns:
+            bool: 是否启用成功（缺少 numpy 时返回 False）
+        """
+        try:
+            from vector_index import HashingEmbedder, VectorStore
+        except ImportError as e:
+            logging.warning(f"无法启用向量搜索: {e}")
+            return False
+
+        embedder = embedder or HashingEmbedder()
+        # 持有分区表锁，期间不会有新分区以旧配置创建
+        with self._partitions_lock:
+            for partition in self._partitions.values():
+                with partition.lock.write_lock():
+                    # 未建索引的部分由 ensure_indexed 连同向量一起补建
+                    memories = [mem or "" for mem in partition.memories[:partition.indexed_count]]
+                    store = VectorStore(embedder.dim, initial_capacity=max(1024, len(memories)),
+                                        ann_threshold=self.ann_threshold, n_probe=self.ann_n_probe)
+                    for start in range(0, len(memories), batch_size):
+                        store.add(embedder.embed(memories[start:start + batch_size]))
+                    partition.vector_store = store
+                    partition.invalidate()
+            MemoryManager._embedder = embedder
+        return True
+
+    def _new_dedup(self):
+        """近似去重已启用时，为新分区创建检测器。"""
+        if self._dedup_params is None:
+            return None
+        from memory_dedup import NearDuplicateDetector
+        return NearDuplicateDetector(**self._dedup_params)
+
+    def enable_dedup(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16):
+        """
+        启用写入时的近似去重，并为所有分区的已有记忆建立检测索引
+
+        已有的重复记忆不会被删除，可调用 compact() 清理。
+
+        Args:
+            threshold: 判定为重复的最低 Jaccard 相似度（按字符二元组计算）
+            num_perm: MinHash 签名长度
+            bands: LSH 分段数，必须整除 num_perm
+        """
+        from memory_dedup import NearDuplicateDetector
+
+        params = {"threshold": threshold, "num_perm": num_perm, "bands": bands}
+        with self._partitions_lock:
+            for partition in self._partitions.values():
+                with partition.lock.write_lock():
+                    dedup = NearDuplicateDetector(**params)
+                    # 未建索引的部分由 ensure_indexed 一起补建
+                    for doc_id in range(partition.indexed_count):
+                        if partition.memories[doc_id] is not None:
+                            dedup.add(doc_id, partition.memories[doc_id])
+                    partition.dedup = dedup
+            MemoryManager._dedup_params = params
+
+    def compact(self, user_id: str = None, threshold: float = None) -> int:
+        """
+        离线压缩：合并近似重复的记忆，每组只保留最早的一条
+
+        结果与启用去重后逐条写入一致。日志中没有压缩记录，启用持久化时在返回前生成快照
+        （已有快照任务时等待其完成），返回时压缩结果已经落盘；快照完成前崩溃则恢复为压缩前的内容。
+
+        Args:
+            user_id: 只压缩该用户的分区，默认压缩全部分区
+            threshold: 判定为重复的最低 Jaccard 相似度，默认取 enable_dedup 的设置或 0.8
+
+        Returns:
+            int: 删除的记忆条数
+        """
+        from memory_dedup import NearDuplicateDetector
+
+        params = dict(self._dedup_params or {})
+        if threshold is not None:
+            params["threshold"] = threshold
+        if user_id is None:
+            with self._partitions_lock:
+                partitions = list(self._partitions.values())
+        else:
+            partitions = [self._partition(user_id)]
+
+        removed = 0
+        with self._persist_lock.read_lock():
+            for partition in partitions:
+                with partition.lock.write_lock():
+                    detector = NearDuplicateDetector(**params)
+                    kept = []
+                    kept_ids = []
+                    for doc_id, mem in enumerate(partition.memories):
+                        if mem is not None and detector.find(mem, kept.__getitem__) is None:
+                            detector.add(len(kept), mem)
+                            kept.append(mem)
+                            kept_ids.append(doc_id)
+                    count = partition.size - len(kept)
+                    if count:
+                        partition.load(partition.memories.select(kept_ids))
+                        partition.ensure_indexed(self._embedder)
+                        partition.compacted += count
+                        removed += count
+        print(f"--- 压缩完成，删除 {removed} 条重复记忆 ---")
+        if removed:
+            self.snapshot(wait=True)
+        return removed
+
+    def set_capacity(self, per_user: int = None, total: int = None, policy="lru", **policy_kwargs):
+        """
+        设置容量上限与淘汰策略，已超出上限的分区立即淘汰
+
+        超出每个用户的上限时由该用户分区的策略选出淘汰对象；超出全局上限时
+        从记忆最多的分区中淘汰（按记忆数维护的大顶堆选出，代价与用户数无关）。
+
+        Args:
+            per_user: 每个用户的记忆条数上限，为 None 时不限制
+            total: 所有用户合计的记忆条数上限，为 None 时不限制
+            policy: "lru"、"ttl"、"importance"、返回 EvictionPolicy 的工厂函数，
+                或为 None 以关闭淘汰（此时忽略容量上限）
+            **policy_kwargs: 传给策略的参数，如 ttl=86400
+
+        示例：
+            memory_manager.set_capacity(per_user=10_000, total=1_000_000, policy="lru")
+            memory_manager.set_capacity(policy="ttl", ttl=7 * 86400)
+        """
+        from memory_eviction import make_policy
+
+        # 保存为 partial：作为类属性访问时不会被绑定为方法
+        if policy is None:
+            factory = None
+        elif callable(policy):
+            factory = partial(policy, **policy_kwargs)
+        else:
+            factory = partial(make_policy, policy, **policy_kwargs)
+            factory()  # 尽早暴露参数错误
+
+        with self._persist_lock.read_lock():
+            with self._partitions_lock:
+                MemoryManager.max_memories_per_user = per_user
+                MemoryManager.max_memories_total = total
+                MemoryManager._policy_factory = factory
+                partitions = list(self._partitions.values())
+            for partition in partitions:
+                with partition.lock.write_lock():
+                    partition.policy = self._new_policy()
+                    if partition.policy is not None:
+                        for doc_id in partition.memories.live_ids():
+                            partition.policy.on_add(doc_id, None, partition.memories.created_at(doc_id))
+                    partition.expires_at = None
+                    self._apply_policy(partition)
+        self._enforce_total_capacity()
+
+    def _new_policy(self):
+        """设置了淘汰策略时，为新分区创建策略实例。"""
+        factory = self._policy_factory
+        return factory() if factory is not None else None
+
+    def _evict(self, partition: MemoryPartition, doc_id: int):
+        """删除一条记忆并写入日志，调用方需持有持久化读锁与分区写锁。"""
+        data = partition.remove(doc_id)
+        if self._persistence is not None:
+            self._persistence.append_delete(partition.user_id, data)
+
+    def _apply_policy(self, partition: MemoryPartition):
+        """删除过期记忆并把分区压到每用户上限以内，调用方需持有持久化读锁与分区写锁。"""
+        policy = partition.policy
+        if policy is None:
+            return
+        for doc_id in policy.expired(time.time()):
+            self._evict(partition, doc_id)
+            partition.expired += 1
+        cap = self.max_memories_per_user
+        while cap is not None and partition.size > cap:
+            self._evict(partition, policy.victim())
+            partition.evicted += 1
+        partition.rebuild_if_sparse(self._embedder)
+        partition.expires_at = policy.next_expiry()
+
+    def _partition_resized(self, partition: MemoryPartition, delta: int):
+        """分区记忆数变化时更新合计数与大顶堆，调用方持有该分区的写锁。"""
+        with self._size_lock:
+            MemoryManager._total_memories += delta
+            if partition.size > 0:
+                heapq.heappush(self._size_heap, (-partition.size, partition.user_id))
+            # 过时条目超过分区数时整理一次，堆的大小与用户数成正比，摊还代价为 O(1)
+            if len(self._size_heap) > 2 * len(self._partitions) + 64:
+                self._compact_size_heap()
+
+    def _compact_size_heap(self):
+        """丢弃堆中过时与重复的条目，调用方需持有 _size_lock。"""
+        seen = set()
+        entries = []
+        for neg_size, user_id in self._size_heap:
+            if user_id not in seen and self._partitions[user_id].size == -neg_size:
+                seen.add(user_id)
+                entries.append((neg_size, user_id))
+        heapq.heapify(entries)
+        MemoryManager._size_heap = entries
+
+    def _pop_largest(self) -> Optional[MemoryPartition]:
+        """弹出并返回记忆最多的分区，堆为空时返回 None，调用方需持有 _size_lock。"""
+        heap = self._size_heap
+        while heap:
+            neg_size, user_id = heapq.heappop(heap)
+            partition = self._partitions[user_id]
+            if partition.size == -neg_size:
+                return partition
+        return None
+
+    def _largest_partitions(self) -> tuple:
+        """
+        返回记忆最多的分区及第二大分区的记忆数，调用方需持有 _size_lock
+
+        Returns:
+            tuple: (分区, 第二大分区的记忆数)，没有记忆时为 (None, 0)
+        """
+        largest = self._pop_largest()
+        if largest is None:
+            return None, 0
+        runner_up = self._pop_largest()
+        while runner_up is largest:
+            runner_up = self._pop_largest()
+        for partition in (largest, runner_up):
+            if partition is not None:
+                heapq.heappush(self._size_heap, (-partition.size, partition.user_id))
+        return largest, runner_up.size if runner_up is not None else 0
+
+    def _enforce_total_capacity(self):
+        """合计记忆数超出全局上限时，从记忆最多的分区中淘汰。"""
+        cap = self.max_memories_total
+        if cap is None or self._policy_factory is None:
+            return
+        with self._evict_lock:
+            while True:
+                with self._size_lock:
+                    excess = self._total_memories - cap
+                    if excess <= 0:
+                        return
+                    partition, runner_up = self._largest_partitions()
+                if partition is None:
+                    return
+                # 每轮最多淘汰到与第二大的分区持平，各分区因此趋于相同大小
+                count = min(excess, max(1, partition.size - runner_up))
+                evicted = 0
+                with self._persist_lock.read_lock():
+                    with partition.lock.write_lock():
+                        policy = partition.policy
+                        while policy is not None and evicted < count:
+                            doc_id = policy.victim()
+                            if doc_id is None:
+                                break
+                            self._evict(partition, doc_id)
+                            evicted += 1
+                        partition.evicted += evicted
+                        if evicted:
+                            partition.rebuild_if_sparse(self._embedder)
+                            partition.expires_at = policy.next_expiry()
+                if not evicted:
+                    return
+
+    def memory_usage(self) -> Dict[str, Dict[str, int]]:
+        """
+        返回各用户的容量使用情况
+
+        Returns:
+            Dict: 用户ID → {"memories", "text_bytes", "storage_bytes", "evicted", "expired"}
+        """
+        with self._partitions_lock:
+            partitions = list(self._partitions.values())
+        usage = {}
+        for partition in partitions:
+            with partition.lock.read_lock():
+                usage[partition.user_id] = {
+                    "memories": partition.size,
+                    "text_bytes": partition.text_bytes,
+                    "storage_bytes": partition.memories.nbytes,
+                    "evicted": partition.evicted,
+                    "expired": partition.expired,
+                }
+        return usage
+
+    def set_tokenizer(self, tokenizer: Tokenizer):
+        """替换词元索引使用的分词器，并重建所有分区的词元索引。"""
+        with self._partitions_lock:
+            MemoryManager._tokenizer = tokenizer
+            for partition in self._partitions.values():
+                with partition.lock.write_lock():
+                    partition.token_index = BM25Index(tokenizer)
+                    for doc_id, mem in enumerate(partition.memories[:partition.indexed_count]):
+                        if mem is not None:
+                            partition.token_index.add(doc_id, mem)
+                    partition.invalidate()
+
+    def _expand_keywords(self, query: str) -> list:
+        """根据关键词映射和分词结果扩展搜索关键词。"""
+        return expand_keywords(query)
+
+    def _query_tokens(self, query: str) -> tuple:
+        """返回查询的不同词元及判定匹配所需的最少命中数。"""
+        if not self.min_token_overlap:
+            return set(), 0
+        tokens = set(self._tokenizer.query_tokens(query))
+        required = max(math.ceil(self.min_token_overlap * len(tokens)), self.min_token_hits)
+        if required > len(tokens):
+            return set(), 0
+        return tokens, required
+
+    def _scan_matches(self, partition: MemoryPartition, query: str, keywords: list) -> list:
+        """逐条扫描记忆，返回匹配的记忆ID。"""
+        tokenizer = partition.token_index.tokenizer
+        tokens, required = self._query_tokens(query)
+        matcher = keyword_matcher(keywords)
+        matched = []
+        for doc_id, mem in enumerate(partition.memories):
+            if mem is None:
+                continue
+            if matcher.matches(mem.lower()):
+                matched.append(doc_id)
+            elif tokens and len(tokens.intersection(tokenizer.tokenize(mem))) >= required:
+                matched.append(doc_id)
+        return matched
+
+    def _index_matches(self, partition: MemoryPartition, query: str, keywords: list) -> list:
+        """通过倒排索引生成候选集并做子串校验，返回匹配的记忆ID。"""
+        storage = partition.memories
+        # 合并各关键词的候选，每条候选只解码并校验一次
+        candidates = set()
+        for keyword in keywords:
+            candidates |= partition.substring_index.candidates(keyword)
+        matcher = keyword_matcher(keywords)
+        matched = {doc_id for doc_id in candidates if matcher.matches(storage[doc_id].lower())}
+
+        # 词元重合匹配：中文查询无需与记忆逐字一致
+        tokens, required = self._query_tokens(query)
+        if tokens:
+            for doc_id, hits in partition.token_index.overlap(tokens).items():
+                if hits >= required:
+                    matched.add(doc_id)
+        return sorted(matched)
+
+    def _dedupe(self, partition: MemoryPartition, doc_ids, limit: Optional[int] = None,
+                hits: Optional[list] = None) -> list:
+        """按给定顺序输出至多 limit 条记忆文本，去掉重复内容，并记录命中（追加到 hits）。"""
         results = []
-        
-        # 定义关键词映射
-        keyword_mappings = {
-            "名字": ["姓名", "名字", "叫", "张伟"],
-            "姓名": ["姓名", "名字", "叫", "张伟"],
-            "颜色": ["颜色", "色彩", "蓝色"],
-            "喜欢": ["喜欢", "偏好", "最爱"],
-            "用户": ["用户", "我", "他", "她"]
-        }
-        
-        # 扩展搜索关键词
-        search_keywords = [query_lower]
-        for key, synonyms in keyword_mappings.items():
-            if key in query_lower:
-                search_keywords.extend(synonyms)
-        
-        # 如果没有找到映射，也搜索原始查询
-        if not results:
-            # 分词搜索
-            query_words = query_lower.split()
-            search_keywords.extend(query_words)
-        
-        # 搜索匹配的记忆
-        for mem in self._memory_storage:
-            mem_lower = mem.lower()
-            for keyword in search_keywords:
-                if keyword.strip() and keyword in mem_lower:
-                    if mem not in results:  # 避免重复
-                        results.append(mem)
-                    break
-        
+        if hits is None:
+            hits = []
+        seen = set()
+        for doc_id in doc_ids:
+            if limit is not None and len(results) >= limit:
+                break
+            mem = partition.memories[doc_id]
+            if mem not in seen:
+                seen.add(mem)
+                results.append(mem)
+                hits.append(doc_id)
+        partition.touch(hits)
+        return results
+
+    def ranked_search(self, query: str, limit: int = None, min_score: float = 0.0,
+                      user_id: str = None) -> list:
+        """
+        按 BM25 得分搜索记忆
+
+        查询会先经过关键词映射扩展，再切分为词元参与打分。
+
+        Args:
+            query: 搜索查询
+            limit: 返回数量上限，默认取 default_limit
+            min_score: 最低得分
+            user_id: 用户ID，默认取当前上下文用户
+
+        Returns:
+            list: (记忆, 得分) 列表，按得分降序
+        """
+        partition = self._indexed_partition(user_id)
+        with partition.lock.read_lock():
+            return self._ranked_search(partition, query, limit, min_score)
+
+    def _ranked_search(self, partition: MemoryPartition, query: str, limit: Optional[int],
+                       min_score: float, hits: Optional[list] = None) -> list:
+        if limit is None:
+            limit = self.default_limit
+        tokenizer = partition.token_index.tokenizer
+        tokens = []
+        for keyword in self._expand_keywords(query):
+            tokens.extend(tokenizer.query_tokens(keyword))
+
+        # 相同内容只保留得分最高的一条，再用有界堆取前 k 条
+        best = {}
+        for doc_id, score in partition.token_index.scores(tokens).items():
+            if score < min_score:
+                continue
+            mem = partition.memories[doc_id]
+            current = best.get(mem)
+            if current is None or (score, -doc_id) > current:
+                best[mem] = (score, -doc_id)
+        top = heapq.nlargest(limit, best.items(), key=lambda item: item[1])
+        touched = [-neg_id for _, (_, neg_id) in top]
+        partition.touch(touched)
+        if hits is not None:
+            hits.extend(touched)
+        return [(mem, score) for mem, (score, _) in top]
+
+    def vector_search(self, query: str, limit: int = None, min_score: float = 0.0,
+                      exact: bool = False, user_id: str = None) -> list:
+        """
+        按向量相似度搜索记忆
+
+        Args:
+            query: 搜索查询
+            limit: 返回数量上限，默认取 default_limit
+            min_score: 最低余弦相似度
+            exact: 为 True 时即使已构建近似索引也做暴力检索
+            user_id: 用户ID，默认取当前上下文用户
+
+        Returns:
+            list: (记忆, 相似度) 列表，按相似度降序
+        """
+        partition = self._indexed_partition(user_id)
+        with partition.lock.read_lock():
+            return self._vector_search(partition, query, limit, min_score, exact)
+
+    def _vector_search(self, partition: MemoryPartition, query: str, limit: Optional[int],
+                       min_score: float, exact: bool = False, hits: Optional[list] = None) -> list:
+        if self._embedder is None:
+            raise RuntimeError("向量搜索未启用，请先调用 enable_vector_search()")
+        if limit is None:
+            limit = self.default_limit
+
+        # 多取一些候选，抵消内容重复的记忆
+        candidates = partition.vector_store.search(self._embedder.embed_query(query), 2 * limit,
+                                                   exact=exact)
+        results = []
+        seen = set()
+        touched = []
+        for score, doc_id in candidates:
+            mem = partition.memories[doc_id]
+            # 被淘汰的记忆仍留在向量存储中，直到分区重建
+            if score < min_score or mem is None or mem in seen:
+                continue
+            seen.add(mem)
+            results.append((mem, score))
+            touched.append(doc_id)
+            if len(results) == limit:
+                break
+        partition.touch(touched)
+        if hits is not None:
+            hits.extend(touched)
+        return results
+
+    def search_memory(self, query: str, limit: int = None, min_score: float = None,
+                      mode: str = None, use_index: bool = None, user_id: str = None) -> list:
+        """
+        从内存中搜索包含查询关键词的信息。
+
+        Args:
+            query: 搜索查询
+            limit: 返回数量上限，keyword 模式下默认不限制
+            min_score: bm25/vector 模式下的最低得分
+            mode: 搜索模式 "keyword"、"bm25" 或 "vector"，默认取 search_mode 属性
+            use_index: keyword 模式下是否使用倒排索引，默认取 use_index 属性
+            user_id: 用户ID，默认取当前上下文用户
+
+        Returns:
+            list: keyword 模式按添加顺序排列，其他模式按得分降序（均已去重）
+        """
+        print(f"--- 正在搜索内存: '{query}' ---")
+
+        mode = mode or self.search_mode
+        if mode not in ("keyword", "bm25", "vector"):
+            raise ValueError(f"不支持的搜索模式: {mode}")
+        with get_metrics().track("local", "search_memory", self._resolve_user(user_id)) as span:
+            span.set_payload(query)
+            partition = self._indexed_partition(user_id)
+            partition.record_search()
+            with partition.lock.read_lock():
+                key = self._cache_key(partition, query, limit, min_score, mode, use_index)
+                cached = partition.cache_get(key) if key is not None else None
+                if cached is not None:
+                    results = list(cached[0])
+                else:
+                    hits = []
+                    results = self._search(partition, query, limit, min_score, mode, use_index, hits)
+                    if key is not None:
+                        partition.cache_put(key, results, hits, self.query_cache_size)
+            span.set_results(len(results))
+
         print(f"--- 搜索到 {len(results)} 条记忆 ---")
         return results
 
-    def clear_memory(self):
-        """清空所有记忆。"""
+    def _cache_key(self, partition: MemoryPartition, query: str, limit: Optional[int],
+                   min_score: Optional[float], mode: str, use_index: Optional[bool]) -> Optional[tuple]:
+        """
+        返回搜索结果缓存的键，缓存关闭时返回 None
+
+        键包含影响结果的全部参数、同义词词典版本与分区的写入代数；
+        除向量模式外，分词与子串匹配都不区分大小写，查询按小写归一化。
+        """
+        if not self.query_cache_size:
+            return None
+        synonyms = get_synonyms()
+        synonyms.refresh()
+        return (mode, query if mode == "vector" else query.lower(), limit, min_score,
+                self.use_index if use_index is None else use_index, self.min_token_overlap,
+                self.min_token_hits, self.default_limit, self.min_vector_score, synonyms.version, partition.generation)
+
+    def cache_stats(self) -> Dict[str, float]:
+        """
+        返回所有分区合计的搜索结果缓存统计
+
+        Returns:
+            Dict: {"entries", "hits", "misses", "hit_rate"}
+        """
+        with self._partitions_lock:
+            partitions = list(self._partitions.values())
+        hits = sum(partition.cache_hits for partition in partitions)
+        misses = sum(partition.cache_misses for partition in partitions)
+        return {
+            "entries": sum(len(partition.query_cache) for partition in partitions),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def _search(self, partition: MemoryPartition, query: str, limit: Optional[int],
+                min_score: Optional[float], mode: str, use_index: Optional[bool],
+                hits: Optional[list] = None) -> list:
+        """在已持有读锁的分区上按指定模式搜索，命中的记忆ID追加到 hits。"""
+        if mode == "bm25":
+            ranked = self._ranked_search(partition, query, limit, min_score or 0.0, hits)
+            return [mem for mem, _ in ranked]
+        if mode == "vector":
+            if min_score is None:
+                min_score = self.min_vector_score
+            ranked = self._vector_search(partition, query, limit, min_score, hits=hits)
+            return [mem for mem, _ in ranked]
+
+        if use_index is None:
+            use_index = self.use_index
+        keywords = self._expand_keywords(query)
+        if use_index:
+            matched = self._index_matches(partition, query, keywords)
+        else:
+            matched = self._scan_matches(partition, query, keywords)
+        return self._dedupe(partition, matched, limit, hits)
+
+    def clear_memory(self, user_id: str = None):
+        """清空用户的所有记忆。"""
         print("--- 清空所有记忆 ---")
-        self._memory_storage.clear()
+        partition = self._partition(user_id)
+        with get_metrics().track("local", "delete_all_memories", partition.user_id):
+            with self._persist_lock.read_lock():
+                with partition.lock.write_lock():
+                    if self._persistence is not None:
+                        self._persistence.append_clear(partition.user_id)
+                    partition.clear()
 
-    def list_all_memories(self):
-        """列出所有记忆。"""
+    def list_all_memories(self, user_id: str = None):
+        """列出用户的所有记忆。"""
         print("--- 列出所有记忆 ---")
-        return self._memory_storage.copy()
+        partition = self._partition(user_id)
+        with get_metrics().track("local", "list_memories", partition.user_id) as span:
+            with partition.lock.read_lock():
+                memories = [mem for mem in partition.memories if mem is not None]
+            span.set_results(len(memories))
+        return memories
+
+    def list_records(self, user_id: str = None) -> list:
+        """
+        列出用户的所有记忆及其元数据
+
+        Returns:
+            list: MemoryRecord 列表（id、text、created_at、source），按写入顺序排列
+        """
+        partition = self._partition(user_id)
+        with partition.lock.read_lock():
+            records = map(partition.memories.record, range(len(partition.memories)))
+            return [record for record in records if record is not None]
+
+    def list_users(self) -> list:
+        """列出已有记忆分区的用户ID。"""
+        with self._partitions_lock:
+            return list(self._partitions)
+
+    def get_stats(self, user_id: str = None) -> dict:
+        """返回用户分区的统计信息。"""
+        return self._partition(user_id).get_stats()
 
 # 创建一个全局单例
-memory_manager = MemoryManager() 
\ No newline at end of file
+memory_manager = MemoryManager()
\ No newline at end of file
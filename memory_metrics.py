@@ -0,0 +1,339 @@
+"""
+记忆操作指标模块
+
+功能：
+- 为所有记忆后端（本地内存、SQLite、Mem0、OpenMemory）的添加、搜索、列表、
+  删除操作提供统一的计时入口：with get_metrics().track(后端, 操作, 用户) as span。
+- 按 (后端, 操作, 用户) 分别统计调用次数、错误次数，以及延迟、负载字节数、
+  结果条数的分布，可查询 p50/p95/p99。
+- 分布使用对数分桶直方图（相邻桶边界相差 5%），内存占用固定，分位数的相对误差不超过 5%。
+- 可注册状态量（如远程服务的熔断器状态），导出时读取当前值。
+- 可导出为 Prometheus 文本格式或 JSON。
+- 默认关闭，由环境变量 MEMORY_METRICS=1 或 enable() 开启；关闭时 track 返回
+  共享的空对象，每次调用只多一次属性检查。
+"""
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+# 标准的操作名称，各后端的同类方法统一记录为这些名称
+OPERATIONS = ("add_memory", "search_memory", "list_memories", "delete_all_memories")
+
+# 用户标签的最大数量，超出后新用户合并记为 OTHER_USER，避免标签基数无限增长
+MAX_USERS = 1000
+OTHER_USER = "_other"
+
+
+class LogHistogram:
+    """
+    对数分桶直方图
+
+    值 v > 0 落入第 floor(log(v) / log(growth)) 个桶，0 单独计数；
+    分位数取桶的几何中点，相对误差不超过 growth - 1 的一半左右。
+
+    Args:
+        growth: 相邻桶边界的比值
+    """
+
+    __slots__ = ("_scale", "_growth", "buckets", "zeros", "count", "total")
+
+    def __init__(self, growth: float = 1.05):
+        self._scale = 1 / math.log(growth)
+        self._growth = growth
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value: float, _floor=math.floor, _log=math.log):
+        self.count += 1
+        self.total += value
+        if value > 0:
+            index = _floor(_log(value) * self._scale)
+            buckets = self.buckets
+            buckets[index] = buckets.get(index, 0) + 1
+        else:
+            self.zeros += 1
+
+    def quantile(self, q: float) -> float:
+        """返回第 q 分位数（0~1），没有样本时返回 0。"""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1) + 1
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return self._growth ** (index + 0.5)
+        return self._growth ** (max(self.buckets) + 0.5)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class OperationStats:
+    """一组 (后端, 操作, 用户) 的统计"""
+
+    __slots__ = ("calls", "errors", "latency", "payload_bytes", "results")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = LogHistogram()
+        self.payload_bytes = LogHistogram()
+        self.results = LogHistogram()
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "latency_seconds": self.latency.summary(),
+            "payload_bytes": self.payload_bytes.summary(),
+            "results": self.results.summary(),
+        }
+
+
+class Span:
+    """一次被计时的操作，由 MetricsRegistry.track 创建"""
+
+    __slots__ = ("_registry", "_key", "_start", "_payload", "_results", "_failed")
+
+    def __init__(self, registry: "MetricsRegistry", key: Tuple[str, str, str]):
+        self._registry = registry
+        self._key = key
+        self._payload = None
+        self._results = None
+        self._failed = False
+
+    def set_payload(self, text: Optional[str] = None, nbytes: int = None):
+        """记录请求负载的大小：传入文本时按 UTF-8 字节数计算。"""
+        self._payload = len(text.encode("utf-8")) if text is not None else nbytes
+
+    def set_results(self, count: int):
+        """记录返回的结果条数。"""
+        self._results = count
+
+    def fail(self):
+        """将本次操作记为错误（用于捕获异常后返回错误信息的后端）。"""
+        self._failed = True
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._registry._record(self._key, time.perf_counter() - self._start,
+                               self._failed or exc_type is not None, self._payload, self._results)
+        return False
+
+
+class _NullSpan:
+    """指标关闭时使用的空操作"""
+
+    __slots__ = ()
+
+    def set_payload(self, text: Optional[str] = None, nbytes: int = None):
+        pass
+
+    def set_results(self, count: int):
+        pass
+
+    def fail(self):
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """
+    记忆操作指标的注册表
+
+    Args:
+        enabled: 是否记录
+        per_user: 是否按用户区分，关闭时用户标签统一为空
+    """
+
+    def __init__(self, enabled: bool = False, per_user: bool = True):
+        self.enabled = enabled
+        self.per_user = per_user
+        self._stats: Dict[Tuple[str, str, str], OperationStats] = {}
+        self._users = set()
+        self._gauges: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, per_user: bool = None):
+        """开启记录。"""
+        if per_user is not None:
+            self.per_user = per_user
+        self.enabled = True
+
+    def disable(self):
+        """关闭记录，已有数据保留。"""
+        self.enabled = False
+
+    def reset(self):
+        """清空已记录的数据。"""
+        with self._lock:
+            self._stats.clear()
+            self._users.clear()
+
+    def register_gauges(self, backend: str, callback: Callable[[], Dict[str, float]]):
+        """
+        注册一个后端的状态量
+
+        导出时调用 callback 读取当前值，与是否开启记录无关；同一后端重复注册时替换。
+
+        Args:
+            backend: 后端名称
+            callback: 返回 {指标名: 数值} 的函数，指标名导出为 memory_<指标名>
+        """
+        with self._lock:
+            self._gauges[backend] = callback
+
+    def gauges(self) -> Dict[str, Dict[str, float]]:
+        """返回各后端状态量的当前值：{后端: {指标名: 数值}}。"""
+        with self._lock:
+            callbacks = list(self._gauges.items())
+        return {backend: callback() for backend, callback in callbacks}
+
+    def track(self, backend: str, operation: str, user_id: Optional[str] = None):
+        """
+        为一次操作计时
+
+        with 块内抛出异常或调用 span.fail() 时计为错误。
+
+        Args:
+            backend: 后端名称，如 "local"、"sqlite"、"mem0"、"openmemory"
+            operation: 操作名称，见 OPERATIONS
+            user_id: 用户ID
+
+        Returns:
+            Span: 可调用 set_payload / set_results / fail 的计时对象
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, (backend, operation, user_id or ""))
+
+    def _record(self, key: Tuple[str, str, str], seconds: float, failed: bool,
+                payload: Optional[int], results: Optional[int]):
+        with self._lock:
+            if not self.per_user:
+                key = (key[0], key[1], "")
+            elif key[2] not in self._users:
+                if len(self._users) >= MAX_USERS:
+                    key = (key[0], key[1], OTHER_USER)
+                else:
+                    self._users.add(key[2])
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = OperationStats()
+            stats.calls += 1
+            if failed:
+                stats.errors += 1
+            stats.latency.record(seconds)
+            if payload is not None:
+                stats.payload_bytes.record(payload)
+            if results is not None:
+                stats.results.record(results)
+
+    def snapshot(self) -> list:
+        """
+        返回当前统计
+
+        Returns:
+            list: 每个 (后端, 操作, 用户) 一项，含 calls、errors、error_rate，
+                以及 latency_seconds / payload_bytes / results 的 count、sum、p50、p95、p99
+        """
+        with self._lock:
+            return [{"backend": backend, "operation": operation, "user": user, **stats.to_dict()}
+                    for (backend, operation, user), stats in sorted(self._stats.items())]
+
+    def to_json(self, indent: int = None) -> str:
+        """导出为 JSON：{"operations": snapshot(), "gauges": gauges()}。"""
+        return json.dumps({"operations": self.snapshot(), "gauges": self.gauges()},
+                          ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式（延迟、负载、结果条数为 summary 类型）。"""
+        lines = [
+            "# HELP memory_operations_total 记忆操作调用次数",
+            "# TYPE memory_operations_total counter",
+        ]
+        items = self.snapshot()
+        for item in items:
+            lines.append(f"memory_operations_total{{{_labels(item)}}} {item['calls']}")
+        lines += [
+            "# HELP memory_operation_errors_total 记忆操作错误次数",
+            "# TYPE memory_operation_errors_total counter",
+        ]
+        for item in items:
+            lines.append(f"memory_operation_errors_total{{{_labels(item)}}} {item['errors']}")
+        for name, field, help_text in (
+                ("memory_operation_latency_seconds", "latency_seconds", "记忆操作延迟（秒）"),
+                ("memory_operation_payload_bytes", "payload_bytes", "记忆操作请求负载（字节）"),
+                ("memory_operation_results", "results", "记忆操作返回的结果条数")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for item in items:
+                summary = item[field]
+                if not summary["count"]:
+                    continue
+                labels = _labels(item)
+                for quantile, field_name in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                    lines.append(f'{name}{{{labels},quantile="{quantile}"}} {summary[field_name]:.6g}')
+                lines.append(f"{name}_sum{{{labels}}} {summary['sum']:.6g}")
+                lines.append(f"{name}_count{{{labels}}} {summary['count']}")
+        gauges = self.gauges()
+        names = sorted({name for values in gauges.values() for name in values})
+        for name in names:
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE memory_{name} {kind}")
+            for backend, values in sorted(gauges.items()):
+                if name in values:
+                    lines.append(f'memory_{name}{{backend="{_escape(backend)}"}} {values[name]:.6g}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(item: Dict) -> str:
+    return (f'backend="{_escape(item["backend"])}",operation="{_escape(item["operation"])}",'
+            f'user="{_escape(item["user"])}"')
+
+
+def count_results(response) -> Optional[int]:
+    """返回远程服务响应中的结果条数：列表本身或 {"results": [...]} 中的列表。"""
+    if isinstance(response, dict):
+        response = response.get("results", response.get("memories"))
+    return len(response) if isinstance(response, list) else None
+
+
+_metrics: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """返回全局指标注册表，首次调用时按环境变量 MEMORY_METRICS 决定是否开启。"""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry(os.getenv("MEMORY_METRICS", "").lower() in ("1", "true", "yes"))
+    return _metrics
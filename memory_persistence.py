@@ -0,0 +1,361 @@
+"""
+本地记忆持久化模块
+
+功能：
+- 追加写的预写日志（WAL），记录 add_memory / clear_memory 与淘汰删除操作。
+- 定期生成压缩快照：字符偏移表 + UTF-8 文本区，启动时通过 mmap 直接解码。
+- 启动时加载最新快照，只重放快照之后的日志尾部。
+- 可配置的 fsync 策略：每次写入（always）、批量（batch）或交给操作系统（os）。
+
+文件布局（位于同一目录）：
+- memory.snapshot      最新快照
+- memory.log           当前日志
+- memory.log.old       生成快照期间被轮换出的旧日志，快照落盘后删除
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from codecs import decode
+from collections import Counter
+from typing import Dict, List, Tuple
+
+OP_ADD = 1
+OP_CLEAR = 2
+OP_DELETE = 3
+
+FSYNC_POLICIES = ("always", "batch", "os")
+
+# 日志记录头：crc32, seq, op, 用户ID字节数, 文本字节数；crc 覆盖其后的全部内容
+_RECORD_HEADER = struct.Struct("<IQBHI")
+_SNAPSHOT_MAGIC = b"LCMEMSN1"
+# 快照头：魔数, 快照对应的最后一条日志序号, 用户数
+_SNAPSHOT_HEADER = struct.Struct("<8sQI")
+# 每个用户：用户ID字节数, 记忆条数
+_SNAPSHOT_USER = struct.Struct("<HQ")
+
+
+class MemoryLog:
+    """
+    追加写的预写日志
+
+    Args:
+        path: 日志文件路径
+        fsync_policy: "always" 每条记录后 fsync；"batch" 每 batch_size 条或每
+            batch_interval 秒 fsync 一次；"os" 只写入内核缓冲区，由操作系统决定落盘时机
+        batch_size: batch 策略下触发 fsync 的记录数
+        batch_interval: batch 策略下两次 fsync 的最长间隔（秒）
+    """
+
+    def __init__(self, path: str, fsync_policy: str = "batch", batch_size: int = 256,
+                 batch_interval: float = 1.0, next_seq: int = 1):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"不支持的 fsync 策略: {fsync_policy}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.next_seq = next_seq
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync_policy == "batch":
+            self._flusher = threading.Thread(target=self._flush_loop, name="memory-log-fsync", daemon=True)
+            self._flusher.start()
+
+    def append(self, op: int, user_id: str, text: str = "") -> int:
+        """追加一条记录并按策略落盘，返回记录序号。"""
+        user_bytes = user_id.encode("utf-8")
+        text_bytes = text.encode("utf-8")
+        with self._lock:
+            seq = self.next_seq
+            body = _RECORD_HEADER.pack(0, seq, op, len(user_bytes), len(text_bytes))[4:] + user_bytes + text_bytes
+            self._file.write(struct.pack("<I", zlib.crc32(body)) + body)
+            self._file.flush()
+            self.next_seq += 1
+            self.records += 1
+            self._unsynced += 1
+            if self.fsync_policy == "always":
+                self._sync()
+            elif self.fsync_policy == "batch" and (
+                    self._unsynced >= self.batch_size
+                    or time.monotonic() - self._last_sync >= self.batch_interval):
+                self._sync()
+        return seq
+
+    def _sync(self):
+        """将已写入的记录刷到磁盘，调用方需持有 _lock。"""
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _flush_loop(self):
+        """batch 策略的后台线程：写入停止后也能在 batch_interval 内落盘。"""
+        while not self._closed.wait(self.batch_interval):
+            with self._lock:
+                if self._unsynced and not self._file.closed:
+                    self._sync()
+
+    def sync(self):
+        """立即落盘。"""
+        with self._lock:
+            self._sync()
+
+    def rotate(self, old_path: str):
+        """将当前日志改名为 old_path 并开始写新日志，调用方需保证期间没有写入。"""
+        with self._lock:
+            self._sync()
+            self._file.close()
+            os.replace(self.path, old_path)
+            self._file = open(self.path, "ab")
+            self.records = 0
+
+    def close(self):
+        """落盘并关闭日志。"""
+        self._closed.set()
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+def read_log(path: str) -> Tuple[List[Tuple[int, int, str, str]], int]:
+    """
+    读取日志中的全部完整记录
+
+    遇到不完整或校验失败的记录（崩溃时写了一半）即停止，并把文件截断到最后一条
+    完整记录处，保证后续追加的记录可以被读到。
+
+    Returns:
+        Tuple: ([(seq, op, user_id, text), ...], 最大序号)
+    """
+    records = []
+    last_seq = 0
+    if not os.path.exists(path):
+        return records, last_seq
+
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    header_size = _RECORD_HEADER.size
+    while pos + header_size <= len(data):
+        crc, seq, op, user_len, text_len = _RECORD_HEADER.unpack_from(data, pos)
+        end = pos + header_size + user_len + text_len
+        if end > len(data) or zlib.crc32(data[pos + 4:end]) != crc:
+            break
+        user_start = pos + header_size
+        user_id = data[user_start:user_start + user_len].decode("utf-8")
+        text = data[user_start + user_len:end].decode("utf-8")
+        records.append((seq, op, user_id, text))
+        last_seq = seq
+        pos = end
+
+    if pos < len(data):
+        logging.warning(f"记忆日志 {path} 尾部有 {len(data) - pos} 字节不完整记录，已截断")
+        with open(path, "r+b") as f:
+            f.truncate(pos)
+    return records, last_seq
+
+
+def write_snapshot(path: str, seq: int, partitions: Dict[str, List[str]]):
+    """
+    写入快照：先写临时文件并 fsync，再原子替换
+
+    Args:
+        path: 快照路径
+        seq: 快照包含的最后一条日志序号
+        partitions: 用户ID → 记忆列表
+    """
+    users = list(partitions.items())
+    offsets = array("Q", [0])
+    chunks = []
+    position = 0
+    for _, memories in users:
+        for text in memories:
+            chunks.append(text)
+            position += len(text)
+            offsets.append(position)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, seq, len(users)))
+        for user_id, memories in users:
+            user_bytes = user_id.encode("utf-8")
+            f.write(_SNAPSHOT_USER.pack(len(user_bytes), len(memories)))
+            f.write(user_bytes)
+        f.write(offsets.tobytes())
+        f.write("".join(chunks).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Tuple[Dict[str, List[str]], int]:
+    """
+    通过 mmap 读取快照
+
+    偏移表直接从映射区复制为 array，文本区一次性解码后按字符偏移切片，
+    不需要逐条解析。
+
+    Returns:
+        Tuple: (用户ID → 记忆列表, 快照对应的最后一条日志序号)
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}, 0
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, seq, n_users = _SNAPSHOT_HEADER.unpack_from(mm, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f"无效的记忆快照文件: {path}")
+        pos = _SNAPSHOT_HEADER.size
+        users = []
+        total = 0
+        for _ in range(n_users):
+            user_len, count = _SNAPSHOT_USER.unpack_from(mm, pos)
+            pos += _SNAPSHOT_USER.size
+            users.append((mm[pos:pos + user_len].decode("utf-8"), count))
+            pos += user_len
+            total += count
+
+        offsets = array("Q")
+        offsets_end = pos + 8 * (total + 1)
+        offsets.frombytes(mm[pos:offsets_end])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        view = memoryview(mm)
+        try:
+            arena = decode(view[offsets_end:], "utf-8")
+        finally:
+            view.release()
+
+    partitions = {}
+    index = 0
+    for user_id, count in users:
+        bounds = offsets[index:index + count + 1]
+        partitions[user_id] = [arena[bounds[i]:bounds[i + 1]] for i in range(count)]
+        index += count
+    return partitions, seq
+
+
+class MemoryPersistence:
+    """
+    快照 + 日志的持久化存储
+
+    Args:
+        directory: 数据目录
+        fsync_policy: 日志 fsync 策略，见 MemoryLog
+        snapshot_interval: 日志累计多少条记录后生成新快照，为 None 时不自动生成
+    """
+
+    SNAPSHOT_FILE = "memory.snapshot"
+    LOG_FILE = "memory.log"
+    OLD_LOG_FILE = "memory.log.old"
+
+    def __init__(self, directory: str, fsync_policy: str = "batch", snapshot_interval: int = 100_000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, self.LOG_FILE)
+        self.old_log_path = os.path.join(directory, self.OLD_LOG_FILE)
+        self.log = None
+        # 同一时间只允许一个快照任务
+        self.snapshot_lock = threading.Lock()
+
+    def load(self) -> Dict[str, List[str]]:
+        """
+        加载快照并重放其后的日志，然后打开日志供追加
+
+        Returns:
+            Dict[str, List[str]]: 用户ID → 记忆列表
+        """
+        partitions, snapshot_seq = read_snapshot(self.snapshot_path)
+        last_seq = snapshot_seq
+        replayed = 0
+        # 删除记录按文本计数，重放结束后统一过滤，避免逐条在列表中查找
+        deletes: Dict[str, Counter] = {}
+        for path in (self.old_log_path, self.log_path):
+            records, _ = read_log(path)
+            for seq, op, user_id, text in records:
+                # 跳过快照已包含或已重放过的记录
+                if seq <= last_seq:
+                    continue
+                last_seq = seq
+                replayed += 1
+                if op == OP_ADD:
+                    partitions.setdefault(user_id, []).append(text)
+                elif op == OP_CLEAR:
+                    partitions[user_id] = []
+                    deletes.pop(user_id, None)
+                elif op == OP_DELETE:
+                    deletes.setdefault(user_id, Counter())[text] += 1
+
+        # 删除的总是已存在的记忆：相同文本有多条时去掉最早的，剩余内容与删除时一致
+        for user_id, pending in deletes.items():
+            kept = []
+            for text in partitions.get(user_id, ()):
+                if pending[text] > 0:
+                    pending[text] -= 1
+                else:
+                    kept.append(text)
+            partitions[user_id] = kept
+
+        # 上次生成快照时中断：立即补写快照，旧日志与当前日志中的记录都已包含在内
+        if os.path.exists(self.old_log_path):
+            self.finish_snapshot(last_seq, partitions)
+            open(self.log_path, "wb").close()
+            replayed = 0
+
+        self.log = MemoryLog(self.log_path, self.fsync_policy, next_seq=last_seq + 1)
+        self.log.records = replayed
+        logging.info(f"记忆持久化已加载: {sum(map(len, partitions.values()))} 条记忆，重放 {replayed} 条日志")
+        return partitions
+
+    def append_add(self, user_id: str, text: str) -> int:
+        """记录一次添加记忆。"""
+        return self.log.append(OP_ADD, user_id, text)
+
+    def append_delete(self, user_id: str, text: str) -> int:
+        """记录一次删除记忆（淘汰或过期）。"""
+        return self.log.append(OP_DELETE, user_id, text)
+
+    def append_clear(self, user_id: str) -> int:
+        """记录一次清空用户记忆。"""
+        return self.log.append(OP_CLEAR, user_id)
+
+    def should_snapshot(self) -> bool:
+        """日志是否已累计到需要生成快照的记录数。"""
+        return self.snapshot_interval is not None and self.log.records >= self.snapshot_interval
+
+    def rotate(self) -> int:
+        """
+        轮换日志，返回新快照应包含的最后一条日志序号
+
+        调用方需保证轮换期间没有写入，并在同一临界区内复制当前状态。
+        """
+        self.log.rotate(self.old_log_path)
+        return self.log.next_seq - 1
+
+    def finish_snapshot(self, seq: int, partitions: Dict[str, List[str]]):
+        """写入快照并删除被轮换出的旧日志。"""
+        write_snapshot(self.snapshot_path, seq, partitions)
+        if os.path.exists(self.old_log_path):
+            os.remove(self.old_log_path)
+
+    def close(self):
+        """落盘并关闭日志。"""
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,205 @@
+"""
+紧凑的记忆记录模块
+
+功能：
+- 以列式布局保存一个分区的全部记忆：文本按 UTF-8 依次写入共享的字节区，
+  偏移、写入时间、记录ID、来源编号各占一个 array 列。
+- 来源（写入记忆的客户端名称等）经 sys.intern 驻留后只保存编号，
+  同一来源的记忆共享一个字符串对象。
+- 支持按行号读取、切片、迭代与删除（置为墓碑），接口与原先的 List[str] 一致，
+  被删除的行读取为 None。
+- MemoryRecord 是带 __slots__ 的只读记录，用于对外返回单条记忆及其元数据。
+
+每条记忆的固定开销为 偏移 8 + 时间 8 + ID 8 + 来源 4 + 存活标记 1 = 29 字节，
+另加 UTF-8 文本本身；而每个 str 对象另有约 50~75 字节的对象头，
+再为每条记忆保存时间、来源等元数据对象还会成倍增加开销（见 benchmark.py records）。
+"""
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class MemoryRecord:
+    """单条记忆及其元数据"""
+
+    __slots__ = ("id", "text", "created_at", "source")
+
+    def __init__(self, id: int, text: str, created_at: float, source: str):
+        self.id = id
+        self.text = text
+        self.created_at = created_at
+        self.source = source
+
+    def to_dict(self) -> Dict:
+        """转换为字典，字段名与远程记忆服务返回的结果一致。"""
+        return {"id": self.id, "memory": self.text, "created_at": self.created_at,
+                "source": self.source}
+
+    def __repr__(self) -> str:
+        return f"MemoryRecord(id={self.id}, text={self.text!r}, source={self.source!r})"
+
+
+class RecordColumns:
+    """
+    列式记忆存储
+
+    行号即分区内的记忆ID（doc_id），与倒排索引、向量存储的行号一致；
+    记录ID在分区内单调递增，重建分区后保持不变。
+    读取文本时按偏移从字节区解码，调用方需自行加锁。
+    """
+
+    def __init__(self):
+        self._arena = bytearray()
+        # 第 i 条记忆的文本为 _arena[_offsets[i]:_offsets[i + 1]]
+        self._offsets = array("Q", [0])
+        self._created = array("d")
+        self._ids = array("Q")
+        self._sources = array("I")
+        # 1 为存活，0 为墓碑
+        self._alive = bytearray()
+        # 来源编号 → 驻留的来源字符串，0 号为未指定来源
+        self._source_names: List[str] = [""]
+        self._source_ids: Dict[str, int] = {"": 0}
+        self._next_id = 1
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "RecordColumns":
+        """由文本列表创建，写入时间取当前时间。"""
+        columns = cls()
+        columns.extend(texts)
+        return columns
+
+    def _source_id(self, source: Optional[str]) -> int:
+        if not source:
+            return 0
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = len(self._source_names)
+            self._source_names.append(sys.intern(source))
+            self._source_ids[self._source_names[-1]] = source_id
+        return source_id
+
+    def append(self, text: str, created_at: float = None, source: str = None,
+               record_id: int = None) -> int:
+        """
+        追加一条记忆
+
+        Args:
+            text: 记忆文本
+            created_at: 写入时间（Unix 时间戳），默认为当前时间
+            source: 来源名称
+            record_id: 记录ID，默认自动分配
+
+        Returns:
+            int: 行号
+        """
+        doc_id = len(self._alive)
+        self._arena += text.encode("utf-8")
+        self._offsets.append(len(self._arena))
+        self._created.append(time.time() if created_at is None else created_at)
+        if record_id is None:
+            record_id = self._next_id
+        self._next_id = max(self._next_id, record_id + 1)
+        self._ids.append(record_id)
+        self._sources.append(self._source_id(source))
+        self._alive.append(1)
+        return doc_id
+
+    def extend(self, texts: Iterable[str], created_at: float = None, source: str = None):
+        """批量追加记忆，共用同一写入时间与来源。"""
+        created_at = time.time() if created_at is None else created_at
+        source_id = self._source_id(source)
+        arena, offsets = self._arena, self._offsets
+        start = len(self._alive)
+        for text in texts:
+            arena += text.encode("utf-8")
+            offsets.append(len(arena))
+        count = len(offsets) - 1 - start
+        self._created.extend(array("d", [created_at]) * count)
+        self._ids.extend(range(self._next_id, self._next_id + count))
+        self._next_id += count
+        self._sources.extend(array("I", [source_id]) * count)
+        self._alive.extend(b"\x01" * count)
+
+    def select(self, doc_ids: Iterable[int]) -> "RecordColumns":
+        """返回只含指定行的新存储，保留各行的元数据与记录ID。"""
+        columns = RecordColumns()
+        columns._source_names = list(self._source_names)
+        columns._source_ids = dict(self._source_ids)
+        columns._next_id = self._next_id
+        arena, offsets = self._arena, self._offsets
+        for doc_id in doc_ids:
+            columns._arena += arena[offsets[doc_id]:offsets[doc_id + 1]]
+            columns._offsets.append(len(columns._arena))
+            columns._created.append(self._created[doc_id])
+            columns._ids.append(self._ids[doc_id])
+            columns._sources.append(self._sources[doc_id])
+            columns._alive.append(1)
+        return columns
+
+    def live_ids(self) -> List[int]:
+        """返回存活行的行号。"""
+        return [doc_id for doc_id, alive in enumerate(self._alive) if alive]
+
+    def delete(self, doc_id: int):
+        """将一行置为墓碑，字节区在分区重建前不回收。"""
+        self._alive[doc_id] = 0
+
+    def clear(self):
+        """清空全部记忆，保留来源表与记录ID计数。"""
+        self._arena = bytearray()
+        self._offsets = array("Q", [0])
+        self._created = array("d")
+        self._ids = array("Q")
+        self._sources = array("I")
+        self._alive = bytearray()
+
+    def text_size(self, doc_id: int) -> int:
+        """返回一行文本的 UTF-8 字节数。"""
+        return self._offsets[doc_id + 1] - self._offsets[doc_id]
+
+    def created_at(self, doc_id: int) -> float:
+        return self._created[doc_id]
+
+    def source(self, doc_id: int) -> str:
+        return self._source_names[self._sources[doc_id]]
+
+    def record_id(self, doc_id: int) -> int:
+        return self._ids[doc_id]
+
+    def record(self, doc_id: int) -> Optional[MemoryRecord]:
+        """返回一行的记录，墓碑返回 None。"""
+        text = self[doc_id]
+        if text is None:
+            return None
+        return MemoryRecord(self._ids[doc_id], text, self._created[doc_id], self.source(doc_id))
+
+    @property
+    def arena_size(self) -> int:
+        """字节区中文本的总字节数（含墓碑）。"""
+        return len(self._arena)
+
+    @property
+    def nbytes(self) -> int:
+        """各列占用的字节数（含字节区已分配的余量）。"""
+        columns = (self._offsets, self._created, self._ids, self._sources)
+        return (sys.getsizeof(self._arena) + sys.getsizeof(self._alive)
+                + sum(column.buffer_info()[1] * column.itemsize for column in columns))
+
+    def __len__(self) -> int:
+        return len(self._alive)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[doc_id] for doc_id in range(*index.indices(len(self._alive)))]
+        if not self._alive[index]:
+            return None
+        if index < 0:
+            index += len(self._alive)
+        return self._arena[self._offsets[index]:self._offsets[index + 1]].decode("utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        arena, offsets = self._arena, self._offsets
+        for doc_id, alive in enumerate(self._alive):
+            yield arena[offsets[doc_id]:offsets[doc_id + 1]].decode("utf-8") if alive else None
@@ -0,0 +1,331 @@
+"""
+OpenMemory 异步客户端模块
+
+该模块提供基于 asyncio/aiohttp 的 OpenMemory 客户端，接口与 OpenMemoryClient 一致：
+- 记忆的添加、搜索、列表和删除功能，以及健康检查
+- 有界连接池：所有请求复用同一个 aiohttp 会话，连接数有上限
+- 每个请求的连接/读取超时
+- 信号量限制同时在途的请求数，超出的请求在本地排队
+- 与同步客户端相同的退避重试、重试预算与熔断器
+- 与同步客户端共享搜索结果缓存（见 search_cache）
+- 每次调用按 memory_manager.user_context() 解析用户，一个客户端可以服务多个用户
+- 添加、搜索、列表、删除操作记录到统一的指标（后端名为 "openmemory"）
+
+在异步服务中使用时，等待服务器响应不会占用线程：
+
+    client = get_async_openmemory_client()
+    result = await client.search_memory("名字")
+    await client.close()
+
+依赖 aiohttp；未安装时只影响本模块，同步的 OpenMemoryClient 不受影响。
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from circuit_breaker import CircuitBreaker, RetryBudget, backoff_delay
+from memory_manager import current_user_id
+from memory_metrics import get_metrics, count_results
+from search_cache import get_search_cache
+
+
+class AsyncOpenMemoryClient:
+    """
+    OpenMemory MCP 异步客户端
+
+    会话在首次请求时于当前事件循环中创建，之后只能在同一个事件循环中使用。
+
+    Args:
+        base_url: 服务器地址，默认取 LLMConfig.OPENMEMORY_API_BASE
+        user_id: 默认用户ID（不在 memory_manager.user_context() 中时使用），默认取 LLMConfig.USER_ID
+        client_name: 客户端名称，默认取 LLMConfig.CLIENT_NAME
+        max_connections: 连接池的最大连接数
+        max_concurrency: 同时在途的最大请求数
+        connect_timeout: 建立连接的超时（秒）
+        read_timeout: 等待响应数据的超时（秒）
+        total_timeout: 单次请求（含排队等待连接）的总超时（秒）
+        breaker: 熔断器，默认连续失败 5 次后熔断 30 秒
+        retry_budget: 重试预算，默认重试量不超过请求量的 20%
+    """
+
+    def __init__(self, base_url: str = None, user_id: str = None, client_name: str = None,
+                 max_connections: int = 100, max_concurrency: int = 100,
+                 connect_timeout: float = 3.0, read_timeout: float = 10.0,
+                 total_timeout: float = 30.0, breaker: Optional[CircuitBreaker] = None,
+                 retry_budget: Optional[RetryBudget] = None):
+        if base_url is None or user_id is None or client_name is None:
+            from llm_config import get_llm_config
+            config = get_llm_config()
+            base_url = base_url or config.OPENMEMORY_API_BASE
+            user_id = user_id or config.USER_ID
+            client_name = client_name or config.CLIENT_NAME
+        self.base_url = base_url.rstrip("/")
+        self.default_user_id = user_id
+        self.client_name = client_name
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.breaker = breaker or CircuitBreaker("OpenMemory")
+        self.retry_budget = retry_budget or RetryBudget()
+        self.search_cache = get_search_cache()
+        get_metrics().register_gauges("openmemory_async", self.breaker.gauges)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        logging.info(f"OpenMemory异步客户端初始化完成 - 用户ID: {self.default_user_id}, 客户端名称: {self.client_name}")
+
+    @property
+    def user_id(self) -> str:
+        """当前用户：memory_manager.user_context() 中的用户，未设置时为 default_user_id"""
+        return current_user_id() or self.default_user_id
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """返回共享的会话，不存在或已关闭时在当前事件循环中创建。"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.max_connections)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    'Content-Type': 'application/json',
+                    'User-Agent': f'LangChain-Agent-{self.client_name}'
+                })
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                            retries: int = 3, idempotent: bool = True) -> Dict[str, Any]:
+        """
+        发送HTTP请求到OpenMemory API
+
+        重试、退避与熔断规则与 OpenMemoryClient._make_request 相同。
+
+        Args:
+            method: HTTP方法 (GET, POST, DELETE)
+            endpoint: API端点
+            data: 请求数据，GET 请求作为查询参数，其他作为 JSON 请求体
+            retries: 最多尝试次数（含首次）
+            idempotent: 请求是否可安全重复；为 False 时超时和 5xx 不重试
+
+        Returns:
+            Dict: API响应数据
+
+        Raises:
+            CircuitOpenError: 熔断器打开时
+            Exception: 当请求失败时
+        """
+        method = method.upper()
+        if method not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"不支持的HTTP方法: {method}")
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        session = self._get_session()
+        kwargs = {"params": data} if method == 'GET' else {"json": data}
+        self.retry_budget.record_request()
+        error_msg = None
+
+        for attempt in range(retries):
+            if attempt:
+                if not self.retry_budget.try_spend():
+                    logging.warning("OpenMemory重试预算已用尽，放弃重试")
+                    break
+                delay = backoff_delay(attempt)
+                logging.warning(f"{error_msg}，{delay:.2f}秒后重试 (第{attempt}次)...")
+                await asyncio.sleep(delay)
+            async with self._semaphore:
+                self.breaker.acquire()
+                try:
+                    async with session.request(method, url, **kwargs) as response:
+                        status = response.status
+                        text = await response.text()
+                except aiohttp.ClientConnectorError as e:
+                    self.breaker.record_failure()
+                    error_msg = f"无法连接到OpenMemory服务器: {e!r}"
+                    continue
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self.breaker.record_failure()
+                    error_msg = f"OpenMemory服务器响应失败或超时: {e!r}"
+                    if not idempotent:
+                        break
+                    continue
+                except asyncio.CancelledError:
+                    self.breaker.release()
+                    raise
+                except aiohttp.ClientError as e:
+                    self.breaker.record_failure()
+                    raise Exception(f"请求失败: {e!r}")
+
+            if status >= 500 or status == 429:
+                self.breaker.record_failure()
+                error_msg = f"HTTP错误 {status}: {text}"
+                logging.error(error_msg)
+                if not idempotent:
+                    break
+                continue
+            self.breaker.record_success()
+            if status >= 400:
+                error_msg = f"HTTP错误 {status}: {text}"
+                logging.error(error_msg)
+                raise Exception(error_msg)
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                return {"message": text, "status": "success"}
+
+        raise Exception(error_msg)
+
+    async def add_memory(self, text: str, metadata: Optional[Dict] = None) -> str:
+        """
+        添加新的记忆
+
+        Args:
+            text: 要记忆的文本内容
+            metadata: 可选的元数据
+
+        Returns:
+            str: 操作结果
+        """
+        user_id = self.user_id
+        with get_metrics().track("openmemory", "add_memory", user_id) as span:
+            span.set_payload(text)
+            try:
+                data = {
+                    "messages": [
+                        {"role": "user", "content": text}
+                    ],
+                    "user_id": user_id,
+                    "metadata": metadata or {"source": "langchain_agent", "client": self.client_name}
+                }
+                try:
+                    response = await self._make_request('POST', '/api/v1/memories/', data, idempotent=False)
+                finally:
+                    self.search_cache.invalidate("openmemory", user_id)
+                logging.info(f"成功添加记忆: {text[:50]}...")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"添加记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
+
+    async def search_memory(self, query: str, limit: int = 10) -> str:
+        """
+        搜索记忆
+
+        Args:
+            query: 搜索查询
+            limit: 返回结果的最大数量
+
+        Returns:
+            str: 搜索结果JSON字符串
+        """
+        user_id = self.user_id
+        with get_metrics().track("openmemory", "search_memory", user_id) as span:
+            span.set_payload(query)
+            try:
+                cache_key = self.search_cache.key("openmemory", user_id, query, limit)
+                response = self.search_cache.get(cache_key)
+                if response is None:
+                    generation = self.search_cache.generation("openmemory", user_id)
+                    data = {"query": query, "user_id": user_id, "limit": limit}
+                    response = await self._make_request('POST', '/api/v1/memories/search/', data)
+                    self.search_cache.put(cache_key, response, generation)
+                span.set_results(count_results(response))
+                logging.info(f"搜索记忆完成，查询: {query}")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"搜索记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
+
+    async def list_memories(self) -> str:
+        """
+        列出所有记忆
+
+        Returns:
+            str: 记忆列表JSON字符串
+        """
+        user_id = self.user_id
+        with get_metrics().track("openmemory", "list_memories", user_id) as span:
+            try:
+                response = await self._make_request('GET', '/api/v1/memories/', {"user_id": user_id})
+                span.set_results(count_results(response))
+                logging.info("获取记忆列表完成")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"获取记忆列表失败: {e}"
+                logging.error(error_msg)
+                return error_msg
+
+    async def delete_all_memories(self) -> str:
+        """
+        删除所有记忆
+
+        Returns:
+            str: 操作结果
+        """
+        user_id = self.user_id
+        with get_metrics().track("openmemory", "delete_all_memories", user_id) as span:
+            try:
+                try:
+                    response = await self._make_request('DELETE', '/api/v1/memories/',
+                                                        {"user_id": user_id})
+                finally:
+                    self.search_cache.invalidate("openmemory", user_id)
+                logging.info("成功删除所有记忆")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+            except Exception as e:
+                span.fail()
+                error_msg = f"删除所有记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
+
+    async def health_check(self) -> bool:
+        """
+        检查OpenMemory服务器健康状态
+
+        Returns:
+            bool: 服务器是否健康
+        """
+        try:
+            await self._make_request('GET', '/health', retries=1)
+            return True
+        except Exception as e:
+            logging.warning(f"OpenMemory服务器健康检查失败: {e}")
+            return False
+
+    async def close(self):
+        """关闭会话并释放连接池。"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "AsyncOpenMemoryClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+# 全局客户端实例
+_async_openmemory_client = None
+
+
+def get_async_openmemory_client() -> AsyncOpenMemoryClient:
+    """
+    获取全局OpenMemory异步客户端实例（单例模式）
+
+    Returns:
+        AsyncOpenMemoryClient: 客户端实例
+    """
+    global _async_openmemory_client
+    if _async_openmemory_client is None:
+        _async_openmemory_client = AsyncOpenMemoryClient()
+    return _async_openmemory_client
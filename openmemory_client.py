@@ -4,24 +4,64 @@ OpenMemory MCP 客户端模块
 该模块提供与 OpenMemory MCP 服务器的集成，包括：
 - 记忆的添加、搜索、列表和删除功能
 - 自动初始化和配置管理
-- 错误处理和重试机制
+- 连接/读取超时，带抖动的指数退避重试与重试预算
+- 熔断器：服务器不可用时立即失败，冷却后半开探测恢复（状态导出到指标）
+- 可选的后台批量写入：添加记忆只入队即返回，搜索和列表结果合并尚未写出的记忆
+- 搜索结果经共享的 TTL 缓存（见 search_cache），添加或删除记忆后该用户的缓存失效
+- 用户取 memory_manager.user_context() 中的当前用户，未设置时为客户端的默认用户；
+  同一客户端可以为多个用户服务，后台批量写入按用户分组
+- 添加、搜索、列表、删除操作记录到统一的指标（后端名为 "openmemory"）
 """
 
+import atexit
 import json
 import logging
+import time
 import requests
-from typing import Optional, Dict, Any
-from llm_config import get_llm_config
+from typing import Optional, Dict, Any, List, Tuple
+from circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from llm_config import LLMConfig, get_llm_config
+from memory_metrics import get_metrics, count_results
+from search_cache import get_search_cache
+from memory_manager import current_user_id
+from write_behind import BatchWriteError, WriteBehindQueue, merge_pending
+
+
+class WriteUncertainError(Exception):
+    """非幂等请求失败，但服务器可能已经处理了该请求（读取超时或 5xx），重试可能导致重复写入"""
+
 
 class OpenMemoryClient:
-    """OpenMemory MCP 客户端"""
+    """
+    OpenMemory MCP 客户端
+
+    Args:
+        base_url: 服务器地址，默认取 LLMConfig.OPENMEMORY_API_BASE
+        user_id: 默认用户ID（不在 memory_manager.user_context() 中时使用），默认取 LLMConfig.USER_ID
+        client_name: 客户端名称，默认取 LLMConfig.CLIENT_NAME
+        connect_timeout: 建立连接的超时（秒），默认取 LLMConfig.OPENMEMORY_CONNECT_TIMEOUT
+        read_timeout: 等待响应的超时（秒），默认取 LLMConfig.OPENMEMORY_READ_TIMEOUT
+        breaker: 熔断器，默认连续失败 5 次后熔断 30 秒
+        retry_budget: 重试预算，默认重试量不超过请求量的 20%
+        write_behind: 是否开启后台批量写入，默认取 LLMConfig.OPENMEMORY_WRITE_BEHIND
+    """
     
-    def __init__(self):
+    def __init__(self, base_url: str = None, user_id: str = None, client_name: str = None,
+                 connect_timeout: float = None, read_timeout: float = None,
+                 breaker: Optional[CircuitBreaker] = None, retry_budget: Optional[RetryBudget] = None,
+                 write_behind: bool = None):
         """初始化 OpenMemory 客户端"""
-        self.config = get_llm_config()
-        self.base_url = self.config.OPENMEMORY_API_BASE
-        self.user_id = self.config.USER_ID
-        self.client_name = self.config.CLIENT_NAME
+        if base_url is None or user_id is None or client_name is None:
+            self.config = get_llm_config()
+        else:
+            self.config = LLMConfig
+        self.base_url = base_url or self.config.OPENMEMORY_API_BASE
+        self.default_user_id = user_id or self.config.USER_ID
+        self.client_name = client_name or self.config.CLIENT_NAME
+        self.timeout = (connect_timeout or self.config.OPENMEMORY_CONNECT_TIMEOUT,
+                        read_timeout or self.config.OPENMEMORY_READ_TIMEOUT)
+        self.breaker = breaker or CircuitBreaker("OpenMemory")
+        self.retry_budget = retry_budget or RetryBudget()
         self.session = requests.Session()
         
         # 设置默认的请求头
@@ -29,67 +69,220 @@ class OpenMemoryClient:
             'Content-Type': 'application/json',
             'User-Agent': f'LangChain-Agent-{self.client_name}'
         })
+        self.search_cache = get_search_cache()
+        self._write_queue: Optional[WriteBehindQueue] = None
+        if self.config.OPENMEMORY_WRITE_BEHIND if write_behind is None else write_behind:
+            self.enable_write_behind(self.config.OPENMEMORY_WRITE_BATCH_SIZE,
+                                     self.config.OPENMEMORY_WRITE_FLUSH_INTERVAL)
+        get_metrics().register_gauges("openmemory", self._gauges)
+        
+        logging.info(f"OpenMemory客户端初始化完成 - 用户ID: {self.default_user_id}, 客户端名称: {self.client_name}")
+    
+    @property
+    def user_id(self) -> str:
+        """当前用户：memory_manager.user_context() 中的用户，未设置时为 default_user_id"""
+        return current_user_id() or self.default_user_id
+    
+    def enable_write_behind(self, max_batch: int = 16, flush_interval: float = 0.5,
+                            max_pending: int = 1000):
+        """
+        开启后台批量写入
+        
+        之后的 add_memory 只把记忆放入有界队列并立即返回，后台线程凑满 max_batch 条
+        或最早一条等待 flush_interval 秒后，按元数据分组、每组一个请求写出
+        （一个请求携带多条 messages）。队列已满时退回同步写入。
+        进程退出时会尽量写完队列中的记忆。
+        
+        Args:
+            max_batch: 每批最多记忆条数
+            flush_interval: 记忆在队列中的最长等待秒数
+            max_pending: 队列容量
+        """
+        if self._write_queue is not None:
+            return
+        self._write_queue = WriteBehindQueue(self._write_batch, max_batch, flush_interval,
+                                             max_pending, name="OpenMemory写入队列")
+        atexit.register(self.close)
+    
+    def _write_batch(self, items: List[Tuple[str, Optional[Dict], str]]):
+        """
+        写出一批 (文本, 元数据, 用户ID)，用户与元数据都相同的记忆合并为一个请求
+        
+        各组分别写出，某组失败不影响其他组；有失败时抛出 BatchWriteError，
+        只有确定未写入的组可以重试，读取超时或 5xx 的组可能已写入，不再重试；
+        因熔断被拒绝的组留待冷却结束后重试，不计入尝试次数。
+        """
+        groups: Dict[Tuple[str, str], Tuple[Dict, List[Tuple[str, Optional[Dict], str]]]] = {}
+        for item in items:
+            metadata = item[1] or {"source": "langchain_agent", "client": self.client_name}
+            key = (item[2], json.dumps(metadata, sort_keys=True, ensure_ascii=False))
+            groups.setdefault(key, (metadata, []))[1].append(item)
+        retry, uncertain, deferred, errors = [], [], [], []
+        retry_in = 0.0
+        for (user_id, _), (metadata, group) in groups.items():
+            texts = [text for text, _, _ in group]
+            with get_metrics().track("openmemory", "write_batch", user_id) as span:
+                span.set_payload(nbytes=sum(len(text.encode("utf-8")) for text in texts))
+                span.set_results(len(texts))
+                data = {
+                    "messages": [{"role": "user", "content": text} for text in texts],
+                    "user_id": user_id,
+                    "metadata": metadata
+                }
+                try:
+                    self._make_request('POST', '/api/v1/memories/', data, idempotent=False)
+                except CircuitOpenError as e:
+                    span.fail()
+                    deferred.extend(group)
+                    retry_in = max(retry_in, e.retry_in)
+                    errors.append(str(e))
+                    continue
+                except WriteUncertainError as e:
+                    span.fail()
+                    uncertain.extend(group)
+                    errors.append(str(e))
+                    continue
+                except Exception as e:
+                    span.fail()
+                    retry.extend(group)
+                    errors.append(str(e))
+                    continue
+                finally:
+                    # 缓存的远程结果不含这批记忆，写出后它们也不再由队列补上
+                    self.search_cache.invalidate("openmemory", user_id)
+            logging.info(f"批量写入 {len(texts)} 条记忆")
+        if errors:
+            raise BatchWriteError("; ".join(errors), retry, uncertain, deferred, retry_in)
+    
+    def _with_pending(self, response: Any, limit: Optional[int] = None,
+                      query: Optional[str] = None) -> Any:
+        """将当前用户尚未写出的记忆（最新的在前，标记 pending）合并到远程返回的结果之后，给定 query 时只合并匹配的记忆。"""
+        if self._write_queue is None:
+            return response
+        user_id = self.user_id
+        pending = [text for text, _, user in reversed(self._write_queue.pending()) if user == user_id]
+        return merge_pending(response, pending, limit, query)
+    
+    def flush_writes(self, timeout: Optional[float] = None) -> bool:
+        """
+        立即写出后台队列中的记忆并等待完成
         
-        logging.info(f"OpenMemory客户端初始化完成 - 用户ID: {self.user_id}, 客户端名称: {self.client_name}")
+        Returns:
+            bool: 是否在 timeout 秒内写完；未开启后台写入时返回 True
+        """
+        return self._write_queue is None or self._write_queue.flush(timeout)
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, retries: int = 3) -> Dict[str, Any]:
+    def close(self, timeout: Optional[float] = 10.0) -> bool:
+        """
+        写完后台队列中的记忆并停止后台线程，之后的添加改为同步写入
+        
+        Returns:
+            bool: 是否在 timeout 秒内写完
+        """
+        if self._write_queue is None:
+            return True
+        return self._write_queue.close(timeout)
+    
+    def _gauges(self) -> Dict[str, float]:
+        gauges = self.breaker.gauges()
+        if self._write_queue is not None:
+            stats = self._write_queue.stats()
+            gauges["write_queue_pending"] = stats["pending"]
+            gauges["write_queue_dropped_total"] = stats["dropped"]
+            gauges["write_queue_uncertain_total"] = stats["uncertain"]
+        return gauges
+    
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, retries: int = 3,
+                      idempotent: bool = True) -> Dict[str, Any]:
         """
         发送HTTP请求到OpenMemory API
         
+        连接失败、超时和 5xx/429 响应按带抖动的指数退避重试，并计入熔断器；
+        重试受重试预算限制。熔断器打开时不发送请求，立即失败。
+        
         Args:
             method: HTTP方法 (GET, POST, DELETE等)
             endpoint: API端点
             data: 请求数据
-            retries: 重试次数
+            retries: 最多尝试次数（含首次）
+            idempotent: 请求是否可安全重复；为 False 时读取超时和 5xx 不重试，
+                避免服务器已处理的写入被重复执行
             
         Returns:
             Dict: API响应数据
             
         Raises:
+            CircuitOpenError: 熔断器打开时
+            WriteUncertainError: 非幂等请求读取超时或收到 5xx 时
             Exception: 当请求失败时
         """
+        method = method.upper()
+        if method not in ('GET', 'POST', 'DELETE'):
+            raise ValueError(f"不支持的HTTP方法: {method}")
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        kwargs = {"params": data} if method == 'GET' else {"json": data}
+        self.retry_budget.record_request()
+        error_msg = None
+        uncertain = False
         
         for attempt in range(retries):
+            if attempt:
+                if not self.retry_budget.try_spend():
+                    logging.warning("OpenMemory重试预算已用尽，放弃重试")
+                    break
+                delay = backoff_delay(attempt)
+                logging.warning(f"{error_msg}，{delay:.2f}秒后重试 (第{attempt}次)...")
+                time.sleep(delay)
+            self.breaker.acquire()
             try:
-                if method.upper() == 'GET':
-                    response = self.session.get(url, params=data)
-                elif method.upper() == 'POST':
-                    response = self.session.post(url, json=data)
-                elif method.upper() == 'DELETE':
-                    response = self.session.delete(url, json=data)
-                else:
-                    raise ValueError(f"不支持的HTTP方法: {method}")
-                
-                response.raise_for_status()
-                
-                # 尝试解析JSON响应
-                try:
-                    return response.json()
-                except json.JSONDecodeError:
-                    return {"message": response.text, "status": "success"}
-                    
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
             except requests.exceptions.ConnectionError as e:
-                if attempt < retries - 1:
-                    logging.warning(f"连接失败，正在重试 (第{attempt + 1}次)...")
-                    continue
-                else:
-                    raise Exception(f"无法连接到OpenMemory服务器: {e}")
-            except requests.exceptions.HTTPError as e:
+                # 包括连接超时，此时请求尚未发出，可以安全重试
+                self.breaker.record_failure()
+                error_msg = f"无法连接到OpenMemory服务器: {e}"
+                continue
+            except requests.exceptions.Timeout as e:
+                self.breaker.record_failure()
+                error_msg = f"OpenMemory服务器响应超时: {e}"
+                if not idempotent:
+                    uncertain = True
+                    break
+                continue
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                raise Exception(f"请求失败: {e}")
+            
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure()
+                error_msg = f"HTTP错误 {response.status_code}: {response.text}"
+                logging.error(error_msg)
+                if not idempotent:
+                    uncertain = response.status_code != 429
+                    break
+                continue
+            # 服务器可达，4xx 属于请求本身的问题，不影响熔断器
+            self.breaker.record_success()
+            if response.status_code >= 400:
                 error_msg = f"HTTP错误 {response.status_code}: {response.text}"
                 logging.error(error_msg)
                 raise Exception(error_msg)
-            except Exception as e:
-                if attempt < retries - 1:
-                    logging.warning(f"请求失败，正在重试: {e}")
-                    continue
-                else:
-                    raise Exception(f"请求失败: {e}")
+            
+            # 尝试解析JSON响应
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return {"message": response.text, "status": "success"}
+        
+        if uncertain:
+            raise WriteUncertainError(error_msg)
+        raise Exception(error_msg)
     
     def add_memory(self, text: str, metadata: Optional[Dict] = None) -> str:
         """
         添加新的记忆
         
+        开启后台批量写入时只入队并立即返回 {"status": "queued", ...}。
+        
         Args:
             text: 要记忆的文本内容
             metadata: 可选的元数据
@@ -97,29 +290,42 @@ class OpenMemoryClient:
         Returns:
             str: 操作结果
         """
-        try:
-            # 使用 mem0ai 格式的数据结构
-            data = {
-                "messages": [
-                    {"role": "user", "content": text}
-                ],
-                "user_id": self.user_id,
-                "metadata": metadata or {"source": "langchain_agent", "client": self.client_name}
-            }
-            
-            response = self._make_request('POST', '/api/v1/memories/', data)
-            logging.info(f"成功添加记忆: {text[:50]}...")
-            return json.dumps(response, ensure_ascii=False, indent=2)
-            
-        except Exception as e:
-            error_msg = f"添加记忆失败: {e}"
-            logging.error(error_msg)
-            return error_msg
+        user_id = self.user_id
+        with get_metrics().track("openmemory", "add_memory", user_id) as span:
+            span.set_payload(text)
+            if self._write_queue is not None and self._write_queue.put((text, metadata, user_id)):
+                self.search_cache.invalidate("openmemory", user_id)
+                return json.dumps({"status": "queued", "pending": len(self._write_queue)},
+                                  ensure_ascii=False, indent=2)
+            try:
+                # 使用 mem0ai 格式的数据结构
+                data = {
+                    "messages": [
+                        {"role": "user", "content": text}
+                    ],
+                    "user_id": self.user_id,
+                    "metadata": metadata or {"source": "langchain_agent", "client": self.client_name}
+                }
+                
+                try:
+                    response = self._make_request('POST', '/api/v1/memories/', data, idempotent=False)
+                finally:
+                    self.search_cache.invalidate("openmemory", self.user_id)
+                logging.info(f"成功添加记忆: {text[:50]}...")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+                
+            except Exception as e:
+                span.fail()
+                error_msg = f"添加记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
     
     def search_memory(self, query: str, limit: int = 10) -> str:
         """
         搜索记忆
         
+        同一用户的相同查询在缓存有效期内直接返回缓存的结果，不请求服务器。
+        
         Args:
             query: 搜索查询
             limit: 返回结果的最大数量
@@ -127,21 +333,31 @@ class OpenMemoryClient:
         Returns:
             str: 搜索结果JSON字符串
         """
-        try:
-            data = {
-                "query": query,
-                "user_id": self.user_id,
-                "limit": limit
-            }
-            
-            response = self._make_request('POST', '/api/v1/memories/search/', data)
-            logging.info(f"搜索记忆完成，查询: {query}")
-            return json.dumps(response, ensure_ascii=False, indent=2)
-            
-        except Exception as e:
-            error_msg = f"搜索记忆失败: {e}"
-            logging.error(error_msg)
-            return error_msg
+        with get_metrics().track("openmemory", "search_memory", self.user_id) as span:
+            span.set_payload(query)
+            try:
+                cache_key = self.search_cache.key("openmemory", self.user_id, query, limit)
+                response = self.search_cache.get(cache_key)
+                if response is None:
+                    generation = self.search_cache.generation("openmemory", self.user_id)
+                    data = {
+                        "query": query,
+                        "user_id": self.user_id,
+                        "limit": limit
+                    }
+                    response = self._make_request('POST', '/api/v1/memories/search/', data)
+                    self.search_cache.put(cache_key, response, generation)
+                
+                response = self._with_pending(response, limit, query)
+                span.set_results(count_results(response))
+                logging.info(f"搜索记忆完成，查询: {query}")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+                
+            except Exception as e:
+                span.fail()
+                error_msg = f"搜索记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
     
     def list_memories(self) -> str:
         """
@@ -150,16 +366,19 @@ class OpenMemoryClient:
         Returns:
             str: 记忆列表JSON字符串
         """
-        try:
-            data = {"user_id": self.user_id}
-            response = self._make_request('GET', '/api/v1/memories/', data)
-            logging.info("获取记忆列表完成")
-            return json.dumps(response, ensure_ascii=False, indent=2)
-            
-        except Exception as e:
-            error_msg = f"获取记忆列表失败: {e}"
-            logging.error(error_msg)
-            return error_msg
+        with get_metrics().track("openmemory", "list_memories", self.user_id) as span:
+            try:
+                data = {"user_id": self.user_id}
+                response = self._with_pending(self._make_request('GET', '/api/v1/memories/', data))
+                span.set_results(count_results(response))
+                logging.info("获取记忆列表完成")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+                
+            except Exception as e:
+                span.fail()
+                error_msg = f"获取记忆列表失败: {e}"
+                logging.error(error_msg)
+                return error_msg
     
     def delete_all_memories(self) -> str:
         """
@@ -168,16 +387,23 @@ class OpenMemoryClient:
         Returns:
             str: 操作结果
         """
-        try:
-            data = {"user_id": self.user_id}
-            response = self._make_request('DELETE', '/api/v1/memories/', data)
-            logging.info("成功删除所有记忆")
-            return json.dumps(response, ensure_ascii=False, indent=2)
-            
-        except Exception as e:
-            error_msg = f"删除所有记忆失败: {e}"
-            logging.error(error_msg)
-            return error_msg
+        with get_metrics().track("openmemory", "delete_all_memories", self.user_id) as span:
+            try:
+                # 先写出队列中的记忆，使删除覆盖之前的全部添加
+                self.flush_writes(timeout=30)
+                data = {"user_id": self.user_id}
+                try:
+                    response = self._make_request('DELETE', '/api/v1/memories/', data)
+                finally:
+                    self.search_cache.invalidate("openmemory", self.user_id)
+                logging.info("成功删除所有记忆")
+                return json.dumps(response, ensure_ascii=False, indent=2)
+                
+            except Exception as e:
+                span.fail()
+                error_msg = f"删除所有记忆失败: {e}"
+                logging.error(error_msg)
+                return error_msg
     
     def health_check(self) -> bool:
         """
@@ -187,7 +413,7 @@ class OpenMemoryClient:
             bool: 服务器是否健康
         """
         try:
-            response = self._make_request('GET', '/health', retries=1)
+            self._make_request('GET', '/health', retries=1)
             return True
         except Exception as e:
             logging.warning(f"OpenMemory服务器健康检查失败: {e}")
@@ -124,16 +124,30 @@ def get_openmemory_tools():
     ]
 
 # 检查 OpenMemory 服务可用性
-def check_openmemory_service():
+def check_openmemory_service(detailed: bool = False):
     """
     检查 OpenMemory 服务是否可用
     
+    熔断器打开期间直接返回不可用，不发送健康检查请求；冷却时间过后的检查即为半开探测。
+    
+    Args:
+        detailed: 为 True 时返回包含熔断器状态的字典
+    
     Returns:
-        bool: 服务是否可用
+        bool: 服务是否可用；detailed 为 True 时返回
+            {"available": bool, "circuit": 熔断器状态（见 CircuitBreaker.stats）}
     """
+    circuit = None
     try:
         client = get_openmemory_client()
-        return client.health_check()
+        available = client.health_check()
+        circuit = client.breaker.stats()
+        if circuit["state"] != "closed":
+            logging.warning(f"OpenMemory 熔断器状态: {circuit['state']}，"
+                            f"{circuit['retry_in']:.1f} 秒后重新探测")
     except Exception as e:
         logging.warning(f"OpenMemory 服务检查失败: {e}")
-        return False 
\ No newline at end of file
+        available = False
+    if detailed:
+        return {"available": available, "circuit": circuit}
+    return available 
\ No newline at end of file
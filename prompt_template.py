@@ -3,6 +3,7 @@ Prompt 模板模块
 
 功能：
 - 定义并返回一个用于生成翻译任务的Prompt模板
+- 定义 ReAct Agent 的Prompt模板，以及预取模式下带记忆段落的版本
 """
 from langchain_core.prompts import ChatPromptTemplate
 
@@ -67,4 +68,48 @@ Thought:{agent_scratchpad}
 """
     # from_template 方法会自动处理模板中的占位符
     prompt = ChatPromptTemplate.from_template(template)
-    return prompt 
\ No newline at end of file
+    return prompt
+
+
+def get_prefetch_agent_prompt_template():
+    """
+    创建一个用于预取模式 ReAct Agent 的 Prompt 模板。
+
+    与 get_agent_prompt_template 相同，另外包含一个记忆上下文段落：
+    chain_factory 在调用模型之前已经搜索了与问题相关的记忆，模型可以直接根据这些记忆回答，
+    不需要先输出一次 search_memory 的 Action。
+
+    - memories: 预先检索到的相关记忆，每行一条。
+    - input、agent_scratchpad: 同 get_agent_prompt_template。
+
+    Returns:
+        ChatPromptTemplate: 用于 Agent 的聊天提示模板。
+    """
+    template = """
+Answer the following questions as best you can.
+
+Relevant memories about the user, already retrieved for this question (use them directly, they may be empty):
+{memories}
+
+You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}
+"""
+    prompt = ChatPromptTemplate.from_template(template)
+    return prompt
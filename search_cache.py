@@ -0,0 +1,144 @@
+"""
+远程记忆搜索结果缓存模块
+
+功能：
+- 为 Mem0、OpenMemory 等远程客户端提供共享的读穿透缓存：
+  键为 (后端, 用户ID, 规范化后的查询, limit)，带 TTL 与条数上限（LRU 淘汰）。
+- 查询规范化：Unicode NFKC、转小写、合并空白、去掉首尾的标点，
+  “我叫什么名字？”与“我叫什么名字”命中同一条缓存。
+- 每个 (后端, 用户) 有一个写入代数，该用户添加或删除记忆后代数加一，旧结果全部失效；
+  搜索开始前取得代数并随结果一起写入，搜索期间发生的写入不会让旧结果被缓存为新结果。
+- 由环境变量 REMOTE_SEARCH_CACHE_TTL（秒，0 为关闭）与 REMOTE_SEARCH_CACHE_SIZE 配置。
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from memory_metrics import get_metrics
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "?？!！.。,，;；:：~～'\"“”‘’ "
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本，用作缓存键。"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _SPACES.sub(" ", query).strip(_EDGE_PUNCTUATION)
+
+
+class SearchCache:
+    """
+    远程搜索结果缓存
+
+    Args:
+        ttl: 结果的有效秒数，为 0 时关闭缓存
+        max_entries: 最多缓存的结果条数
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 键 → (写入代数, 过期时间, 结果)
+        self._entries: "OrderedDict[Tuple, Tuple[int, float, Any]]" = OrderedDict()
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key(backend: str, user_id: str, query: str, limit: int) -> Tuple:
+        return (backend, user_id, normalize_query(query), limit)
+
+    def generation(self, backend: str, user_id: str) -> int:
+        """返回用户当前的写入代数，在发起远程搜索之前调用。"""
+        return self._generations.get((backend, user_id), 0)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """返回未过期且未被写入作废的结果，没有时返回 None。"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, expires_at, value = entry
+                if generation == self._generations.get(key[:2], 0) and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, value: Any, generation: int):
+        """
+        缓存一次搜索的结果
+
+        Args:
+            key: SearchCache.key 返回的键
+            value: 结果，缓存期间不应被修改
+            generation: 发起搜索前由 generation() 取得的代数；此后该用户有写入时不缓存
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self._generations.get(key[:2], 0):
+                return
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, backend: str, user_id: str):
+        """作废一个用户的全部缓存结果，在该用户添加或删除记忆之后调用。"""
+        with self._lock:
+            user = (backend, user_id)
+            self._generations[user] = self._generations.get(user, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        返回缓存统计
+
+        Returns:
+            Dict: entries、hits、misses、hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def gauges(self) -> Dict[str, float]:
+        stats = self.stats()
+        return {
+            "search_cache_entries": stats["entries"],
+            "search_cache_hits_total": stats["hits"],
+            "search_cache_misses_total": stats["misses"],
+        }
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """返回远程客户端共享的搜索缓存，首次调用时按环境变量创建并注册指标。"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache(float(os.getenv("REMOTE_SEARCH_CACHE_TTL") or 60),
+                                    int(os.getenv("REMOTE_SEARCH_CACHE_SIZE") or 1024))
+        get_metrics().register_gauges("remote", _search_cache.gauges)
+    return _search_cache
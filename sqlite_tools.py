@@ -0,0 +1,394 @@
+"""
+SQLite 记忆存储工具模块
+
+功能：
+- 基于标准库 sqlite3 的本地记忆存储，介于进程内列表与远程 Mem0/OpenMemory 之间。
+- 使用 WAL 日志模式：读取不阻塞写入，每个线程持有独立连接。
+- 两张 FTS5 全文索引表：trigram 分词器负责 3 字及以上的子串匹配，
+  词元表（中文单字+二元组、拉丁单词）负责短关键词，二者都用 bm25() 排序。
+- 批量写入在单个事务内用 executemany 完成；SQL 语句均为常量，
+  由 sqlite3 的语句缓存复用已编译的预处理语句。
+- 记忆只保存在数据库中，搜索与列表都带 LIMIT，百万级记忆无需载入 Python 内存。
+- 提供与 MemoryManager 兼容的接口，以及供 Agent 使用的 LangChain 工具。
+- 添加、搜索、列表、清空操作记录到统一的指标（后端名为 "sqlite"）。
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Type
+
+from langchain.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from llm_config import get_llm_config
+from memory_index import CJKNgramTokenizer
+from memory_manager import current_user_id, expand_keywords
+from memory_metrics import get_metrics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memories_user ON memories(user_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+    content, content='memories', content_rowid='id', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS memories_terms USING fts5(terms, content='');
+CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+    INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+_INSERT_MEMORY = "INSERT INTO memories(user_id, content, created_at) VALUES (?, ?, ?)"
+# 逐行触发器的开销约为整批 INSERT ... SELECT 的两倍，因此写入时按ID范围整批建立索引
+_INDEX_TRIGRAM = "INSERT INTO memories_fts(rowid, content) SELECT id, content FROM memories WHERE id BETWEEN ? AND ?"
+_INSERT_TERMS = "INSERT INTO memories_terms(rowid, terms) VALUES (?, ?)"
+_DELETE_TERMS = "INSERT INTO memories_terms(memories_terms, rowid, terms) VALUES ('delete', ?, ?)"
+_SELECT_USER_ROWS = "SELECT id, content FROM memories WHERE user_id = ? ORDER BY id"
+_DELETE_USER = "DELETE FROM memories WHERE user_id = ?"
+_SEARCH_TRIGRAM = """
+SELECT m.id, m.content, -bm25(memories_fts) FROM memories_fts
+JOIN memories m ON m.id = memories_fts.rowid
+WHERE memories_fts MATCH ? AND m.user_id = ?
+ORDER BY bm25(memories_fts) LIMIT ?
+"""
+_SEARCH_TERMS = """
+SELECT m.id, m.content, -bm25(memories_terms) FROM memories_terms
+JOIN memories m ON m.id = memories_terms.rowid
+WHERE memories_terms MATCH ? AND m.user_id = ?
+ORDER BY bm25(memories_terms) LIMIT ?
+"""
+_LIST_MEMORIES = "SELECT content FROM memories WHERE user_id = ? ORDER BY id LIMIT ?"
+_LIST_USERS = "SELECT DISTINCT user_id FROM memories"
+_COUNT_USER = "SELECT count(*), coalesce(sum(length(content)), 0) FROM memories WHERE user_id = ?"
+
+# trigram 分词器无法索引短于 3 个字符的关键词
+_TRIGRAM_MIN_LENGTH = 3
+
+
+def _phrase(text: str) -> str:
+    """将文本转义为 FTS5 短语。"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class SQLiteMemoryStore:
+    """
+    SQLite 记忆存储
+
+    Args:
+        path: 数据库文件路径，":memory:" 时仅供单线程测试使用
+        default_user_id: 未指定用户且不在 memory_manager.user_context() 中时使用的用户ID
+        default_limit: 搜索默认返回的数量上限
+        synchronous: WAL 模式下的 PRAGMA synchronous，NORMAL 只在检查点时 fsync
+    """
+
+    def __init__(self, path: str, default_user_id: str = "default_user", default_limit: int = 10,
+                 synchronous: str = "NORMAL"):
+        directory = os.path.dirname(os.path.abspath(path))
+        if path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.default_user_id = default_user_id
+        self.default_limit = default_limit
+        self.synchronous = synchronous
+        # 与 MemoryIndex 的 BM25 一致：查询按二元组切分，单字保留原样
+        self._query_tokenizer = CJKNgramTokenizer()
+        self._term_tokenizer = CJKNgramTokenizer(ngram_sizes=(1, 2))
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """返回当前线程的连接，首次使用时创建。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
+
+    def _resolve_user(self, user_id: Optional[str]) -> str:
+        """按显式参数、当前上下文、默认用户的顺序确定用户ID。"""
+        return user_id or current_user_id() or self.default_user_id
+
+    def _terms(self, text: str) -> str:
+        """返回写入词元表的文本：词元之间以空格分隔。"""
+        return " ".join(set(self._term_tokenizer.tokenize(text)))
+
+    def add_memory(self, data: str, user_id: str = None):
+        """添加一条记忆。"""
+        user_id = self._resolve_user(user_id)
+        with get_metrics().track("sqlite", "add_memory", user_id) as span:
+            span.set_payload(data)
+            self.add_memories([data], user_id=user_id)
+
+    def add_memories(self, texts: Iterable[str], user_id: str = None, batch_size: int = 10_000) -> int:
+        """
+        批量添加记忆，每 batch_size 条在一个事务内写入
+
+        Args:
+            texts: 记忆文本
+            user_id: 用户ID，默认取当前上下文用户
+            batch_size: 每个事务写入的条数
+
+        Returns:
+            int: 写入的记忆条数
+        """
+        user_id = self._resolve_user(user_id)
+        conn = self._connection()
+        total = 0
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                total += self._insert_batch(conn, user_id, batch)
+                batch = []
+        if batch:
+            total += self._insert_batch(conn, user_id, batch)
+        return total
+
+    def _insert_batch(self, conn: sqlite3.Connection, user_id: str, texts: List[str]) -> int:
+        """在一个事务内写入一批记忆及其词元。"""
+        now = time.time()
+        with self._write_lock, conn:
+            cursor = conn.execute(_INSERT_MEMORY, (user_id, texts[0], now))
+            first_id = cursor.lastrowid
+            conn.executemany(_INSERT_MEMORY, ((user_id, text, now) for text in texts[1:]))
+            # 同一事务内的写入独占数据库，这批记忆的ID连续
+            conn.execute(_INDEX_TRIGRAM, (first_id, first_id + len(texts) - 1))
+            conn.executemany(_INSERT_TERMS, ((first_id + i, self._terms(text))
+                                             for i, text in enumerate(texts)))
+        return len(texts)
+
+    def search_memory(self, query: str, limit: int = None, min_score: float = None,
+                      user_id: str = None) -> list:
+        """
+        搜索记忆
+
+        查询先经过关键词映射扩展；3 字及以上的关键词在 trigram 表中做短语匹配，
+        全部关键词切分为词元后在词元表中匹配。两张表的 bm25 得分按记忆相加后排序。
+
+        Args:
+            query: 搜索查询
+            limit: 返回数量上限，默认取 default_limit
+            min_score: 最低得分
+            user_id: 用户ID，默认取当前上下文用户
+
+        Returns:
+            list: 记忆列表，按得分降序并已去重
+        """
+        user_id = self._resolve_user(user_id)
+        with get_metrics().track("sqlite", "search_memory", user_id) as span:
+            span.set_payload(query)
+            results = [mem for mem, _ in self.ranked_search(query, limit, min_score or 0.0, user_id)]
+            span.set_results(len(results))
+        return results
+
+    def ranked_search(self, query: str, limit: int = None, min_score: float = 0.0,
+                      user_id: str = None) -> list:
+        """
+        按 bm25 得分搜索记忆
+
+        Returns:
+            list: (记忆, 得分) 列表，按得分降序
+        """
+        if limit is None:
+            limit = self.default_limit
+        user_id = self._resolve_user(user_id)
+        keywords = expand_keywords(query)
+        phrases = [_phrase(kw) for kw in keywords if len(kw) >= _TRIGRAM_MIN_LENGTH]
+        tokens = []
+        for keyword in keywords:
+            tokens.extend(self._query_tokenizer.query_tokens(keyword))
+        terms = [_phrase(token) for token in dict.fromkeys(tokens)]
+
+        # 多取一些候选，抵消内容重复的记忆
+        fetch = 2 * limit
+        conn = self._connection()
+        scores: Dict[int, list] = {}
+        for sql, clauses in ((_SEARCH_TRIGRAM, phrases), (_SEARCH_TERMS, terms)):
+            if not clauses:
+                continue
+            for doc_id, content, score in conn.execute(sql, (" OR ".join(clauses), user_id, fetch)):
+                entry = scores.get(doc_id)
+                if entry is None:
+                    scores[doc_id] = [content, score]
+                else:
+                    entry[1] += score
+
+        best = {}
+        for doc_id, (content, score) in scores.items():
+            if score < min_score:
+                continue
+            current = best.get(content)
+            if current is None or (score, -doc_id) > current:
+                best[content] = (score, -doc_id)
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(mem, score) for mem, (score, _) in ranked]
+
+    def clear_memory(self, user_id: str = None):
+        """清空用户的所有记忆。"""
+        user_id = self._resolve_user(user_id)
+        conn = self._connection()
+        with get_metrics().track("sqlite", "delete_all_memories", user_id), self._write_lock, conn:
+            # 词元表不保存原文，删除时需要重新生成词元
+            rows = conn.execute(_SELECT_USER_ROWS, (user_id,))
+            conn.executemany(_DELETE_TERMS, ((doc_id, self._terms(content)) for doc_id, content in rows))
+            conn.execute(_DELETE_USER, (user_id,))
+
+    def list_all_memories(self, user_id: str = None, limit: int = None) -> list:
+        """按添加顺序列出用户的记忆，limit 为空时不限制。"""
+        user_id = self._resolve_user(user_id)
+        with get_metrics().track("sqlite", "list_memories", user_id) as span:
+            rows = self._connection().execute(_LIST_MEMORIES, (user_id, -1 if limit is None else limit))
+            memories = [content for content, in rows]
+            span.set_results(len(memories))
+        return memories
+
+    def list_users(self) -> list:
+        """列出已有记忆的用户ID。"""
+        return [user_id for user_id, in self._connection().execute(_LIST_USERS)]
+
+    def get_stats(self, user_id: str = None) -> dict:
+        """返回用户的记忆条数与文本字符数。"""
+        user_id = self._resolve_user(user_id)
+        memories, text_chars = self._connection().execute(_COUNT_USER, (user_id,)).fetchone()
+        return {"memories": memories, "text_chars": text_chars}
+
+    def optimize(self):
+        """合并 FTS5 索引段并做一次 WAL 检查点，适合在批量导入后调用。"""
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('optimize')")
+            conn.execute("INSERT INTO memories_terms(memories_terms) VALUES ('optimize')")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        """关闭当前线程的连接。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# 未配置 SQLITE_MEMORY_PATH 时使用的数据库文件
+DEFAULT_SQLITE_PATH = "memory.db"
+
+# 全局存储实例
+_sqlite_store = None
+_sqlite_store_lock = threading.Lock()
+
+def get_sqlite_store() -> SQLiteMemoryStore:
+    """获取全局 SQLite 记忆存储实例（单例模式）"""
+    global _sqlite_store
+    if _sqlite_store is None:
+        with _sqlite_store_lock:
+            if _sqlite_store is None:
+                config = get_llm_config()
+                path = config.SQLITE_MEMORY_PATH or DEFAULT_SQLITE_PATH
+                _sqlite_store = SQLiteMemoryStore(path, default_user_id=config.USER_ID)
+    return _sqlite_store
+
+# 工具定义
+class AddMemoryInput(BaseModel):
+    """添加记忆工具的输入参数"""
+    text: str = Field(description="要记忆的文本内容")
+
+class AddMemoryTool(BaseTool):
+    """添加记忆到 SQLite 的工具"""
+    name: str = "add_memory"
+    description: str = ("用于添加新的记忆信息。当用户告诉你任何关于他们自己的信息、偏好、"
+                       "或任何可能在未来对话中有用的相关信息时调用此工具。"
+                       "例如：姓名、喜好、经历、工作信息等。")
+    args_schema: Type[BaseModel] = AddMemoryInput
+
+    def _run(self, text: str) -> str:
+        """执行添加记忆操作"""
+        try:
+            get_sqlite_store().add_memory(text)
+            return f"已成功记住: {text}"
+        except Exception as e:
+            error_msg = f"添加记忆时发生错误: {e}"
+            logging.error(error_msg)
+            return error_msg
+
+class SearchMemoryInput(BaseModel):
+    """搜索记忆工具的输入参数"""
+    query: str = Field(description="搜索查询，用于查找相关的记忆内容")
+
+class SearchMemoryTool(BaseTool):
+    """从 SQLite 搜索记忆的工具"""
+    name: str = "search_memory"
+    description: str = ("用于搜索已存储的记忆信息。每当用户提问时都应该调用此工具，"
+                       "以查找可能相关的历史信息和偏好。这有助于提供更个性化的回答。")
+    args_schema: Type[BaseModel] = SearchMemoryInput
+
+    def _run(self, query: str) -> str:
+        """执行搜索记忆操作"""
+        try:
+            memories = get_sqlite_store().search_memory(query)
+            if not memories:
+                return "在我的记忆中没有找到相关信息。"
+            return "从记忆中找到以下相关信息：\n" + "\n".join(f"- {mem}" for mem in memories)
+        except Exception as e:
+            error_msg = f"搜索记忆时发生错误: {e}"
+            logging.error(error_msg)
+            return error_msg
+
+class ListMemoriesInput(BaseModel):
+    """列出记忆工具的输入参数"""
+    pass
+
+class ListMemoriesTool(BaseTool):
+    """列出最近记忆的工具"""
+    name: str = "list_memories"
+    description: str = "用于获取已存储的记忆信息的列表。当用户想要回顾或查看所有记录的信息时使用。"
+    args_schema: Type[BaseModel] = ListMemoriesInput
+    # 避免把大量记忆一次性塞进上下文
+    max_items: int = 100
+
+    def _run(self) -> str:
+        """执行列出记忆操作"""
+        try:
+            memories = get_sqlite_store().list_all_memories(limit=self.max_items)
+            if not memories:
+                return "目前没有任何记忆。"
+            return "\n".join(f"- {mem}" for mem in memories)
+        except Exception as e:
+            error_msg = f"获取记忆列表时发生错误: {e}"
+            logging.error(error_msg)
+            return error_msg
+
+def get_sqlite_tools():
+    """
+    获取所有 SQLite 记忆相关的工具
+
+    Returns:
+        list: 工具列表
+    """
+    return [
+        AddMemoryTool(),
+        SearchMemoryTool(),
+        ListMemoriesTool()
+    ]
+
+def check_sqlite_service():
+    """
+    检查 SQLite 记忆存储是否可用（数据库可打开且 SQLite 支持 FTS5 trigram 分词器）
+
+    Returns:
+        bool: 服务是否可用
+    """
+    try:
+        get_sqlite_store()._connection().execute("SELECT 1")
+        return True
+    except Exception as e:
+        logging.warning(f"SQLite 记忆存储检查失败: {e}")
+        return False
@@ -0,0 +1,287 @@
+"""
+本地向量检索模块
+
+功能：
+- 定义可插拔的嵌入器接口，内置无需联网的特征哈希嵌入器。
+- 将记忆向量保存在连续、可增长的 NumPy 矩阵中。
+- 查询时用一次矩阵-向量乘法计算全部相似度，再用 argpartition 取前 k 条。
+- 记忆数超过阈值后自动构建 IVF 近似索引（球面 k-means 聚类 + 倒排列表），
+  之后只扫描最接近查询的若干个聚类。
+
+该模块依赖 numpy，MemoryManager 仅在启用向量搜索时才导入它。
+"""
+import math
+import zlib
+from array import array
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from memory_index import Tokenizer, CJKNgramTokenizer
+
+
+class Embedder:
+    """嵌入器基类，返回 L2 归一化的 float32 向量"""
+
+    dim: int = 0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """将一批文本编码为 (len(texts), dim) 的矩阵。"""
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """将查询编码为 (dim,) 的向量。"""
+        return self.embed([text])[0]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """按行做 L2 归一化，零向量保持不变。"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder(Embedder):
+    """
+    特征哈希嵌入器
+
+    文本先经分词器切分（默认中文单字+二元组），每个词元通过 CRC32 哈希到
+    固定维度的一个位置并带上符号位，词频做对数缩放。完全离线、无需训练，
+    相同进程内外结果一致。默认 64 维：记忆通常很短，64 维足以区分，
+    且 100 万条记忆的矩阵只有 256 MiB，单核一次扫描约 30ms。
+
+    Args:
+        dim: 向量维度
+        tokenizer: 分词器
+    """
+
+    def __init__(self, dim: int = 64, tokenizer: Tokenizer = None):
+        self.dim = dim
+        self.tokenizer = tokenizer or CJKNgramTokenizer(ngram_sizes=(1, 2))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        dim = self.dim
+        for row, text in enumerate(texts):
+            vector = [0.0] * dim
+            for token, tf in Counter(self.tokenizer.tokenize(text)).items():
+                h = zlib.crc32(token.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vector[h % dim] += sign * (1.0 + math.log(tf))
+            matrix[row] = vector
+        return _normalize(matrix)
+
+
+class EmbeddingsAdapter(Embedder):
+    """
+    LangChain Embeddings 适配器
+
+    Args:
+        embeddings: 实现了 embed_documents/embed_query 的对象，如 OpenAIEmbeddings
+        dim: 向量维度
+    """
+
+    def __init__(self, embeddings, dim: int):
+        self.embeddings = embeddings
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.asarray(self.embeddings.embed_documents(list(texts)), dtype=np.float32)
+        return _normalize(vectors.reshape(len(texts), self.dim))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        return _normalize(vector.reshape(1, self.dim))[0]
+
+
+class IVFIndex:
+    """
+    倒排文件（IVF）近似最近邻索引
+
+    训练时对样本做球面 k-means 得到 n_lists 个聚类中心，每个向量归入内积最大的中心。
+    新向量只需分配到最近的中心并追加到对应列表，无需重建。查询时只扫描与查询
+    最接近的 n_probe 个列表：n_probe 越大召回率越高、延迟越长。
+
+    Args:
+        n_lists: 聚类数
+        n_probe: 查询时扫描的聚类数
+        iterations: k-means 迭代次数
+        seed: 随机种子
+    """
+
+    def __init__(self, n_lists: int, n_probe: int = 8, iterations: int = 10, seed: int = 0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self._lists = [array("q") for _ in range(n_lists)]
+
+    def train(self, sample: np.ndarray):
+        """在样本上运行球面 k-means，得到聚类中心。"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = min(self.n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            # 空聚类重新随机取一个样本作为中心
+            empty = ~sums.any(axis=1)
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums)
+        self.centroids = centroids
+        self.n_lists = n_lists
+        self._lists = [array("q") for _ in range(n_lists)]
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        """返回每个向量内积最大的聚类下标，分批计算以限制内存。"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            block = vectors[start:start + batch_size] @ centroids.T
+            assignments[start:start + batch_size] = block.argmax(axis=1)
+        return assignments
+
+    def add(self, first_id: int, vectors: np.ndarray):
+        """将ID从 first_id 开始的一批向量加入对应的倒排列表。"""
+        assignments = self._assign(vectors, self.centroids)
+        lists = self._lists
+        for offset, list_id in enumerate(assignments.tolist()):
+            lists[list_id].append(first_id + offset)
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int,
+               n_probe: int = None) -> List[Tuple[float, int]]:
+        """
+        返回近似的前 k 条
+
+        Args:
+            vectors: 全部已存储向量，第 i 行对应记忆ID i
+            query: (dim,) 查询向量
+            k: 返回数量上限
+            n_probe: 本次查询扫描的聚类数，默认取 n_probe 属性
+
+        Returns:
+            List[Tuple[float, int]]: (相似度, 记忆ID) 列表，按相似度降序
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(centroid_scores, self.n_lists - n_probe)[-n_probe:]
+        ids = np.concatenate([np.frombuffer(self._lists[i], dtype=np.int64) for i in probes])
+        if len(ids) == 0:
+            return []
+        return _top_k(vectors[ids] @ query, k, ids)
+
+    def clear(self):
+        """清空倒排列表，保留聚类中心。"""
+        self._lists = [array("q") for _ in range(self.n_lists)]
+
+
+class VectorStore:
+    """
+    连续存储的向量矩阵
+
+    第 i 行对应记忆ID i。容量不足时按倍数扩容，摊还后每次添加为 O(dim)。
+    向量数首次达到 ann_threshold 时，在当前数据上训练一次 IVF 索引，
+    此后的新增向量增量加入索引，查询默认走近似检索。
+
+    Args:
+        dim: 向量维度
+        initial_capacity: 初始容量
+        ann_threshold: 构建近似索引的向量数阈值，为 None 时始终精确检索
+        n_lists: IVF 聚类数，默认取构建时向量数的平方根
+        n_probe: IVF 查询时扫描的聚类数
+        train_size: 训练 k-means 的最大样本数
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 1024, ann_threshold: int = None,
+                 n_lists: int = None, n_probe: int = 8, train_size: int = 65536):
+        self.dim = dim
+        self._matrix = np.empty((initial_capacity, dim), dtype=np.float32)
+        self._size = 0
+        self.ann_threshold = ann_threshold
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.ivf = None
+
+    def _reserve(self, capacity: int):
+        """保证矩阵至少能容纳 capacity 行。"""
+        if capacity <= len(self._matrix):
+            return
+        new_capacity = max(capacity, 2 * len(self._matrix))
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add(self, vectors: np.ndarray):
+        """追加一批向量，形状为 (n, dim)。"""
+        vectors = np.atleast_2d(vectors)
+        start = self._size
+        end = start + len(vectors)
+        self._reserve(end)
+        self._matrix[start:end] = vectors
+        self._size = end
+
+        if self.ivf is not None:
+            self.ivf.add(start, vectors)
+        elif self.ann_threshold is not None and end >= self.ann_threshold:
+            self.build_ann()
+
+    def build_ann(self):
+        """在当前全部向量上训练 IVF 索引并分配已有向量。"""
+        vectors = self.vectors
+        n_lists = self.n_lists or max(1, int(math.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample_ids = rng.choice(len(vectors), min(self.train_size, len(vectors)), replace=False)
+        ivf = IVFIndex(n_lists, n_probe=self.n_probe)
+        ivf.train(vectors[np.sort(sample_ids)])
+        ivf.add(0, vectors)
+        self.ivf = ivf
+
+    def clear(self):
+        """清空所有向量与近似索引，保留已分配的容量。"""
+        self._size = 0
+        self.ivf = None
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """返回已存储向量的视图。"""
+        return self._matrix[:self._size]
+
+    def search(self, query: np.ndarray, k: int, exact: bool = False,
+               n_probe: int = None) -> List[Tuple[float, int]]:
+        """
+        返回与查询向量内积最大的前 k 条
+
+        Args:
+            query: (dim,) 查询向量
+            k: 返回数量上限
+            exact: 为 True 时忽略近似索引做暴力检索
+            n_probe: 近似检索时扫描的聚类数
+
+        Returns:
+            List[Tuple[float, int]]: (相似度, 记忆ID) 列表，按相似度降序
+        """
+        if self._size == 0 or k <= 0:
+            return []
+        if self.ivf is not None and not exact:
+            return self.ivf.search(self.vectors, query, k, n_probe)
+        scores = self.vectors @ query
+        return _top_k(scores, k)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def _top_k(scores: np.ndarray, k: int, ids: np.ndarray = None) -> List[Tuple[float, int]]:
+    """用 argpartition 从得分数组中取前 k 条并排序，ids 为空时以下标作为记忆ID。"""
+    if k < len(scores):
+        part = np.argpartition(scores, len(scores) - k)[-k:]
+    else:
+        part = np.arange(len(scores))
+    order = part[np.argsort(-scores[part], kind="stable")]
+    if ids is not None:
+        return [(float(scores[i]), int(ids[i])) for i in order]
+    return [(float(scores[i]), int(i)) for i in order]
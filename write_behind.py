@@ -0,0 +1,520 @@
+"""
+后台批量写入队列模块
+
+功能：
+- WriteBehindQueue：有界的进程内写入队列，调用方 put 后立即返回，
+  后台线程把积压的写入合并成批，凑满 max_batch 条或最早一条等待超过 flush_interval 秒时写出。
+- pending() 返回尚未确认写入的条目（含正在写出的一批），供读取时合并，保证读到自己的写入。
+- 写出失败时按带抖动的指数退避重试，超过 max_attempts 次后丢弃该批并记录错误；
+  write_batch 抛出 BatchWriteError 时只重试其中可安全重试的条目，
+  可能已被服务器处理的条目（如读取超时）不重试，避免重复写入。
+- 因熔断被拒绝的条目留在队列中，等到冷却结束再写出，不计入尝试次数。
+- flush() 等待当前积压全部写出；close() 写完剩余条目后停止后台线程，可注册到 atexit。
+- IngestionQueue：有界队列加固定数量的工作线程，逐条执行耗时的写入（如 Mem0 的事实抽取），
+  提交时立即返回凭据（IngestTicket）以查询状态；队列满时提交方阻塞等待（背压），
+  统计队列深度、积压时长与完成/失败数量。
+- merge_pending：把尚未写出、且与查询匹配的记忆合并到远程搜索结果中，保证读到自己的写入。
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from circuit_breaker import CircuitOpenError, backoff_delay
+
+
+class BatchWriteError(Exception):
+    """
+    一批条目部分写出失败
+
+    Args:
+        message: 错误信息
+        retry: 确定未写入、可以重试的条目
+        uncertain: 可能已被服务器处理的条目，重试可能导致重复写入
+        deferred: 因熔断被拒绝、未发出请求的条目，重试不计入尝试次数
+        retry_in: 熔断器距重新探测的秒数，在此之前重试没有意义
+    """
+
+    def __init__(self, message: str, retry: List[Any], uncertain: List[Any] = (),
+                 deferred: List[Any] = (), retry_in: float = 0.0):
+        super().__init__(message)
+        self.retry = list(retry)
+        self.uncertain = list(uncertain)
+        self.deferred = list(deferred)
+        self.retry_in = retry_in
+
+
+class WriteBehindQueue:
+    """
+    后台批量写入队列
+
+    Args:
+        write_batch: 写出一批条目的函数，抛出异常视为失败
+        max_batch: 每批最多条目数
+        flush_interval: 条目最长等待秒数，到时即使未凑满也写出
+        max_pending: 队列容量（不含正在写出的一批），满时 put 返回 False
+        max_attempts: 每批最多尝试次数
+        name: 后台线程名称，用于日志
+    """
+
+    def __init__(self, write_batch: Callable[[List[Any]], None], max_batch: int = 16,
+                 flush_interval: float = 0.5, max_pending: int = 1000, max_attempts: int = 3,
+                 name: str = "write-behind"):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.name = name
+        # (入队时间, 条目)
+        self._items: deque = deque()
+        self._inflight: List[Any] = []
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._cond = threading.Condition()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.uncertain = 0
+        self.rejected = 0
+
+    def put(self, item: Any) -> bool:
+        """
+        加入一个待写条目
+
+        Returns:
+            bool: 是否已入队；队列已满或已关闭时返回 False，由调用方同步写入
+        """
+        with self._cond:
+            if self._closed or len(self._items) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._items.append((time.monotonic(), item))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            # 队列由空变为非空时唤醒后台线程开始计时，凑满一批时唤醒其立即写出
+            if len(self._items) == 1 or len(self._items) >= self.max_batch:
+                self._cond.notify_all()
+        return True
+
+    def pending(self) -> List[Any]:
+        """返回尚未确认写入的条目，按入队顺序。"""
+        with self._cond:
+            return list(self._inflight) + [item for _, item in self._items]
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items) + len(self._inflight)
+
+    def _next_batch(self) -> Optional[List[Any]]:
+        """等待下一批可写出的条目，队列关闭且为空时返回 None。"""
+        with self._cond:
+            while True:
+                if self._items:
+                    wait = self._items[0][0] + self.flush_interval - time.monotonic()
+                    if (len(self._items) >= self.max_batch or wait <= 0
+                            or self._flush_requested or self._closed):
+                        break
+                    self._cond.wait(wait)
+                elif self._closed:
+                    return None
+                else:
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+            count = min(self.max_batch, len(self._items))
+            self._inflight = [self._items.popleft()[1] for _ in range(count)]
+            return self._inflight
+
+    def _write(self, batch: List[Any]):
+        """
+        写出一批，失败时重试确定未写入的条目
+
+        每个条目最多失败 max_attempts 次；因熔断被拒绝的条目不计入次数，
+        等到熔断器冷却结束后重试，直到写出、失败次数用尽或结果不确定。
+
+        Returns:
+            tuple: (已写出, 丢弃, 结果不确定) 的条数
+        """
+        written = dropped = uncertain = 0
+        # id(条目) → 失败次数；条目在写完之前一直被 batch 引用，id 不会被复用
+        failures: Dict[int, int] = {}
+        while True:
+            try:
+                self.write_batch(batch)
+                return written + len(batch), dropped, uncertain
+            except Exception as e:
+                retry, deferred, retry_in = batch, [], 0.0
+                if isinstance(e, CircuitOpenError):
+                    retry, deferred, retry_in = [], batch, e.retry_in
+                elif isinstance(e, BatchWriteError):
+                    retry, deferred, retry_in = e.retry, e.deferred, e.retry_in
+                    uncertain += len(e.uncertain)
+                    written += len(batch) - len(retry) - len(deferred) - len(e.uncertain)
+                    if e.uncertain:
+                        logging.error(f"{self.name} 有 {len(e.uncertain)} 条可能已写入，"
+                                      f"为避免重复写入不再重试: {e}")
+                for item in retry:
+                    failures[id(item)] = failures.get(id(item), 0) + 1
+                exhausted = [item for item in retry if failures[id(item)] >= self.max_attempts]
+                if exhausted:
+                    logging.error(f"{self.name} 写入失败 {self.max_attempts} 次，"
+                                  f"丢弃 {len(exhausted)} 条: {e}")
+                    dropped += len(exhausted)
+                    retry = [item for item in retry if failures[id(item)] < self.max_attempts]
+                if not retry and not deferred:
+                    return written, dropped, uncertain
+                logging.warning(f"{self.name} 写入失败，稍后重试 {len(retry) + len(deferred)} 条: {e}")
+                keep = {id(item) for item in retry + deferred}
+                batch = [item for item in batch if id(item) in keep]
+                with self._cond:
+                    self._inflight = list(batch)
+                attempt = max(failures.get(id(item), 0) for item in batch)
+                # 熔断中的服务在冷却结束前重试没有意义
+                time.sleep(max(backoff_delay(max(attempt, 1), base=0.2), retry_in))
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            written, dropped, uncertain = self._write(batch)
+            with self._cond:
+                self.written += written
+                self.dropped += dropped
+                self.uncertain += uncertain
+                self.batches += 1
+                self._inflight = []
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        立即写出积压的条目并等待完成
+
+        Returns:
+            bool: 是否在 timeout 秒内全部写出（或丢弃）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._items:
+                self._flush_requested = True
+                self._cond.notify_all()
+            while self._items or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        写完剩余条目后停止后台线程，之后的 put 返回 False
+
+        Returns:
+            bool: 是否在 timeout 秒内全部写出
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.warning(f"{self.name} 关闭超时，仍有 {len(self)} 条未写出")
+            return False
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """
+        返回队列统计
+
+        Returns:
+            Dict: pending（未确认条数）、written、batches、dropped（重试后仍失败而丢弃的条数）、
+                uncertain（可能已被服务器处理、因而未重试的条数）、rejected（队列满或已关闭时被拒绝的次数）
+        """
+        with self._cond:
+            return {
+                "pending": len(self._items) + len(self._inflight),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "uncertain": self.uncertain,
+                "rejected": self.rejected,
+            }
+
+
+def merge_pending(response: Any, pending: List[str], limit: Optional[int] = None,
+                  query: Optional[str] = None) -> Any:
+    """
+    将尚未写出的记忆合并到远程返回的结果中
+
+    远程结果保持原有顺序与名次，未写出的记忆排在其后，只占用 limit 内剩余的位置；
+    给定 query 时只合并与查询匹配的记忆，匹配规则与本地记忆的关键词搜索相同（含同义词扩展）。
+
+    Args:
+        response: 远程结果，{"results": [...]} 或列表；其他形式原样返回
+        pending: 未写出的记忆文本，最新的在前
+        limit: 合并后的最大数量
+        query: 搜索查询，为 None 时合并全部未写出的记忆（如列出记忆）
+
+    Returns:
+        与 response 形式相同的新对象，未写出的记忆标记 "pending": True，不修改 response
+    """
+    if query is not None and pending:
+        from memory_manager import expand_keywords
+        from memory_synonyms import keyword_matcher
+        matcher = keyword_matcher(expand_keywords(query))
+        pending = [text for text in pending if matcher.matches(text.lower())]
+    if not pending:
+        return response
+    results = response.get("results") if isinstance(response, dict) else response
+    if not isinstance(results, list):
+        return response
+    seen = {item.get("memory") for item in results if isinstance(item, dict)}
+    merged = list(results) + [{"memory": text, "pending": True}
+                              for text in dict.fromkeys(pending) if text not in seen]
+    if limit is not None:
+        merged = merged[:limit]
+    if isinstance(response, dict):
+        return {**response, "results": merged}
+    return merged
+
+
+class IngestTicket:
+    """
+    一次后台写入的凭据
+
+    status 依次为 queued → running → done / failed，排队中被取消时为 cancelled；wait() 等待完成。
+    """
+
+    __slots__ = ("id", "item", "status", "submitted_at", "started_at", "finished_at",
+                 "result", "error", "_done")
+
+    def __init__(self, ticket_id: int, item: Any):
+        self.id = ticket_id
+        self.item = item
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待写入完成，返回是否已完成（成功或失败）。"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns:
+            Dict: ticket、status、queued_seconds（排队时长）、run_seconds（执行时长）、error
+        """
+        now = time.time()
+        started = self.started_at or now
+        return {
+            "ticket": self.id,
+            "status": self.status,
+            "queued_seconds": started - self.submitted_at,
+            "run_seconds": (self.finished_at or now) - started if self.started_at else 0.0,
+            "error": self.error,
+        }
+
+
+class IngestionQueue:
+    """
+    后台逐条写入队列
+
+    Args:
+        process: 写入一个条目的函数，返回值记入凭据的 result，抛出异常视为失败
+        workers: 工作线程数
+        max_pending: 队列容量，满时 submit 阻塞
+        keep_tickets: 保留最近多少个已完成的凭据供查询
+        name: 工作线程名称前缀，用于日志
+    """
+
+    def __init__(self, process: Callable[[Any], Any], workers: int = 2, max_pending: int = 100,
+                 keep_tickets: int = 1000, name: str = "ingest"):
+        self.process = process
+        self.workers = workers
+        self.keep_tickets = keep_tickets
+        self.name = name
+        self._queue: "queue.Queue[Optional[IngestTicket]]" = queue.Queue(max_pending)
+        self._tickets: "OrderedDict[int, IngestTicket]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.last_lag = 0.0
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> IngestTicket:
+        """
+        提交一个条目
+
+        Args:
+            item: 条目
+            timeout: 队列满时最多等待的秒数，None 为一直等待
+
+        Returns:
+            IngestTicket: 凭据
+
+        Raises:
+            queue.Full: 等待 timeout 秒后队列仍满
+            RuntimeError: 队列已关闭
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} 已关闭")
+            ticket = IngestTicket(next(self._ids), item)
+            self._tickets[ticket.id] = ticket
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f"{self.name}-{index}",
+                                              daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        try:
+            self._queue.put(ticket, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                del self._tickets[ticket.id]
+            raise
+        return ticket
+
+    def get(self, ticket_id: int) -> Optional[IngestTicket]:
+        """按编号返回凭据，已被清理或不存在时返回 None。"""
+        with self._lock:
+            return self._tickets.get(ticket_id)
+
+    def pending(self) -> List[Any]:
+        """返回排队中和执行中的条目，按提交顺序。"""
+        with self._lock:
+            return [ticket.item for ticket in self._tickets.values()
+                    if ticket.status in ("queued", "running")]
+
+    def cancel_queued(self, match: Optional[Callable[[Any], bool]] = None) -> int:
+        """
+        取消尚未开始执行的条目（例如删除全部记忆之前），正在执行的条目不受影响
+
+        Args:
+            match: 只取消 match(条目) 为真的条目，默认取消全部
+
+        Returns:
+            int: 取消的条目数
+        """
+        with self._lock:
+            queued = [ticket for ticket in self._tickets.values()
+                      if ticket.status == "queued" and (match is None or match(ticket.item))]
+            for ticket in queued:
+                ticket.status = "cancelled"
+                ticket.finished_at = time.time()
+                ticket._done.set()
+            self.cancelled += len(queued)
+            self._trim()
+        return len(queued)
+
+    def _run(self):
+        while True:
+            ticket = self._queue.get()
+            if ticket is None:
+                return
+            with self._lock:
+                if ticket.status == "cancelled":
+                    self._queue.task_done()
+                    continue
+                ticket.status = "running"
+                ticket.started_at = time.time()
+                self.running += 1
+                self.last_lag = ticket.started_at - ticket.submitted_at
+            try:
+                result, error = self.process(ticket.item), None
+            except Exception as e:
+                result, error = None, str(e)
+                logging.error(f"{self.name} 写入失败 (凭据 {ticket.id}): {e}")
+            with self._lock:
+                ticket.finished_at = time.time()
+                ticket.result, ticket.error = result, error
+                ticket.status = "failed" if error is not None else "done"
+                self.running -= 1
+                if error is not None:
+                    self.failed += 1
+                else:
+                    self.done += 1
+                self._trim()
+            ticket._done.set()
+            self._queue.task_done()
+
+    def _trim(self):
+        """只保留最近 keep_tickets 个已完成的凭据。"""
+        finished = [ticket_id for ticket_id, ticket in self._tickets.items()
+                    if ticket.status in ("done", "failed", "cancelled")]
+        for ticket_id in finished[:max(0, len(finished) - self.keep_tickets)]:
+            del self._tickets[ticket_id]
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已提交的条目全部完成
+
+        Returns:
+            bool: 是否在 timeout 秒内完成
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            tickets = [ticket for ticket in self._tickets.values()
+                       if ticket.status in ("queued", "running")]
+        for ticket in tickets:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not ticket.wait(remaining):
+                return False
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        完成已提交的条目后停止工作线程，之后的 submit 抛出 RuntimeError
+
+        Returns:
+            bool: 是否在 timeout 秒内完成
+        """
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        finished = self.drain(timeout)
+        if not finished:
+            logging.warning(f"{self.name} 关闭超时，仍有 {len(self.pending())} 条未完成")
+            return False
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """
+        返回队列统计
+
+        Returns:
+            Dict: queued（排队数）、running（执行中）、done、failed、cancelled、
+                lag_seconds（最早一条排队条目已等待的秒数）、last_lag_seconds（最近开始执行的条目的排队时长）
+        """
+        now = time.time()
+        with self._lock:
+            queued = [ticket for ticket in self._tickets.values() if ticket.status == "queued"]
+            return {
+                "queued": len(queued),
+                "running": self.running,
+                "done": self.done,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "lag_seconds": now - queued[0].submitted_at if queued else 0.0,
+                "last_lag_seconds": self.last_lag,
+            }